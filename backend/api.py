@@ -1,24 +1,42 @@
 from __future__ import annotations
 
 import io
-from typing import Literal
+import time
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Literal, Optional
 
 import pandas as pd
-from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi import FastAPI, File, HTTPException, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
+from starlette.routing import Match
 
-from backend import core
+from backend import core, metrics
 from backend.config import get_settings
-from backend.services import data_layer, ocr, reconciliation, reporting
+from backend.response_cache import ResponseCache, etag_matches
+from backend.services import data_layer, jobs, ocr, ocr_cache, parallel, reporting
 
 settings = get_settings()
+response_cache = ResponseCache(settings.response_cache_bytes)
+job_runner = jobs.JobRunner(settings.max_running_jobs)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    job_runner.shutdown()
+    parallel.shutdown_pool()
+
 
 app = FastAPI(
     title="Mini-TUG backend",
     version="1.0.0",
     description="Backend API herbouwd uit de Streamlit app",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -30,14 +48,89 @@ app.add_middleware(
 )
 
 
+def route_template(scope) -> str:
+    """The path template of the route ``scope`` goes to, e.g. ``/jobs/{job_id}``.
+
+    Used as the metrics label, so ids in paths do not make a series each.
+    """
+    partial = None
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path
+    return partial or "unmatched"
+
+
+class MetricsMiddleware:
+    """Per route: latency to the last body byte, body sizes, status codes and
+    requests in flight (see ``backend.metrics``).
+
+    Plain ASGI rather than ``BaseHTTPMiddleware`` so streamed responses are
+    timed and measured to their end without being buffered.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        labels = {"method": scope["method"], "route": route_template(scope)}
+        sizes = {"request": 0, "response": 0}
+        status = 500
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        metrics.HTTP_IN_FLIGHT.inc(**labels)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            metrics.HTTP_IN_FLIGHT.dec(**labels)
+            metrics.HTTP_LATENCY.observe(time.perf_counter() - started, **labels)
+            metrics.HTTP_REQUESTS.inc(status=status, **labels)
+            metrics.HTTP_REQUEST_SIZE.observe(sizes["request"], **labels)
+            metrics.HTTP_RESPONSE_SIZE.observe(sizes["response"], **labels)
+
+
+# Added last, so it is the outermost layer and also sees CORS preflights.
+app.add_middleware(MetricsMiddleware)
+
+
 @app.get("/healthz")
 def healthcheck():
     return {"status": "ok", "has_data": data_layer.db_has_data()}
 
 
+@app.get("/metrics")
+def prometheus_metrics():
+    metrics.DATA_VERSION.set(data_layer.data_version())
+    metrics.RESPONSE_CACHE_BYTES.set(response_cache.size_bytes)
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.get("/kpi")
-def kpi():
-    return core.get_kpis()
+def kpi(
+    entity: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+):
+    return core.get_kpis(entity, date_from, date_to)
 
 
 @app.post("/data/sample")
@@ -56,19 +149,66 @@ def reset():
 async def upload_csv(
     dataset: Literal["invoices", "bank_tx"], file: UploadFile = File(...)
 ):
-    content = await file.read()
     try:
-        rows = data_layer.import_csv(dataset, content)
+        stats = await run_in_threadpool(data_layer.import_csv_stream, dataset, file.file)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
-    return {"dataset": dataset, "rows": rows}
+    return {"dataset": dataset, **stats}
 
 
 @app.get("/datasets/{dataset}")
-def get_dataset(dataset: Literal["invoices", "bank_tx"]):
-    inv, bank = data_layer.load_data()
-    df = inv if dataset == "invoices" else bank
-    return {"dataset": dataset, "rows": df.to_dict("records")}
+def get_dataset(
+    dataset: Literal["invoices", "bank_tx"],
+    limit: int = Query(1000, ge=1, le=10_000),
+    cursor: Optional[str] = None,
+    columns: Optional[str] = None,
+    entity: Optional[str] = None,
+    month: Optional[str] = None,
+    status: Optional[str] = None,
+    matched: Optional[bool] = None,
+    order: Literal["row_id", "date"] = "row_id",
+    format: Literal["json", "ndjson", "arrow"] = "json",
+):
+    query = data_layer.DatasetQuery(
+        dataset=dataset,
+        columns=[c.strip() for c in columns.split(",") if c.strip()] if columns else None,
+        entity=entity,
+        month=month,
+        status=status,
+        matched=matched,
+        order=order,
+    )
+    try:
+        if format == "json":
+            page, next_cursor = data_layer.query_page(query, cursor, limit)
+            return {
+                "dataset": dataset,
+                "rows": data_layer.page_records(page),
+                "next_cursor": next_cursor,
+            }
+        # Streams run to the end of the result; validate the query up front.
+        data_layer.query_page(query, cursor, 1)
+        pages = data_layer.iter_pages(query, cursor)
+        if format == "ndjson":
+            return StreamingResponse(
+                data_layer.pages_to_ndjson(pages), media_type="application/x-ndjson"
+            )
+        return StreamingResponse(
+            data_layer.pages_to_arrow(query, pages),
+            media_type="application/vnd.apache.arrow.stream",
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except RuntimeError as exc:
+        raise HTTPException(status_code=501, detail=str(exc))
+
+
+@app.get("/invoices/{row_id}/document")
+def get_invoice_document(row_id: int):
+    document = data_layer.get_invoice_document(row_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="No OCR document for this invoice")
+    return document
 
 
 class ReconcileRequest(BaseModel):
@@ -78,70 +218,168 @@ class ReconcileRequest(BaseModel):
     psp_fee_pct: float = 4.0
     only_psp_names: bool = True
     persist: bool = False
+    max_batch_size: int = 50
+    batch_search_budget: int = 2000
+    incremental: bool = False
+    # Split by entity and run the rules on a process pool; same results.
+    parallel: bool = False
+    # Run in a worker process and answer with a job to poll (GET /jobs/{id}).
+    background: bool = True
+    # Add each stage's memory peak to the stats in the summary (slower).
+    profile_memory: bool = False
+    # "optimal": R1/R2 take a min-cost one-to-one assignment of their
+    # candidates; the stats report the extra matches over greedy.
+    assignment: Literal["greedy", "optimal"] = "greedy"
 
 
 @app.post("/reconcile")
-def run_reconcile(payload: ReconcileRequest):
-    inv, bank = data_layer.load_data()
-    settings_obj = reconciliation.ReconSettings(
-        date_window_days=payload.date_window_days,
-        amount_tolerance=payload.amount_tolerance,
-        psp_fee_abs=payload.psp_fee_abs,
-        psp_fee_pct=payload.psp_fee_pct / 100.0,
-        only_psp_names=payload.only_psp_names,
-        persist=payload.persist,
-    )
-    result = reconciliation.run_reconciliation(inv, bank, settings_obj)
-    if payload.persist:
-        data_layer.persist_frames(result.invoices, result.bank)
-    summary = result.summary.__dict__
-    summary["recent"] = result.summary.recent
-    return {
-        "summary": summary,
-        "invoices": len(result.invoices),
-        "bank": len(result.bank),
-    }
+def run_reconcile(payload: ReconcileRequest, response: Response):
+    params = payload.model_dump()
+    try:
+        if not payload.background:
+            if not payload.persist:
+                return jobs.run_inline(params)
+            with job_runner.persist_slot():
+                return jobs.run_inline(params)
+        job = job_runner.submit(params)
+    except jobs.JobConflict as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    response.status_code = 202
+    return job.to_dict()
+
+
+class SweepRequest(BaseModel):
+    # Grid axes; every combination is one point.
+    date_window_days: list[int] = [3]
+    amount_tolerance: list[float] = [0.5]
+    psp_fee_abs: list[float] = [50.0]
+    psp_fee_pct: list[float] = [4.0]
+    only_psp_names: bool = True
+    # 0 leaves R3 out: it is rerun for every point and dominates the time.
+    max_batch_size: int = 50
+    batch_search_budget: int = 2000
+    assignment: Literal["greedy", "optimal"] = "greedy"
+    # Split by entity and sweep on a process pool.
+    parallel: bool = False
+
+
+@app.post("/reconcile/sweep")
+def reconcile_sweep(payload: SweepRequest):
+    try:
+        return jobs.run_sweep(payload.model_dump())
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@app.get("/jobs")
+def list_jobs():
+    return [job.to_dict() for job in job_runner.list()]
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.to_dict()
+
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    job = job_runner.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.to_dict()
 
 
 @app.post("/ocr/scan")
-async def scan_invoices(files: list[UploadFile] = File(...)):
+async def scan_invoices(
+    files: list[UploadFile] = File(...), skip_duplicates: bool = False
+):
     if not files:
         raise HTTPException(status_code=400, detail="Upload at least one file")
     payload = []
     for f in files:
         content = await f.read()
         payload.append((f.filename, content))
-    df = ocr.process_files(payload)
+    results = await run_in_threadpool(ocr.scan_files, payload)
+    report = [
+        {
+            "filename": r.filename,
+            "rows": len(r.rows),
+            "error": r.error,
+            "attempts": r.attempts,
+            "cached": r.cached,
+            "duplicate": r.duplicate,
+        }
+        for r in results
+    ]
+    df = ocr.results_to_frame(results, skip_duplicates=skip_duplicates)
     if df.empty:
-        raise HTTPException(status_code=500, detail="Document AI returned no data")
-    rows = data_layer.append_invoices(df)
-    return {"rows_appended": rows}
+        if skip_duplicates and any(r.duplicate and r.rows for r in results):
+            return {"rows_appended": 0, "files": report}
+        raise HTTPException(
+            status_code=500, detail={"message": "Document AI returned no data", "files": report}
+        )
+    rows = await run_in_threadpool(data_layer.append_invoices, df)
+    return {"rows_appended": rows, "files": report}
+
+
+@app.get("/ocr/cache")
+def ocr_cache_stats():
+    cache = ocr_cache.get_ocr_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
+
+
+def cached_json(request: Request, key: tuple, build) -> Response:
+    """Serve ``build()`` as JSON from the response cache, with ETag / 304.
+
+    Entries are keyed by the data version as well, so any write to the
+    datasets makes the next request recompute.
+    """
+    entry = response_cache.get_or_build(
+        key,
+        data_layer.data_version(),
+        lambda: JSONResponse(jsonable_encoder(build())).body,
+    )
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
 
 
 @app.get("/reporting/overview")
-def reporting_overview(entity: str = "ALL"):
-    inv, bank = data_layer.load_data()
-    overview = reporting.build_overview(inv, bank, entity)
-    return overview
+def reporting_overview(request: Request, entity: str = "ALL"):
+    def build():
+        aggs = data_layer.load_monthly_aggregates()
+        return reporting.build_overview_from_aggregates(aggs, entity)
+
+    return cached_json(request, ("overview", entity), build)
 
 
 @app.get("/reporting/exceptions")
-def reporting_exceptions():
-    inv, bank = data_layer.load_data()
-    return reporting.build_exceptions(inv, bank)
+def reporting_exceptions(request: Request):
+    def build():
+        inv, bank = data_layer.load_data()
+        return reporting.build_exceptions(inv, bank)
+
+    return cached_json(request, ("exceptions",), build)
 
 
 @app.get("/reporting/journal")
-def reporting_journal():
-    inv, bank = data_layer.load_data()
-    journal_df = reporting.build_journal(inv, bank)
-    return {"rows": journal_df.to_dict("records")}
+def reporting_journal(request: Request):
+    def build():
+        inv, bank = data_layer.load_data()
+        journal_df = reporting.build_journal(inv, bank)
+        return {"rows": journal_df.to_dict("records")}
+
+    return cached_json(request, ("journal",), build)
 
 
 @app.get("/reports/board-pack")
 def download_board_pack():
     inv, bank = data_layer.load_data()
-    blob, size = reporting.board_pack(inv, bank)
+    blob, size = reporting.board_pack(inv, bank, data_layer.load_monthly_aggregates())
     if size == 0:
         raise HTTPException(status_code=404, detail="No data to build board pack")
     headers = {
@@ -0,0 +1,8 @@
+"""
+Benchmarks for the Mini-TUG backend, run as modules from the repo root.
+
+Modules:
+    generator       - seeded synthetic invoices and bank lines (10k to 10M rows)
+    run             - time/memory profile of services and endpoints, baseline check
+    storage         - load_data on the SQLite and Parquet storage backends
+"""
@@ -0,0 +1,211 @@
+"""Seeded synthetic invoices and bank transactions for the benchmarks.
+
+Every chunk is drawn from its own child of the seed, so the same
+``(rows, seed, chunk_rows)`` always gives the same data, and sizes up to
+millions of rows can be streamed to CSV without holding them in memory.
+
+A chunk has ``rows`` invoices over one year, spread over the entities with
+a long tail (a few large entities, many small ones), about 20% expenses.
+Revenue invoices are settled as follows:
+
+- ~55% by a bank transfer of the exact amount, 0-3 days later
+- ~15% by a PSP payout net of a fee (Stripe, Adyen, Mollie, PayPal)
+- ~15% inside a PSP batch payout of 2-8 invoices, net of a fee
+- the rest not at all (open receivables)
+
+Noise on the bank side: transfers a few cents off, late payments outside
+the matching window, unrelated inflows, outflows for the expenses and bank
+lines without a partner.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+
+START = pd.Timestamp("2024-01-01")
+DAYS = 365
+ENTITY_COUNTRIES = ("NL", "BE", "DE", "FR", "UK", "ES", "IT", "AT", "DK", "SE", "PL", "IE")
+PSPS = ("Stripe payout", "Adyen settlement", "Mollie payout", "PayPal transfer")
+VAT_RATE = 0.21
+
+
+def entity_names(count: int) -> list[str]:
+    names = [f"TUG_{c}" for c in ENTITY_COUNTRIES[:count]]
+    names += [f"TUG_X{i:03d}" for i in range(count - len(names))]
+    return names
+
+
+def generate(
+    rows: int, seed: int = 0, entities: int = 12, chunk_rows: int = 500_000
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """All chunks of ``iter_chunks`` as one invoice and one bank frame."""
+    chunks = list(iter_chunks(rows, seed, entities, chunk_rows))
+    inv = pd.concat([c[0] for c in chunks], ignore_index=True)
+    bank = pd.concat([c[1] for c in chunks], ignore_index=True)
+    return inv, bank
+
+
+def iter_chunks(
+    rows: int, seed: int = 0, entities: int = 12, chunk_rows: int = 500_000
+) -> Iterator[Tuple[pd.DataFrame, pd.DataFrame]]:
+    """(invoices, bank) chunks adding up to ``rows`` invoices."""
+    seeds = np.random.SeedSequence(seed).spawn(-(-rows // chunk_rows) or 1)
+    offset = 0
+    for child in seeds:
+        size = min(chunk_rows, rows - offset)
+        if size <= 0:
+            break
+        yield _chunk(np.random.default_rng(child), size, offset, entities)
+        offset += size
+
+
+def write_csv(
+    directory: Path, rows: int, seed: int = 0, entities: int = 12, chunk_rows: int = 500_000
+) -> Tuple[Path, Path]:
+    """Stream ``invoices.csv`` and ``bank_tx.csv`` into ``directory``; returns their paths."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = directory / "invoices.csv", directory / "bank_tx.csv"
+    for i, (inv, bank) in enumerate(iter_chunks(rows, seed, entities, chunk_rows)):
+        for path, df in zip(paths, (inv, bank)):
+            df.to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+    return paths
+
+
+def _chunk(rng: np.random.Generator, n: int, offset: int, entities: int):
+    names = np.array(entity_names(entities))
+    weights = 1.0 / np.arange(1, entities + 1) ** 1.1
+    entity = rng.choice(names, n, p=weights / weights.sum())
+    day = rng.integers(0, DAYS, n)
+    amount = np.round(np.clip(rng.lognormal(5.3, 1.1, n), 1, 250_000), 2)
+    revenue = rng.random(n) < 0.8
+    net = np.round(amount / (1 + VAT_RATE), 2)
+    inv = pd.DataFrame(
+        {
+            "date": START + pd.to_timedelta(day, unit="D"),
+            "entity": entity,
+            "amount": amount,
+            "type": np.where(revenue, "revenue", "expense"),
+            "invoice_no": [f"INV-{offset + i:09d}" for i in range(n)],
+            "currency": np.where(np.char.endswith(entity.astype(str), "_UK"), "GBP", "EUR"),
+            "net_amount": net,
+            "vat_amount": np.round(amount - net, 2),
+        }
+    )
+
+    mode = rng.random(n)
+    direct = revenue & (mode < 0.55)
+    psp_single = revenue & (mode >= 0.55) & (mode < 0.70)
+    batched = revenue & (mode >= 0.70) & (mode < 0.85)
+    lines = [
+        _direct_transfers(rng, inv, direct, day),
+        _psp_payouts(rng, inv, psp_single, day),
+        _batch_payouts(rng, inv, batched, day),
+        _expense_payments(rng, inv, ~revenue, day),
+        _unrelated_inflows(rng, names, n // 20),
+    ]
+    bank = pd.concat(lines, ignore_index=True)
+    bank.loc[rng.random(len(bank)) < 0.01, "partner"] = None
+    bank = bank.sort_values("date", kind="stable", ignore_index=True)
+    bank["memo"] = np.where(bank["partner"].isna(), "SEPA credit", "")
+    return inv, bank[["date", "entity", "amount", "direction", "partner", "memo"]]
+
+
+def _bank_lines(entity, day, amount, direction, partner) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "date": START + pd.to_timedelta(day, unit="D"),
+            "entity": entity,
+            "amount": np.round(amount, 2),
+            "direction": direction,
+            "partner": partner,
+        }
+    )
+
+
+def _direct_transfers(rng, inv, mask, day):
+    pos = np.flatnonzero(mask)
+    amount = inv["amount"].to_numpy()[pos].copy()
+    lag = rng.integers(0, 4, len(pos))
+    # 3% pay late (outside a 3-day window), 2% a few cents short or over.
+    lag[rng.random(len(pos)) < 0.03] += rng.integers(4, 20)
+    off = rng.random(len(pos)) < 0.02
+    amount[off] += rng.integers(-40, 41, off.sum()) / 100
+    partner = np.array([f"Customer {c:05d}" for c in rng.integers(0, 50_000, len(pos))])
+    return _bank_lines(inv["entity"].to_numpy()[pos], day[pos] + lag, amount, "in", partner)
+
+
+def _fee(rng, gross: np.ndarray) -> np.ndarray:
+    pct = rng.uniform(0.014, 0.029, len(gross))
+    return np.round(np.minimum(gross * pct + 0.25, 45.0), 2)
+
+
+def _psp_payouts(rng, inv, mask, day):
+    pos = np.flatnonzero(mask)
+    gross = inv["amount"].to_numpy()[pos]
+    partner = rng.choice(PSPS, len(pos))
+    return _bank_lines(
+        inv["entity"].to_numpy()[pos],
+        day[pos] + rng.integers(1, 3, len(pos)),
+        gross - _fee(rng, gross),
+        "in",
+        partner,
+    )
+
+
+def _batch_payouts(rng, inv, mask, day):
+    """One payout per run of 2-8 invoices of an entity and PSP settled within two days."""
+    pos = np.flatnonzero(mask)
+    if not len(pos):
+        return _bank_lines([], [], np.empty(0), "in", [])
+    frame = pd.DataFrame(
+        {
+            "entity": inv["entity"].to_numpy()[pos],
+            "psp": rng.choice(PSPS, len(pos)),
+            "bucket": day[pos] // 2,
+            "day": day[pos],
+            "amount": inv["amount"].to_numpy()[pos],
+        }
+    ).sort_values(["entity", "psp", "bucket", "day"], kind="stable")
+    groups = frame.groupby(["entity", "psp", "bucket"], sort=False)
+    rank = groups.cumcount().to_numpy()
+    size = rng.integers(2, 9, groups.ngroups)[groups.ngroup().to_numpy()]
+    # Each bucket is cut into payouts of its own size.
+    frame["payout"] = np.cumsum(rank % size == 0)
+    payouts = frame.groupby("payout", sort=False).agg(
+        entity=("entity", "first"), psp=("psp", "first"), day=("day", "max"), gross=("amount", "sum")
+    )
+    gross = payouts["gross"].to_numpy()
+    return _bank_lines(
+        payouts["entity"].to_numpy(),
+        payouts["day"].to_numpy() + 1,
+        gross - _fee(rng, gross),
+        "in",
+        payouts["psp"].to_numpy(),
+    )
+
+
+def _expense_payments(rng, inv, mask, day):
+    pos = np.flatnonzero(mask)
+    partner = np.array([f"Supplier {s:04d}" for s in rng.integers(0, 5_000, len(pos))])
+    return _bank_lines(
+        inv["entity"].to_numpy()[pos],
+        day[pos] + rng.integers(0, 30, len(pos)),
+        inv["amount"].to_numpy()[pos],
+        "out",
+        partner,
+    )
+
+
+def _unrelated_inflows(rng, names, n):
+    return _bank_lines(
+        rng.choice(names, n),
+        rng.integers(0, DAYS, n),
+        np.clip(rng.lognormal(5.0, 1.3, n), 1, 100_000),
+        "in",
+        np.array([f"Sender {s:05d}" for s in rng.integers(0, 50_000, n)]),
+    )
@@ -0,0 +1,340 @@
+"""Time and memory-profile the services and endpoints on synthetic data.
+
+    python -m backend.benchmarks.run --rows 10000 100000 --output results.json
+    python -m backend.benchmarks.run --rows 10000 100000 --save-baseline
+
+For every size the generated CSVs are imported into a scratch database and
+each case is run ``--repeat`` times for its timing (the median counts) and
+once more under ``tracemalloc`` for its peak of Python/numpy allocations.
+Results are compared with the stored baseline (``baseline.json`` next to
+this file) when it has the same sizes: a case regresses when it is slower or
+allocates more than the threshold allows, and the run then exits with 1.
+Baselines are machine specific, so none is checked in: record one with
+``--save-baseline`` on the machine that checks against it. It carries the
+hardware and interpreter it was taken on, and a comparison warns when
+they differ.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from backend.config import get_settings
+from backend.services import data_layer, reconciliation, reporting
+
+from . import generator
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+# Differences below these are noise, whatever the ratio.
+MIN_SECONDS = 0.005
+MIN_MB = 1.0
+
+
+@dataclass
+class Case:
+    name: str
+    fn: Callable[[], object]
+    # Runs before every timed call, outside the timing (e.g. dropping caches).
+    setup: Callable[[], None] | None = None
+
+
+def measure(case: Case, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        if case.setup is not None:
+            case.setup()
+        started = time.perf_counter()
+        case.fn()
+        times.append(time.perf_counter() - started)
+    if case.setup is not None:
+        case.setup()
+    tracemalloc.start()
+    try:
+        case.fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "seconds": round(statistics.median(times), 6),
+        "min_seconds": round(min(times), 6),
+        "max_seconds": round(max(times), 6),
+        "runs": repeat,
+        "peak_mb": round(peak / 2**20, 2),
+    }
+
+
+def build_cases(paths, with_endpoints: bool = True) -> list[Case]:
+    """The cases, in run order; they share the scratch database set up by ``run``."""
+    inv_csv, bank_csv = paths
+    cold = data_layer.bump_data_version
+    frames = {}
+
+    def import_both():
+        for name, path in (("invoices", inv_csv), ("bank_tx", bank_csv)):
+            with open(path, "rb") as fh:
+                data_layer.import_csv_stream(name, fh)
+
+    def frames_for(fn):
+        # Service cases run on the cached frames, as the endpoints do.
+        def call():
+            if "inv" not in frames:
+                frames["inv"], frames["bank"] = data_layer.load_data()
+            return fn(frames["inv"], frames["bank"])
+
+        return call
+
+    settings = reconciliation.ReconSettings()
+    cases = [
+        Case("data_layer.import_csv_stream", import_both),
+        Case("data_layer.load_data[cold]", data_layer.load_data, setup=cold),
+        Case("data_layer.load_data[cached]", data_layer.load_data),
+        Case("data_layer.load_monthly_aggregates", data_layer.load_monthly_aggregates),
+        Case(
+            "data_layer.kpi_totals[date range]",
+            lambda: data_layer.kpi_totals(None, date(2024, 3, 1), date(2024, 9, 30)),
+        ),
+        Case(
+            "reconciliation.run_reconciliation",
+            frames_for(lambda inv, bank: reconciliation.run_reconciliation(inv, bank, settings)),
+        ),
+        Case("reporting.build_overview", frames_for(reporting.build_overview)),
+        Case(
+            "reporting.build_overview_from_aggregates",
+            lambda: reporting.build_overview_from_aggregates(data_layer.load_monthly_aggregates()),
+        ),
+        Case("reporting.build_exceptions", frames_for(reporting.build_exceptions)),
+        Case("reporting.build_journal", frames_for(reporting.build_journal)),
+        Case("reporting.board_pack", frames_for(reporting.board_pack)),
+    ]
+    if with_endpoints:
+        cases += _endpoint_cases(cold)
+    return cases
+
+
+def _endpoint_cases(cold: Callable[[], None]) -> list[Case]:
+    from fastapi.testclient import TestClient
+
+    from backend import api
+
+    client = TestClient(api.app)
+
+    def call(method: str, url: str, **kwargs):
+        def request():
+            response = client.request(method, url, **kwargs)
+            response.raise_for_status()
+            return response
+
+        return request
+
+    # Cold: the data version is bumped first, so frame and response caches miss.
+    return [
+        Case(f"endpoint {method} {url}[cold]", call(method, url, **kwargs), setup=cold)
+        for method, url, kwargs in (
+            ("GET", "/kpi", {}),
+            ("GET", "/reporting/overview", {}),
+            ("GET", "/reporting/exceptions", {}),
+            ("GET", "/reporting/journal", {}),
+            ("GET", "/reports/board-pack", {}),
+            ("GET", "/datasets/invoices?limit=1000", {}),
+            ("POST", "/reconcile", {"json": {"background": False}}),
+        )
+    ]
+
+
+def run(
+    sizes: list[int],
+    seed: int = 0,
+    entities: int = 12,
+    repeat: int = 3,
+    only: str | None = None,
+    with_endpoints: bool = True,
+    log: Callable[[str], None] = print,
+) -> dict:
+    settings = get_settings()
+    saved_path = data_layer.DB_PATH
+    results = {"meta": _meta(seed, entities, repeat), "sizes": {}}
+    try:
+        for rows in sizes:
+            with tempfile.TemporaryDirectory() as tmp:
+                data_layer.DB_PATH = Path(tmp) / "bench.db"
+                paths = generator.write_csv(Path(tmp), rows, seed, entities)
+                bank_rows = sum(1 for _ in open(paths[1])) - 1
+                entry = {"bank_rows": bank_rows, "backend": settings.storage_backend, "cases": {}}
+                for case in build_cases(paths, with_endpoints):
+                    # The import fills the database every other case reads.
+                    if only and only not in case.name and not case.name.endswith("import_csv_stream"):
+                        continue
+                    entry["cases"][case.name] = stats = measure(case, repeat)
+                    log(f"{rows:>10} {case.name:<50} {stats['seconds']:>9.4f}s {stats['peak_mb']:>9.1f} MB")
+                results["sizes"][str(rows)] = entry
+    finally:
+        data_layer.DB_PATH = saved_path
+        data_layer.bump_data_version()
+    return results
+
+
+# Meta keys that must agree for a comparison to mean anything.
+COMPARABLE_META = (
+    "seed", "entities", "cpu_model", "cpu_count", "memory_gb", "machine", "system",
+    "python_implementation", "python", "pandas", "numpy",
+)
+
+
+def _meta(seed: int, entities: int, repeat: int) -> dict:
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "seed": seed,
+        "entities": entities,
+        "repeat": repeat,
+        "python_implementation": platform.python_implementation(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "cpu_model": _cpu_model(),
+        "cpu_count": os.cpu_count(),
+        "memory_gb": _memory_gb(),
+    }
+
+
+def _cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or "unknown"
+
+
+def _memory_gb() -> float | None:
+    try:
+        return round(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2**30, 1)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def compare(
+    results: dict,
+    baseline: dict,
+    time_threshold: float = 0.25,
+    memory_threshold: float = 0.25,
+) -> list[dict]:
+    """One row per case present in both runs, with its verdict.
+
+    ``status`` is ``regression`` when the median time or the memory peak
+    grew by more than the threshold (and more than the noise floor),
+    ``improved`` when the time shrank by as much, else ``ok``.
+    """
+    rows = []
+    for size, entry in results["sizes"].items():
+        base_cases = baseline.get("sizes", {}).get(size, {}).get("cases", {})
+        for name, new in entry["cases"].items():
+            old = base_cases.get(name)
+            if old is None:
+                continue
+            dt = new["seconds"] - old["seconds"]
+            dm = new["peak_mb"] - old["peak_mb"]
+            # Ratios of values under the noise floor are taken at the floor.
+            time_ratio = max(new["seconds"], MIN_SECONDS) / max(old["seconds"], MIN_SECONDS)
+            mem_ratio = max(new["peak_mb"], MIN_MB) / max(old["peak_mb"], MIN_MB)
+            slower = time_ratio > 1 + time_threshold and dt > MIN_SECONDS
+            bigger = mem_ratio > 1 + memory_threshold and dm > MIN_MB
+            if slower or bigger:
+                status = "regression"
+            elif time_ratio < 1 / (1 + time_threshold) and -dt > MIN_SECONDS:
+                status = "improved"
+            else:
+                status = "ok"
+            rows.append(
+                {
+                    "rows": int(size),
+                    "case": name,
+                    "seconds": new["seconds"],
+                    "baseline_seconds": old["seconds"],
+                    "time_ratio": round(time_ratio, 3),
+                    "peak_mb": new["peak_mb"],
+                    "baseline_peak_mb": old["peak_mb"],
+                    "memory_ratio": round(mem_ratio, 3),
+                    "status": status,
+                }
+            )
+    return rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000],
+                        help="Invoice counts to run (10k to 10M)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--entities", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case")
+    parser.add_argument("--only", help="Run only the cases whose name contains this text")
+    parser.add_argument("--no-endpoints", action="store_true", help="Skip the HTTP endpoint cases")
+    parser.add_argument("--backend", choices=["sqlite", "parquet"], help="storage_backend to use")
+    parser.add_argument("--output", type=Path, help="Write the results as JSON")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Store the results as the baseline instead of comparing")
+    parser.add_argument("--time-threshold", type=float, default=0.25,
+                        help="Allowed relative slowdown before a case regresses")
+    parser.add_argument("--memory-threshold", type=float, default=0.25,
+                        help="Allowed relative growth of the memory peak")
+    args = parser.parse_args(argv)
+
+    if args.backend:
+        get_settings().storage_backend = args.backend
+    results = run(
+        args.rows, args.seed, args.entities, args.repeat, args.only, not args.no_endpoints
+    )
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; nothing to compare")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    for key in COMPARABLE_META:
+        if baseline["meta"].get(key) != results["meta"][key]:
+            print(f"warning: baseline {key} is {baseline['meta'].get(key)!r}, "
+                  f"this run {results['meta'][key]!r}", file=sys.stderr)
+    rows = compare(results, baseline, args.time_threshold, args.memory_threshold)
+    if not rows:
+        print("No case in common with the baseline (different --rows?)")
+        return 0
+    for row in rows:
+        print(
+            f"{row['status']:<10} {row['rows']:>10} {row['case']:<50} "
+            f"{row['time_ratio']:>6.2f}x time {row['memory_ratio']:>6.2f}x memory"
+        )
+    if args.output:
+        results["comparison"] = rows
+        args.output.write_text(json.dumps(results, indent=2))
+    regressions = [r for r in rows if r["status"] == "regression"]
+    print(f"{len(regressions)} regression(s) in {len(rows)} compared cases")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Compare frame loads on the SQLite and Parquet storage backends.
+
+    python -m backend.benchmarks.storage --rows 1000000
+
+Imports the same generated invoices and bank lines into a scratch database
+and times, per backend, a cold ``load_data`` (frame cache dropped) and a
+``load_dataset`` for one entity and month with three columns.
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+from backend.config import get_settings
+from backend.services import data_layer
+
+from . import generator
+
+
+def _best(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def run(rows: int, repeat: int = 3) -> dict:
+    settings = get_settings()
+    saved = data_layer.DB_PATH, settings.storage_backend, settings.columnar_path
+    inv, bank = generator.generate(rows)
+    results = {"rows": rows}
+    with tempfile.TemporaryDirectory() as tmp:
+        data_layer.DB_PATH = Path(tmp) / "bench.db"
+        settings.columnar_path = None
+        try:
+            for backend in ("sqlite", "parquet"):
+                settings.storage_backend = backend
+                data_layer.reset_db()
+                started = time.perf_counter()
+                for name, df in (("invoices", inv), ("bank_tx", bank)):
+                    data_layer.import_csv_stream(name, io.BytesIO(df.to_csv(index=False).encode()))
+                imported = time.perf_counter() - started
+
+                def cold_load():
+                    data_layer.bump_data_version()
+                    data_layer.load_data()
+
+                def pushdown():
+                    data_layer.load_dataset(
+                        "invoices",
+                        columns=["date", "amount", "type"],
+                        entity="TUG_NL",
+                        date_from=date(2024, 3, 1),
+                        date_to=date(2024, 3, 31),
+                    )
+
+                results[backend] = {
+                    "import_s": round(imported, 3),
+                    "load_data_s": round(_best(cold_load, repeat), 3),
+                    "load_dataset_s": round(_best(pushdown, repeat), 4),
+                }
+        finally:
+            data_layer.DB_PATH, settings.storage_backend, settings.columnar_path = saved
+            data_layer.bump_data_version()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000, help="Rows per dataset")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per timing; the best counts")
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
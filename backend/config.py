@@ -1,6 +1,6 @@
 from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import Literal, Optional
 import os
 
 from pydantic_settings import BaseSettings
@@ -20,6 +20,47 @@ class Settings(BaseSettings):
         description="Optional SQLAlchemy connection string. Falls back to sqlite file.",
     )
 
+    # Frame storage: "parquet" serves load_data from Parquet snapshots of the
+    # datasets (needs pyarrow); SQLite stays the system of record either way
+    storage_backend: Literal["sqlite", "parquet"] = Field(
+        default="sqlite", description="Where load_data reads the datasets from"
+    )
+    columnar_path: Optional[Path] = Field(
+        default=None, description="Snapshot directory; defaults to <db name>_columnar beside the db"
+    )
+
+    # SQLite tuning (applied to every connection)
+    sqlite_mmap_size: int = Field(
+        default=256 * 1024 * 1024, description="PRAGMA mmap_size in bytes"
+    )
+    sqlite_cache_kib: int = Field(
+        default=64 * 1024, description="Page cache per connection in KiB"
+    )
+
+    # CSV ingestion
+    ingest_chunk_rows: int = Field(
+        default=100_000, description="Rows parsed per chunk when streaming CSV uploads"
+    )
+
+    # Background jobs
+    max_running_jobs: int = Field(
+        default=2, description="Reconciliation worker processes allowed at once"
+    )
+    recon_workers: int = Field(
+        default=0,
+        description="Processes per parallel (entity-partitioned) reconciliation; 0 uses all cores",
+    )
+    recon_stats_log: bool = Field(
+        default=False,
+        description="Log each run's per-rule, per-entity stats to stderr as JSON lines",
+    )
+
+    # Reporting response cache
+    response_cache_bytes: int = Field(
+        default=64 * 1024 * 1024,
+        description="Memory budget for cached reporting responses; 0 disables the cache",
+    )
+
     # Document AI
     docai_project_id: Optional[str] = Field(
         default="361271679946", description="Google Cloud project id for Document AI"
@@ -37,6 +78,28 @@ class Settings(BaseSettings):
         description="Inline JSON credentials blob (base64 or raw). Takes precedence over key_path.",
     )
 
+    # OCR throughput: parallel Document AI calls, the request rate our quota
+    # allows (token bucket) and retries on transient errors
+    ocr_workers: int = Field(default=8, description="Concurrent Document AI requests")
+    ocr_rate_per_sec: float = Field(
+        default=5.0, description="Sustained Document AI requests per second"
+    )
+    ocr_burst: int = Field(default=5, description="Requests allowed in a burst above the rate")
+    ocr_max_retries: int = Field(default=4, description="Retries per file on transient errors")
+    ocr_backoff_base: float = Field(
+        default=0.5, description="First retry delay in seconds, doubled per attempt"
+    )
+    ocr_backoff_max: float = Field(default=16.0, description="Upper bound on a retry delay")
+
+    # OCR result cache (separate SQLite file, keyed by file hash + processor)
+    ocr_cache_path: Optional[Path] = Field(
+        default=None, description="Cache database; defaults to backend/ocr_cache.db"
+    )
+    ocr_cache_max_bytes: int = Field(
+        default=256 * 1024 * 1024,
+        description="Compressed bytes kept before LRU eviction; 0 disables the cache",
+    )
+
     # Frontend origins - can be comma-separated string or list
     allowed_origins: str | list[str] = Field(
         default="http://localhost:3000,http://127.0.0.1:3000",
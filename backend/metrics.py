@@ -0,0 +1,227 @@
+"""Process-local metrics, rendered in the Prometheus text format by ``/metrics``.
+
+A small registry of counters, gauges and histograms with labels, so the API
+needs no client library. Values live in this process only: job workers are
+separate processes, so their work is recorded by the API process when the
+job finishes.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Sequence
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _label_text(self, key: tuple, extra: str = "") -> str:
+        parts = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key: tuple, value) -> list[str]:
+        return [f"{self.name}{self._label_text(key)} {_number(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Counters only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            # Per-bucket counts; made cumulative when rendered.
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the wall time of the block, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def _samples(self, key: tuple, value) -> list[str]:
+        counts, total = value
+        lines, running = [], 0
+        for bound, n in zip((*self.buckets, math.inf), counts):
+            running += n
+            le = 'le="' + ("+Inf" if bound == math.inf else _number(bound)) + '"'
+            lines.append(f"{self.name}_bucket{self._label_text(key, le)} {running}")
+        lines.append(f"{self.name}_sum{self._label_text(key)} {_number(total)}")
+        lines.append(f"{self.name}_count{self._label_text(key)} {running}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(
+        self, name: str, help: str, labels: Sequence[str] = (), buckets=LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+REGISTRY = Registry()
+
+# HTTP, recorded by api.MetricsMiddleware; ``route`` is the path template.
+HTTP_REQUESTS = REGISTRY.counter(
+    "tug_http_requests_total", "HTTP requests answered", ("method", "route", "status")
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "tug_http_request_duration_seconds",
+    "Time from request start to the last response byte",
+    ("method", "route"),
+)
+HTTP_REQUEST_SIZE = REGISTRY.histogram(
+    "tug_http_request_size_bytes", "Request body size", ("method", "route"), SIZE_BUCKETS
+)
+HTTP_RESPONSE_SIZE = REGISTRY.histogram(
+    "tug_http_response_size_bytes", "Response body size", ("method", "route"), SIZE_BUCKETS
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "tug_http_requests_in_flight", "Requests being handled", ("method", "route")
+)
+
+# Data layer
+DATA_LOAD_SECONDS = REGISTRY.histogram(
+    "tug_data_load_seconds", "Time to read datasets into frames", ("op",)
+)
+DATA_ROWS_LOADED = REGISTRY.counter(
+    "tug_data_rows_loaded_total", "Rows read into frames", ("dataset",)
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "tug_cache_requests_total", "Cache lookups", ("cache", "result")
+)
+DATA_VERSION = REGISTRY.gauge("tug_data_version", "Current data version of this process")
+RESPONSE_CACHE_BYTES = REGISTRY.gauge(
+    "tug_response_cache_bytes", "Bytes held by the reporting response cache"
+)
+
+# OCR
+OCR_LATENCY = REGISTRY.histogram(
+    "tug_ocr_request_duration_seconds", "Document AI call duration", ("outcome",)
+)
+OCR_ERRORS = REGISTRY.counter(
+    "tug_ocr_errors_total", "Failed Document AI calls", ("kind",)
+)
+
+# Reconciliation
+RECON_SECONDS = REGISTRY.histogram(
+    "tug_reconciliation_duration_seconds",
+    "Reconciliation runs, load to result",
+    ("mode", "status"),
+)
+RECON_MATCHES = REGISTRY.counter(
+    "tug_reconciliation_matches_total", "Matches found by reconciliation runs", ("rule",)
+)
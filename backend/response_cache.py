@@ -0,0 +1,94 @@
+"""Serialized API responses, reused until the underlying data changes."""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Hashable
+
+from backend import metrics
+
+
+@dataclass(frozen=True)
+class CachedBody:
+    body: bytes
+    etag: str
+
+
+class ResponseCache:
+    """LRU of response bodies within a byte budget.
+
+    Keys end with the data version they were computed for. Storing an entry
+    for a newer version drops everything older, so stale responses do not
+    hold on to the budget until they age out.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, CachedBody] = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get_or_build(
+        self, key: tuple, version: int, build: Callable[[], bytes]
+    ) -> CachedBody:
+        full_key = (*key, version)
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                metrics.CACHE_REQUESTS.inc(cache="response", result="hit")
+                return entry
+            self.misses += 1
+        metrics.CACHE_REQUESTS.inc(cache="response", result="miss")
+        # Built outside the lock: concurrent misses on the same key both
+        # compute, but other keys are not held up.
+        body = build()
+        entry = CachedBody(body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"')
+        self._store(full_key, version, entry)
+        return entry
+
+    def _store(self, key: tuple, version: int, entry: CachedBody):
+        size = len(entry.body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if self._version is None or version > self._version:
+                self._entries.clear()
+                self._bytes = 0
+                self._version = version
+            elif version < self._version:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an ``If-None-Match`` header covers ``etag``."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
@@ -3,8 +3,16 @@ Service layer helpers for the Mini-TUG backend API.
 
 Modules:
     data_layer      - Database I/O and dataset utilities
+    columnar        - Parquet snapshots of the datasets for fast loads
+    schema          - Typed frames: categoricals and integer cents
     ocr             - Google Document AI integration helpers
+    ocr_cache       - Persistent cache of parsed Document AI results
+    matching        - Vectorized join kernels used by reconciliation
     reconciliation  - Matching algorithms
+    parallel        - Entity-partitioned reconciliation on a process pool
+    profiling       - Per-rule, per-entity reconciliation stats
+    sweep           - Reconciliation settings grids evaluated on one load
+    jobs            - Background reconciliation jobs in worker processes
     reporting       - KPI aggregations and board-pack builders
 """
 
@@ -0,0 +1,263 @@
+"""Parquet snapshots of the datasets, for fast frame loads.
+
+With ``storage_backend = "parquet"`` the data layer keeps one snapshot per
+dataset next to SQLite and ``load_data`` reads it instead of materializing
+rows through ``read_sql``. SQLite stays the system of record (row ids, match
+updates, aggregates, paging); every snapshot carries the generation token
+of the table state it was exported from, and one that does not match the
+table is never served.
+
+Layout: ``<root>/<dataset>/<version>/`` holds one Parquet file per entity
+plus ``manifest.json``, and ``<root>/<dataset>/CURRENT`` names the live
+version. Versions are immutable: an update writes a new one, hard-linking
+the entity files it leaves alone, and swaps ``CURRENT`` atomically, so a
+reader always sees one complete snapshot. Requires pyarrow.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: single writer process assumed
+    fcntl = None
+
+KEY_COLUMN = "row_id"
+PARTITION_COLUMN = "entity"
+_DATE_COLUMN = "date"
+
+
+class SnapshotError(Exception):
+    """Rows could not be written to a snapshot (e.g. they do not fit its schema)."""
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError(
+            "The parquet storage backend requires 'pyarrow' (see backend/requirements.txt)"
+        ) from exc
+    return pa, pq
+
+
+def partition_key(entity) -> str:
+    """Manifest key of the partition holding ``entity`` (missing entities share one)."""
+    if pd.isna(entity):
+        return json.dumps(None)
+    return json.dumps(entity.item() if hasattr(entity, "item") else entity)
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    dataset: str
+    path: Path
+    token: str
+    columns: dict[str, str]  # name -> declared SQLite type, in table order
+    partitions: dict[str, dict]  # partition key -> {"file", "entity", "rows"}
+    schema: bytes
+
+    @property
+    def rows(self) -> int:
+        return sum(p["rows"] for p in self.partitions.values())
+
+    def arrow_schema(self):
+        pa, _ = _pyarrow()
+        return pa.ipc.read_schema(pa.py_buffer(self.schema))
+
+
+class ColumnarStore:
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        _pyarrow()
+
+    def current(self, dataset: str) -> Snapshot | None:
+        base = self.root / dataset
+        try:
+            version = (base / "CURRENT").read_text().strip()
+            manifest = json.loads((base / version / "manifest.json").read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return Snapshot(
+            dataset=dataset,
+            path=base / version,
+            token=manifest["token"],
+            columns=manifest["columns"],
+            partitions=manifest["partitions"],
+            schema=base64.b64decode(manifest["schema"]),
+        )
+
+    def publish(
+        self,
+        dataset: str,
+        token: str,
+        columns: dict[str, str],
+        rows: pd.DataFrame,
+        base: Snapshot | None = None,
+        entities: Iterable | None = None,
+    ) -> Snapshot:
+        """Write ``rows`` as a new version and make it current.
+
+        Without ``base`` the rows are the whole dataset. With ``base`` they
+        replace just the partitions of ``entities`` (which may end up empty)
+        and are cast to its schema; the other partitions are carried over.
+        Raises ``SnapshotError`` when the rows do not fit that schema.
+        """
+        pa, pq = _pyarrow()
+        schema = base.arrow_schema() if base is not None else _schema_for(rows, columns)
+        if PARTITION_COLUMN in rows.columns:
+            keys = rows[PARTITION_COLUMN].map(partition_key)
+            frames = {key: part for key, part in rows.groupby(keys, sort=False)}
+        else:
+            frames = {partition_key(None): rows}
+        for entity in entities if base is not None else ():
+            frames.setdefault(partition_key(entity), rows.iloc[:0])
+        version = f"v-{uuid.uuid4().hex[:12]}"
+        target = self.root / dataset / version
+        target.mkdir(parents=True)
+        try:
+            partitions = {}
+            if base is not None:
+                for key, part in base.partitions.items():
+                    if key not in frames:
+                        os.link(base.path / part["file"], target / part["file"])
+                        partitions[key] = part
+            for key, df in frames.items():
+                if df.empty:
+                    continue
+                name = f"part-{hashlib.sha1(key.encode()).hexdigest()[:16]}.parquet"
+                table = pa.Table.from_pandas(
+                    df.reset_index(), schema=schema, preserve_index=False
+                ).replace_schema_metadata(None)
+                pq.write_table(table, target / name, compression="zstd")
+                partitions[key] = {"file": name, "entity": json.loads(key), "rows": len(df)}
+            manifest = {
+                "token": token,
+                "columns": columns,
+                "partitions": partitions,
+                "schema": base64.b64encode(schema.serialize().to_pybytes()).decode(),
+            }
+            (target / "manifest.json").write_text(json.dumps(manifest, default=str))
+            pointer = self.root / dataset / f"CURRENT.{version}"
+            pointer.write_text(version)
+            with self._locked(dataset):
+                os.replace(pointer, self.root / dataset / "CURRENT")
+                self._prune(dataset)
+        except BaseException as exc:
+            shutil.rmtree(target, ignore_errors=True)
+            if isinstance(exc, pa.ArrowException):
+                raise SnapshotError(f"{dataset}: {exc}") from exc
+            raise
+        return self.current(dataset)
+
+    def read(
+        self,
+        snapshot: Snapshot,
+        columns: Iterable[str] | None = None,
+        entities: Iterable | None = None,
+        filters=None,
+    ) -> pd.DataFrame:
+        """Rows of ``snapshot`` as ``read_sql`` would return them, indexed by ``row_id``.
+
+        ``columns`` and ``filters`` (pyarrow DNF, e.g. ``[("date", ">=", ts)]``)
+        are pushed down into the Parquet reader; ``entities`` picks partition
+        files up front. Files are memory-mapped.
+        """
+        pa, pq = _pyarrow()
+        wanted = None if entities is None else {partition_key(e) for e in entities}
+        select = None
+        if columns is not None:
+            select = [KEY_COLUMN] + [c for c in columns if c != KEY_COLUMN]
+        tables = [
+            pq.read_table(
+                snapshot.path / part["file"], columns=select, filters=filters, memory_map=True
+            )
+            for key, part in snapshot.partitions.items()
+            if wanted is None or key in wanted
+        ]
+        if tables:
+            table = pa.concat_tables(tables)
+        else:
+            table = snapshot.arrow_schema().empty_table()
+            if select is not None:
+                table = table.select(select)
+        return _to_frame(table)
+
+    def clear(self, dataset: str | None = None):
+        shutil.rmtree(self.root / dataset if dataset else self.root, ignore_errors=True)
+
+    @contextmanager
+    def _locked(self, dataset: str):
+        """Serialize version swaps across threads and processes (API and jobs)."""
+        with open(self.root / dataset / ".lock", "a") as fh:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            yield
+
+    def _prune(self, dataset: str):
+        # Readers that already opened an older version keep their mapped
+        # files; unlinking only drops the names.
+        keep = (self.root / dataset / "CURRENT").read_text().strip()
+        for path in (self.root / dataset).iterdir():
+            if path.is_dir() and path.name != keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def _schema_for(df: pd.DataFrame, columns: dict[str, str]):
+    """The Arrow schema of a full export, from the frame's dtypes.
+
+    Object columns are text, unless the table declares them numeric and
+    they hold no value at all (a match column before the first run).
+    """
+    pa, _ = _pyarrow()
+    fields = [pa.field(KEY_COLUMN, pa.int64())]
+    for col, declared in columns.items():
+        if col == KEY_COLUMN:
+            continue
+        kind = df[col].dtype.kind if col in df.columns else "O"
+        empty = kind == "O" and not (col in df.columns and df[col].notna().any())
+        if kind == "M":
+            arrow_type = pa.timestamp("ns")
+        elif kind in "iub" or (empty and declared == "INTEGER"):
+            arrow_type = pa.int64()
+        elif kind == "f" or (empty and declared == "REAL"):
+            arrow_type = pa.float64()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(col, arrow_type))
+    return pa.schema(fields)
+
+
+def _to_frame(table) -> pd.DataFrame:
+    """Arrow rows to the frame ``read_sql`` gives for the same SQLite rows.
+
+    ``read_sql`` infers dtypes from the values: a column without any value
+    comes back as object ``None``, whatever its declared type.
+    """
+    if table.num_rows == 0:
+        names = [c for c in table.column_names if c != KEY_COLUMN]
+        return pd.DataFrame(columns=names, index=pd.Index([], name=KEY_COLUMN))
+    df = table.to_pandas()
+    for col in table.column_names:
+        if col not in (KEY_COLUMN, _DATE_COLUMN) and table.column(col).null_count == table.num_rows:
+            df[col] = pd.Series([None] * len(df), index=df.index, dtype=object)
+    return df.set_index(KEY_COLUMN).sort_index()
+
+
+@lru_cache
+def get_store(root: Path) -> ColumnarStore:
+    return ColumnarStore(root)
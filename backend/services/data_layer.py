@@ -1,32 +1,488 @@
 from __future__ import annotations
 
 import io
+import json
+import os
 import sqlite3
+import threading
+import time
+import uuid
 import zipfile
-from dataclasses import dataclass
+import zlib
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
-from typing import Iterable, Literal, Tuple
+from typing import BinaryIO, Iterable, Iterator, Literal, Tuple
 
+import numpy as np
 import pandas as pd
 
+from backend import metrics
+from backend.config import get_settings
+
+from . import columnar, schema
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 DB_PATH = BASE_DIR / "mini_tug.db"
 
+DATASETS = ("invoices", "bank_tx")
+WATERMARK_TABLE = "recon_watermarks"
+# Stable primary key of both datasets; an alias of the SQLite rowid.
+KEY_COLUMN = "row_id"
+MATCH_COLUMNS = ("match_id", "status")
+
+# Indexes per dataset, created once the indexed columns exist.
+INDEXES = {
+    "invoices": [
+        ("entity", "date"), ("date", KEY_COLUMN), ("match_id",), ("type", "match_id", "amount")
+    ],
+    "bank_tx": [("entity", "date"), ("date", KEY_COLUMN), ("match_id",), ("direction", "match_id")],
+}
+# Timestamps are stored as text in STORED_DATE_FORMAT and served in ISO_DATE_FORMAT.
+STORED_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+ISO_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# OCR payloads live beside the invoices, compressed and keyed by row_id, so
+# reads of the invoices table never carry them.
+DOCUMENT_TABLE = "invoice_documents"
+DOCUMENT_COLUMN = "raw_ocr"
+# sha256 of the file an OCR'd invoice was read from.
+SOURCE_HASH_COLUMN = "source_sha256"
+
+# Per-(entity, month) reporting sums, kept in step with every write to the
+# datasets. Missing keys are stored as '' so they can be part of the primary
+# key; a dataset without an entity column books to the overview's default.
+AGGREGATE_TABLE = "monthly_aggregates"
+DEFAULT_ENTITY = "TUG_NL"
+AGGREGATE_MEASURES = {
+    "invoices": {
+        "revenue": "TOTAL(CASE WHEN type = 'revenue' THEN amount END)",
+        "expense": "TOTAL(CASE WHEN type = 'expense' THEN amount END)",
+        "matched_revenue": (
+            "TOTAL(CASE WHEN type = 'revenue' AND match_id IS NOT NULL THEN amount END)"
+        ),
+        "net_amount": "TOTAL(net_amount)",
+        "vat_amount": "TOTAL(vat_amount)",
+        "invoice_count": "COUNT(*)",
+        "revenue_count": "SUM(CASE WHEN type = 'revenue' THEN 1 ELSE 0 END)",
+        "matched_count": (
+            "SUM(CASE WHEN type = 'revenue' AND match_id IS NOT NULL THEN 1 ELSE 0 END)"
+        ),
+    },
+    "bank_tx": {
+        "inflow": "TOTAL(CASE WHEN direction = 'in' THEN amount END)",
+        "outflow": "TOTAL(CASE WHEN direction = 'out' THEN amount END)",
+        "net_cash": (
+            "TOTAL(CASE WHEN direction = 'in' THEN amount END)"
+            " - TOTAL(CASE WHEN direction = 'out' THEN amount END)"
+        ),
+        "bank_count": "COUNT(*)",
+    },
+}
+# The measures that move when reconciliation writes match_id.
+MATCH_MEASURES = ("matched_revenue", "matched_count")
+_SOURCE_COLUMNS = {
+    "invoices": ("type", "amount", "match_id", "net_amount", "vat_amount"),
+    "bank_tx": ("direction", "amount"),
+}
+
+# A token per dataset, replaced in the same transaction as every write to
+# it. A Parquet snapshot (storage_backend = "parquet") records the token it
+# was exported from and is only served while the two agree.
+GENERATION_TABLE = "dataset_generations"
+
+# Normalized frames from the last load_data, keyed by the data version. Every
+# write path bumps the version, which invalidates the cached frames.
+_data_version = 0
+_frame_cache: dict = {}
+_cache_lock = threading.Lock()
+
+# One connection per thread, and the databases whose schema has been checked.
+# ``_local.pending`` collects the snapshot syncs of the thread's current write.
+_local = threading.local()
+_schema_ready: set[Path] = set()
+# Generations whose full export failed; they are read from SQLite instead.
+_columnar_failed: set[str] = set()
+
 
 def get_connection() -> sqlite3.Connection:
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    return sqlite3.connect(DB_PATH)
+    """The calling thread's connection to ``DB_PATH``, opened and tuned once.
+
+    Connections are reused per thread; use them as ``with get_connection()
+    as con:`` for a transaction, never ``close()`` them.
+    """
+    con = getattr(_local, "con", None)
+    if con is None or _local.path != DB_PATH:
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        con = _open_connection(DB_PATH)
+        _local.con, _local.path = con, DB_PATH
+    if DB_PATH not in _schema_ready:
+        with con:
+            _ensure_schema(con)
+        _schema_ready.add(DB_PATH)
+    return con
+
+
+def _open_connection(path: Path, **kwargs) -> sqlite3.Connection:
+    settings = get_settings()
+    con = sqlite3.connect(path, timeout=30, **kwargs)
+    # WAL lets dashboard reads proceed while reconciliation writes.
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+    con.execute(f"PRAGMA cache_size=-{int(settings.sqlite_cache_kib)}")
+    return con
+
+
+def _ensure_schema(con: sqlite3.Connection):
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {GENERATION_TABLE} "
+        "(dataset TEXT PRIMARY KEY, token TEXT NOT NULL)"
+    )
+    _ensure_row_ids(con)
+    _ensure_documents(con)
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} "
+        "(dataset TEXT PRIMARY KEY, watermark INTEGER NOT NULL, updated_at TEXT)"
+    )
+    # Tables written before generations existed.
+    con.execute(
+        f"INSERT OR IGNORE INTO {GENERATION_TABLE} (dataset, token) "
+        "SELECT name, lower(hex(randomblob(16))) FROM sqlite_master "
+        f"WHERE type = 'table' AND name IN ({', '.join(repr(n) for n in DATASETS)})"
+    )
+    for name in DATASETS:
+        _ensure_indexes(con, name)
+    _ensure_aggregates(con)
+
+
+def _ensure_indexes(con: sqlite3.Connection, name: str):
+    present = {col[1] for col in con.execute(f"PRAGMA table_info({name})")}
+    for cols in INDEXES[name]:
+        if set(cols).issubset(present):
+            con.execute(
+                f"CREATE INDEX IF NOT EXISTS ix_{name}_{'_'.join(cols)} "
+                f"ON {name} ({', '.join(cols)})"
+            )
+
+
+def _ensure_row_ids(con: sqlite3.Connection):
+    """Rebuild tables written before ``row_id`` existed, keeping their rowids."""
+    for name in DATASETS:
+        info = con.execute(f"PRAGMA table_info({name})").fetchall()
+        if not info or any(col[1] == KEY_COLUMN for col in info):
+            continue
+        columns = ", ".join(f'"{col[1]}" {col[2]}' for col in info)
+        con.execute(f"ALTER TABLE {name} RENAME TO _{name}_legacy")
+        con.execute(f"CREATE TABLE {name} ({KEY_COLUMN} INTEGER PRIMARY KEY, {columns})")
+        con.execute(f"INSERT INTO {name} SELECT rowid, * FROM _{name}_legacy")
+        con.execute(f"DROP TABLE _{name}_legacy")
+        _touch(con, name)
+
+
+def _ensure_documents(con: sqlite3.Connection):
+    """Create the document table and move inline ``raw_ocr`` values into it."""
+    _create_document_table(con, DOCUMENT_TABLE)
+    if DOCUMENT_COLUMN not in dataset_columns(con, "invoices"):
+        return
+    cur = con.execute(
+        f"SELECT {KEY_COLUMN}, {DOCUMENT_COLUMN} FROM invoices "
+        f"WHERE {DOCUMENT_COLUMN} IS NOT NULL"
+    )
+    while batch := cur.fetchmany(1000):
+        _write_documents(con, DOCUMENT_TABLE, [(rid, _compress(raw)) for rid, raw in batch])
+    con.execute(f"ALTER TABLE invoices DROP COLUMN {DOCUMENT_COLUMN}")
+    _touch(con, "invoices")
+
+
+def _create_document_table(con: sqlite3.Connection, name: str):
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {name} "
+        f"({KEY_COLUMN} INTEGER PRIMARY KEY, payload BLOB NOT NULL)"
+    )
+
+
+def _write_documents(con: sqlite3.Connection, name: str, docs: list[tuple[int, bytes]]):
+    # A plain insert: a row id that already has a document is a bug to surface,
+    # not a document to overwrite.
+    if docs:
+        con.executemany(f"INSERT INTO {name} ({KEY_COLUMN}, payload) VALUES (?, ?)", docs)
+
+
+def _split_documents(
+    df: pd.DataFrame, first_id: int
+) -> tuple[pd.DataFrame, list[tuple[int, bytes]]]:
+    """Take ``raw_ocr`` out of rows that will get row ids ``first_id``, ``first_id + 1``, ..."""
+    if DOCUMENT_COLUMN not in df.columns:
+        return df, []
+    docs = [
+        (first_id + i, _compress(raw))
+        for i, raw in enumerate(df[DOCUMENT_COLUMN])
+        if isinstance(raw, str)
+    ]
+    return df.drop(columns=[DOCUMENT_COLUMN]), docs
+
+
+def _compress(raw: str) -> bytes:
+    return zlib.compress(raw.encode(), 6)
+
+
+def get_invoice_document(row_id: int) -> dict | None:
+    """The parsed OCR document stored for invoice ``row_id``, if any."""
+    if not DB_PATH.exists():
+        return None
+    row = (
+        get_connection()
+        .execute(f"SELECT payload FROM {DOCUMENT_TABLE} WHERE {KEY_COLUMN} = ?", (row_id,))
+        .fetchone()
+    )
+    return json.loads(zlib.decompress(row[0])) if row else None
+
+
+def _ensure_aggregates(con: sqlite3.Connection):
+    if AGGREGATE_TABLE in _table_names(con):
+        return
+    measures = [
+        f"{col} {'INTEGER' if col.endswith('_count') else 'REAL'} NOT NULL DEFAULT 0"
+        for name in DATASETS
+        for col in AGGREGATE_MEASURES[name]
+    ]
+    con.execute(
+        f"CREATE TABLE {AGGREGATE_TABLE} (entity TEXT NOT NULL, month TEXT NOT NULL, "
+        f"{', '.join(measures)}, PRIMARY KEY (entity, month))"
+    )
+    _refresh_aggregates(con)
+
+
+def _refresh_aggregates(con: sqlite3.Connection, datasets: Iterable[str] = DATASETS):
+    """Recompute the aggregate columns of ``datasets`` from their tables."""
+    tables = _table_names(con)
+    for name in datasets:
+        con.execute(
+            f"UPDATE {AGGREGATE_TABLE} SET "
+            + ", ".join(f"{col} = 0" for col in AGGREGATE_MEASURES[name])
+        )
+        if name in tables:
+            _add_aggregates(con, name)
+    con.execute(
+        f"DELETE FROM {AGGREGATE_TABLE} WHERE invoice_count = 0 AND bank_count = 0"
+    )
+
+
+def _add_aggregates(
+    con: sqlite3.Connection,
+    name: str,
+    where: str = "",
+    params: tuple = (),
+    measures: Iterable[str] | None = None,
+    sign: int = 1,
+):
+    """Add (``sign=-1``: subtract) the contribution of the rows matching ``where``."""
+    exprs = AGGREGATE_MEASURES[name]
+    cols = list(measures or exprs)
+    con.execute(
+        f"INSERT INTO {AGGREGATE_TABLE} (entity, month, {', '.join(cols)}) "
+        f"SELECT entity, month, {', '.join(f'{sign} * ({exprs[c]})' for c in cols)} "
+        f"FROM {_measure_source(con, name, where)} "
+        "WHERE true GROUP BY entity, month "
+        "ON CONFLICT (entity, month) DO UPDATE SET "
+        + ", ".join(f"{c} = {c} + excluded.{c}" for c in cols),
+        params,
+    )
+
+
+def _measure_source(con: sqlite3.Connection, name: str, where: str = "") -> str:
+    """Subquery over ``name`` exposing every column the measures use.
+
+    Columns the table lacks read as NULL, so the measure SQL never has to
+    check which optional columns a dataset was imported with.
+    """
+    present = set(dataset_columns(con, name))
+    select = [
+        "COALESCE(entity, '') AS entity" if "entity" in present else f"'{DEFAULT_ENTITY}' AS entity",
+        "COALESCE(month, '') AS month" if "month" in present else "'' AS month",
+    ] + [col if col in present else f"NULL AS {col}" for col in _SOURCE_COLUMNS[name]]
+    return f"(SELECT {', '.join(select)} FROM {name} {where})"
+
+
+def _replace_table(con: sqlite3.Connection, name: str, df: pd.DataFrame):
+    """Recreate ``name`` from ``df`` with ``row_id`` as its primary key.
+
+    Row ids are assigned by SQLite in frame order, starting at 1. Runs in
+    the caller's transaction, which must be open (``BEGIN IMMEDIATE``) so
+    the schema change commits or rolls back with the rows.
+    """
+    df = df.drop(columns=[KEY_COLUMN], errors="ignore")
+    _create_table(con, name, df)
+    _insert_rows(con, name, df)
+    _ensure_indexes(con, name)
+
+
+def _insert_rows(con: sqlite3.Connection, name: str, df: pd.DataFrame):
+    """Insert the rows of ``df`` into ``name`` within the caller's transaction.
+
+    Stores values the way ``DataFrame.to_sql`` does, which cannot be used
+    here: it commits the connection's open transaction when it finishes.
+    """
+    values = df.copy()
+    for col in values.columns:
+        if values[col].dtype.kind == "M":
+            values[col] = values[col].dt.strftime(STORED_DATE_FORMAT)
+    values = values.astype(object).where(values.notna(), None)
+    columns = ", ".join(f'"{c}"' for c in values.columns)
+    con.executemany(
+        f"INSERT INTO {name} ({columns}) VALUES ({', '.join('?' * len(values.columns))})",
+        values.itertuples(index=False, name=None),
+    )
+
+
+def _create_table(con: sqlite3.Connection, name: str, df: pd.DataFrame):
+    schema = df.head(0).copy()
+    schema.insert(0, KEY_COLUMN, pd.Series(dtype="int64"))
+    con.execute(f"DROP TABLE IF EXISTS {name}")
+    con.execute(pd.io.sql.get_schema(schema, name, keys=KEY_COLUMN, con=con))
+
+
+def _touch(con: sqlite3.Connection, name: str, entities: Iterable | None = None):
+    """Give ``name`` a new generation, inside the caller's write transaction.
+
+    ``entities`` lists the entities whose rows the write touched (``None``:
+    possibly all of them); the snapshot is brought up to date once the
+    write is committed (see ``bump_data_version``).
+    """
+    previous = _generation(con, name)
+    token = uuid.uuid4().hex
+    con.execute(
+        f"INSERT INTO {GENERATION_TABLE} (dataset, token) VALUES (?, ?) "
+        "ON CONFLICT(dataset) DO UPDATE SET token = excluded.token",
+        (name, token),
+    )
+    if entities is not None:
+        entities = {None if pd.isna(e) else e for e in entities}
+    pending = _local.__dict__.setdefault("pending", {})
+    if name in pending:
+        # Several writes to one dataset in a transaction sync as one.
+        first, _, touched = pending[name]
+        if touched is None or entities is None:
+            entities = None
+        else:
+            entities = touched | entities
+        previous = first
+    pending[name] = (previous, token, entities)
+
+
+def _generation(con: sqlite3.Connection, name: str) -> str | None:
+    row = con.execute(
+        f"SELECT token FROM {GENERATION_TABLE} WHERE dataset = ?", (name,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _columnar_store() -> columnar.ColumnarStore | None:
+    """The snapshot store of ``DB_PATH`` when the parquet backend is selected."""
+    settings = get_settings()
+    if settings.storage_backend != "parquet":
+        return None
+    return columnar.get_store(
+        settings.columnar_path or DB_PATH.with_name(f"{DB_PATH.stem}_columnar")
+    )
+
+
+def _sync_snapshot(
+    store: columnar.ColumnarStore,
+    con: sqlite3.Connection,
+    name: str,
+    previous: str | None = None,
+    new: str | None = None,
+    entities: set | None = None,
+) -> columnar.Snapshot | None:
+    """Bring the snapshot of ``name`` to the table's current generation.
+
+    When the snapshot is exactly one write behind (``previous`` -> ``new``)
+    and that write named its entities, only their partitions are rewritten;
+    otherwise the table is exported in full. Runs in a read transaction so
+    the rows match the token they are stamped with. Returns ``None`` when
+    the table cannot be snapshotted and must be read from SQLite.
+    """
+    own_transaction = not con.in_transaction
+    if own_transaction:
+        con.execute("BEGIN")
+    try:
+        token = _generation(con, name)
+        current = store.current(name)
+        if token is None or name not in _table_names(con):
+            return None
+        if current is not None and current.token == token:
+            return current
+        if token in _columnar_failed:
+            return None
+        columns = dataset_columns(con, name)
+        if (
+            entities is not None
+            and token == new
+            and current is not None
+            and current.token == previous
+            and current.columns == columns
+        ):
+            try:
+                rows = _read_entities(con, name, entities)
+                return store.publish(name, token, columns, rows, base=current, entities=entities)
+            except columnar.SnapshotError:
+                pass  # e.g. a column changed type: export in full
+        try:
+            rows = pd.read_sql_query(f"SELECT * FROM {name}", con, index_col=KEY_COLUMN)
+            return store.publish(name, token, columns, _parse_dates(rows))
+        except (columnar.SnapshotError, OSError):
+            _columnar_failed.add(token)
+            return None
+    finally:
+        if own_transaction:
+            con.rollback()
+
+
+def _read_entities(con: sqlite3.Connection, name: str, entities: set) -> pd.DataFrame:
+    values = [e for e in entities if e is not None]
+    where = [f"entity IN ({','.join('?' * len(values))})"] if values else []
+    if None in entities:
+        where.append("entity IS NULL")
+    rows = pd.read_sql_query(
+        f"SELECT * FROM {name} WHERE {' OR '.join(where) or 'false'}",
+        con,
+        index_col=KEY_COLUMN,
+        params=values,
+    )
+    return _parse_dates(rows)
+
+
+def _parse_dates(df: pd.DataFrame) -> pd.DataFrame:
+    if "date" in df.columns:
+        df["date"] = pd.to_datetime(df["date"])
+    return df
+
+
+def _flush_snapshots():
+    """Sync the snapshots of what the calling thread's last write touched."""
+    pending = _local.__dict__.pop("pending", {})
+    store = _columnar_store()
+    if store is None or not pending or not DB_PATH.exists():
+        return
+    con = get_connection()
+    for name, (previous, new, entities) in pending.items():
+        if entities is not None and "entity" not in dataset_columns(con, name):
+            entities = None
+        _sync_snapshot(store, con, name, previous, new, entities)
 
 
 def list_tables() -> list[str]:
     if not DB_PATH.exists():
         return []
-    with get_connection() as con:
-        cur = con.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name"
-        )
-        return [row[0] for row in cur.fetchall()]
+    return _table_names(get_connection())
+
+
+def _table_names(con: sqlite3.Connection) -> list[str]:
+    cur = con.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
+    return [row[0] for row in cur.fetchall()]
 
 
 def db_has_data() -> bool:
@@ -34,26 +490,316 @@ def db_has_data() -> bool:
     return {"invoices", "bank_tx"}.issubset(tables)
 
 
+def data_version() -> int:
+    return _data_version
+
+
+def bump_data_version() -> int:
+    global _data_version
+    _flush_snapshots()
+    with _cache_lock:
+        _data_version += 1
+        _frame_cache.clear()
+        return _data_version
+
+
 def load_data() -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Typed invoice and bank frames (see ``schema``), served from the versioned cache.
+
+    The returned frames are copies of the cached data, so callers may edit
+    them freely without the edits reaching the cache.
+    """
+    version = _data_version
+    with _cache_lock:
+        cached = _frame_cache.get(version)
+    metrics.CACHE_REQUESTS.inc(cache="frames", result="miss" if cached is None else "hit")
+    if cached is None:
+        started = time.perf_counter()
+        cached = _read_frames()
+        _record_load("load_data", started, *zip(DATASETS, cached))
+        with _cache_lock:
+            if version == _data_version:
+                _frame_cache.clear()
+                _frame_cache[version] = cached
+    inv, bank = cached
+    return inv.copy(), bank.copy()
+
+
+def _record_load(op: str, started: float, *frames: Tuple[str, pd.DataFrame]):
+    """Report a load that began at ``started`` and the (dataset, frame) rows it read."""
+    metrics.DATA_LOAD_SECONDS.observe(time.perf_counter() - started, op=op)
+    for dataset, df in frames:
+        metrics.DATA_ROWS_LOADED.inc(len(df), dataset=dataset)
+
+
+def _read_frames() -> Tuple[pd.DataFrame, pd.DataFrame]:
     if not DB_PATH.exists():
         return pd.DataFrame(), pd.DataFrame()
 
+    store = _columnar_store()
     with get_connection() as con:
-        tables = list_tables()
-        inv = (
-            pd.read_sql_query("SELECT * FROM invoices", con)
-            if "invoices" in tables
-            else pd.DataFrame()
+        tables = _table_names(con)
+        frames = []
+        for name in DATASETS:
+            df = None
+            if name not in tables:
+                df = pd.DataFrame()
+            elif store is not None:
+                df = _read_snapshot(store, con, name)
+            if df is None:
+                df = pd.read_sql_query(f"SELECT * FROM {name}", con, index_col=KEY_COLUMN)
+            frames.append(schema.to_typed(_normalize_dates(df)))
+
+    inv, bank = frames
+    return inv, bank
+
+
+def _read_snapshot(
+    store: columnar.ColumnarStore,
+    con: sqlite3.Connection,
+    name: str,
+    **read_kwargs,
+) -> pd.DataFrame | None:
+    """``name`` from its Parquet snapshot, or ``None`` to read SQLite instead."""
+    snapshot = store.current(name)
+    if snapshot is None or snapshot.token != _generation(con, name):
+        # Written by a process that does not sync (or not yet), or first use.
+        snapshot = _sync_snapshot(store, con, name)
+    if snapshot is None:
+        return None
+    try:
+        return store.read(snapshot, **read_kwargs)
+    except OSError:
+        # Pruned by a newer version between lookup and read.
+        return None
+
+
+def load_dataset(
+    dataset: Literal["invoices", "bank_tx"],
+    columns: list[str] | None = None,
+    entity: str | None = None,
+    date_from: date | None = None,
+    date_to: date | None = None,
+) -> pd.DataFrame:
+    """Some columns of one dataset for one entity and date range, by ``row_id``.
+
+    Typed like ``load_data``, but neither cached nor given a derived
+    ``month``; ``columns`` names the stored (euro) columns. On the parquet backend the projection and filters are pushed
+    down into the reader, so only the entity's file and the selected
+    columns are touched; on SQLite they become the query. ``date_to`` is
+    inclusive.
+    """
+    if not DB_PATH.exists():
+        return pd.DataFrame()
+    started = time.perf_counter()
+    con = get_connection()
+    available = dataset_columns(con, dataset)
+    if not available:
+        return pd.DataFrame()
+    unknown = sorted(set(columns or ()) - set(available))
+    if unknown:
+        raise ValueError(f"Unknown columns for {dataset}: {', '.join(unknown)}")
+    upper = date_to + timedelta(days=1) if date_to is not None else None
+
+    store = _columnar_store()
+    # Without an entity column every row books to DEFAULT_ENTITY; leave that to SQL.
+    if store is not None and (not entity or "entity" in available):
+        filters = [
+            ("date", op, pd.Timestamp(bound))
+            for op, bound in ((">=", date_from), ("<", upper))
+            if bound is not None
+        ]
+        df = _read_snapshot(
+            store,
+            con,
+            dataset,
+            columns=columns,
+            entities=[entity] if entity else None,
+            filters=filters or None,
         )
-        bank = (
-            pd.read_sql_query("SELECT * FROM bank_tx", con)
-            if "bank_tx" in tables
-            else pd.DataFrame()
+        if df is not None:
+            _record_load("load_dataset", started, (dataset, df))
+            return schema.to_typed(_parse_dates(df))
+
+    select = [KEY_COLUMN] + [c for c in (columns or available) if c != KEY_COLUMN]
+    where, params = _kpi_filter(con, dataset, entity, date_from, date_to)
+    df = pd.read_sql_query(
+        "SELECT " + ", ".join(f'"{c}"' for c in select) + f" FROM {dataset} {where} ORDER BY {KEY_COLUMN}",
+        con,
+        index_col=KEY_COLUMN,
+        params=params,
+    )
+    _record_load("load_dataset", started, (dataset, df))
+    return schema.to_typed(_parse_dates(df))
+
+
+@dataclass
+class IncrementalBatch:
+    """Rows for an incremental reconciliation run.
+
+    ``invoices``/``bank`` hold the open rows that arrived after the stored
+    watermark (``since``) plus the open rows around them (see
+    ``load_incremental``). ``watermarks`` is the max rowid per dataset at
+    load time; it becomes the new watermark once the results are persisted.
+    """
+
+    invoices: pd.DataFrame
+    bank: pd.DataFrame
+    watermarks: dict[str, int] = field(default_factory=dict)
+    new_rows: dict[str, int] = field(default_factory=dict)
+    since: dict[str, int] = field(default_factory=dict)
+
+    def focus(self) -> Tuple[pd.Index, pd.Index]:
+        """Row ids of the new invoices and bank lines, for ``run_reconciliation``."""
+        return tuple(
+            df.index[df.index > self.since.get(name, 0)]
+            for name, df in (("invoices", self.invoices), ("bank_tx", self.bank))
         )
 
-    inv = _normalize_dates(inv)
-    bank = _normalize_dates(bank)
-    return inv, bank
+
+def get_watermarks() -> dict[str, int]:
+    if not DB_PATH.exists():
+        return {}
+    with get_connection() as con:
+        cur = con.execute(f"SELECT dataset, watermark FROM {WATERMARK_TABLE}")
+        return {name: int(mark) for name, mark in cur.fetchall()}
+
+
+def _clear_watermark(con: sqlite3.Connection, dataset: str):
+    con.execute(f"DELETE FROM {WATERMARK_TABLE} WHERE dataset = ?", (dataset,))
+
+
+def load_incremental(date_window_days: int) -> IncrementalBatch:
+    """Open rows that arrived since the last persisted incremental run.
+
+    Rows newer than the watermark are loaded together with the open items of
+    both datasets in the same entities whose date lies within twice
+    ``date_window_days`` of the new rows, so a run costs time in proportion
+    to the new data rather than the whole history. Any row that can pair
+    with a new row lies within one window of it, and that row's own
+    candidates within one more, so R1's "exactly one candidate" test sees
+    every candidate it would see in a full run. Run the batch with its
+    ``focus()`` so only matches involving a new row are kept.
+    """
+    if not db_has_data():
+        return IncrementalBatch(pd.DataFrame(), pd.DataFrame())
+
+    started = time.perf_counter()
+    open_filter = {
+        "invoices": "type = 'revenue' AND match_id IS NULL",
+        "bank_tx": "direction = 'in' AND match_id IS NULL",
+    }
+    marks = get_watermarks()
+    with get_connection() as con:
+        high = {
+            name: con.execute(f"SELECT COALESCE(MAX(row_id), 0) FROM {name}").fetchone()[0]
+            for name in DATASETS
+        }
+        new = {
+            name: pd.read_sql_query(
+                f"SELECT * FROM {name} "
+                f"WHERE row_id > ? AND row_id <= ? AND {open_filter[name]}",
+                con,
+                index_col=KEY_COLUMN,
+                params=(marks.get(name, 0), high[name]),
+            )
+            for name in DATASETS
+        }
+        new_rows = {name: len(df) for name, df in new.items()}
+
+        fresh = [_normalize_dates(df.copy()) for df in new.values() if not df.empty]
+        dates = pd.concat([df["date"] for df in fresh]).dropna() if fresh else pd.Series()
+        if not dates.empty:
+            window = 2 * pd.Timedelta(days=date_window_days)
+            lo = (dates.min() - window).strftime("%Y-%m-%d %H:%M:%S")
+            hi = (dates.max() + window).strftime("%Y-%m-%d %H:%M:%S")
+            entities = sorted(set(pd.concat([df["entity"] for df in fresh]).dropna()))
+            placeholders = ",".join("?" * len(entities))
+            frames = {
+                name: pd.read_sql_query(
+                    f"SELECT * FROM {name} "
+                    f"WHERE row_id <= ? AND {open_filter[name]} AND ("
+                    f"row_id > ? OR (date BETWEEN ? AND ? AND entity IN ({placeholders})))",
+                    con,
+                    index_col=KEY_COLUMN,
+                    params=(high[name], marks.get(name, 0), lo, hi, *entities),
+                )
+                for name in DATASETS
+            }
+        else:
+            frames = new
+
+    _record_load("load_incremental", started, *frames.items())
+    return IncrementalBatch(
+        invoices=schema.to_typed(_normalize_dates(frames["invoices"])),
+        bank=schema.to_typed(_normalize_dates(frames["bank_tx"])),
+        watermarks={name: int(mark) for name, mark in high.items()},
+        new_rows=new_rows,
+        since={name: marks.get(name, 0) for name in DATASETS},
+    )
+
+
+def persist_matches(
+    inv: pd.DataFrame, bank: pd.DataFrame, watermarks: dict[str, int] | None = None
+) -> dict[str, int]:
+    """Write ``match_id``/``status`` back for the matched rows (indexed by row_id).
+
+    Meant for frames from ``load_incremental``, where every row was open, so
+    only the rows that picked up a match are written. Runs in one transaction
+    together with the watermark update: a failed write leaves both the tables
+    and the watermarks untouched.
+    """
+    written = {}
+    with get_connection() as con:
+        for name, df in (("invoices", inv), ("bank_tx", bank)):
+            if df.empty:
+                written[name] = 0
+                continue
+            written[name] = _update_match_columns(con, name, df[df["match_id"].notna()])
+        if watermarks:
+            now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+            con.executemany(
+                f"INSERT INTO {WATERMARK_TABLE} (dataset, watermark, updated_at) "
+                "VALUES (?, ?, ?) ON CONFLICT(dataset) DO UPDATE SET "
+                "watermark = excluded.watermark, updated_at = excluded.updated_at",
+                [(name, int(mark), now) for name, mark in watermarks.items()],
+            )
+    bump_data_version()
+    return written
+
+
+def _update_match_columns(con: sqlite3.Connection, name: str, df: pd.DataFrame) -> int:
+    rows = [
+        (_sql_value(mid), _sql_value(status), int(rid))
+        for rid, mid, status in zip(df.index, df["match_id"], df["status"])
+    ]
+    if not rows:
+        return 0
+    # Move the changed rows' matched sums out of the aggregates and back in
+    # once they carry their new match_id.
+    changed = (
+        f"WHERE {KEY_COLUMN} IN (SELECT value FROM json_each(?))",
+        (json.dumps([row[2] for row in rows]),),
+    )
+    if name == "invoices":
+        _add_aggregates(con, name, *changed, measures=MATCH_MEASURES, sign=-1)
+    con.executemany(
+        f"UPDATE {name} SET match_id = ?, status = ? WHERE {KEY_COLUMN} = ?", rows
+    )
+    if name == "invoices":
+        _add_aggregates(con, name, *changed, measures=MATCH_MEASURES)
+    entities = None
+    if "entity" in dataset_columns(con, name):
+        entities = [
+            row[0]
+            for row in con.execute(f"SELECT DISTINCT entity FROM {name} {changed[0]}", changed[1])
+        ]
+    _touch(con, name, entities)
+    return len(rows)
+
+
+def _sql_value(value):
+    return None if pd.isna(value) else value
 
 
 def _normalize_dates(df: pd.DataFrame) -> pd.DataFrame:
@@ -61,7 +807,9 @@ def _normalize_dates(df: pd.DataFrame) -> pd.DataFrame:
         return df
     if "date" in df.columns:
         df["date"] = pd.to_datetime(df["date"])
-    if "month" not in df.columns and "date" in df.columns:
+    if "month" in df.columns:
+        df["month"] = pd.to_datetime(df["month"])
+    elif "date" in df.columns:
         df["month"] = df["date"].dt.to_period("M").dt.to_timestamp()
     return df
 
@@ -74,8 +822,18 @@ def _ensure_columns(df: pd.DataFrame, columns: Iterable[str]) -> pd.DataFrame:
 
 
 def reset_db():
+    # Tables are dropped rather than the file unlinked: other threads keep
+    # their open connections to the same database.
+    store = _columnar_store()
+    if store is not None:
+        store.clear()
     if DB_PATH.exists():
-        DB_PATH.unlink()
+        with get_connection() as con:
+            for name in _table_names(con):
+                if not name.startswith("sqlite_"):
+                    con.execute(f"DROP TABLE IF EXISTS {name}")
+            _ensure_schema(con)
+    bump_data_version()
 
 
 def load_sample_data() -> dict[str, int]:
@@ -93,26 +851,122 @@ def load_sample_data() -> dict[str, int]:
     inv_df = _ensure_columns(inv_df, ["match_id", "status", "invoice_no"])
     bank_df = _ensure_columns(bank_df, ["match_id", "status", "partner", "memo"])
 
+    inv_df, docs = _split_documents(inv_df, first_id=1)
     with get_connection() as con:
-        inv_df.to_sql("invoices", con, if_exists="replace", index=False)
-        bank_df.to_sql("bank_tx", con, if_exists="replace", index=False)
+        con.execute("BEGIN IMMEDIATE")
+        _replace_table(con, "invoices", inv_df)
+        _replace_table(con, "bank_tx", bank_df)
+        con.execute(f"DELETE FROM {DOCUMENT_TABLE}")
+        _write_documents(con, DOCUMENT_TABLE, docs)
+        for name in DATASETS:
+            _clear_watermark(con, name)
+            _touch(con, name)
+        _refresh_aggregates(con)
+    bump_data_version()
 
     return {"invoices": len(inv_df), "bank": len(bank_df)}
 
 
 def import_csv(dataset: Literal["invoices", "bank_tx"], file_bytes: bytes) -> int:
-    df = pd.read_csv(io.BytesIO(file_bytes), parse_dates=["date"])
+    return import_csv_stream(dataset, io.BytesIO(file_bytes))["rows"]
+
+
+def import_csv_stream(
+    dataset: Literal["invoices", "bank_tx"],
+    source: BinaryIO,
+    chunk_rows: int | None = None,
+) -> dict:
+    """Replace ``dataset`` with a CSV read from ``source`` in bounded chunks.
+
+    Each chunk is normalized and appended to a staging table; the staging
+    table is swapped in for the live one in a single transaction at the
+    end, so readers see either the old or the new data and memory use does
+    not grow with the file size. ``rss_growth_mb`` in the result is how far
+    resident memory rose above its level at the start, sampled after every
+    chunk (None where the platform does not report it).
+    """
+    chunk_rows = chunk_rows or get_settings().ingest_chunk_rows
+    # Named per import, so concurrent uploads never share a staging table.
+    suffix = uuid.uuid4().hex
+    staging = f"_staging_{dataset}_{suffix}"
+    staging_docs = f"_staging_{DOCUMENT_TABLE}_{suffix}" if dataset == "invoices" else None
+    started = time.perf_counter()
+    rows = 0
+    rss_start = rss_high = _current_rss_mb()
 
+    con = get_connection()
+    reader = pd.read_csv(source, parse_dates=["date"], chunksize=chunk_rows)
+    try:
+        for i, chunk in enumerate(reader):
+            chunk, docs = _prepare_import(dataset, chunk), []
+            if dataset == "invoices":
+                chunk, docs = _split_documents(chunk, first_id=rows + 1)
+            if i == 0:
+                with con:
+                    _create_table(con, staging, chunk)
+                    if staging_docs:
+                        _create_document_table(con, staging_docs)
+            chunk.to_sql(staging, con, if_exists="append", index=False)
+            if staging_docs:
+                with con:
+                    _write_documents(con, staging_docs, docs)
+            rows += len(chunk)
+            if rss_start is not None:
+                rss_high = max(rss_high, _current_rss_mb())
+        if rows == 0 and staging not in _table_names(con):
+            raise ValueError("CSV contains no header row")
+        with con:
+            con.execute("BEGIN IMMEDIATE")
+            con.execute(f"DROP TABLE IF EXISTS {dataset}")
+            con.execute(f"ALTER TABLE {staging} RENAME TO {dataset}")
+            if dataset == "invoices":
+                # Row ids restart with the new table; so do its documents.
+                con.execute(f"DELETE FROM {DOCUMENT_TABLE}")
+                con.execute(f"INSERT INTO {DOCUMENT_TABLE} SELECT * FROM {staging_docs}")
+                con.execute(f"DROP TABLE {staging_docs}")
+            _ensure_indexes(con, dataset)
+            _clear_watermark(con, dataset)
+            _touch(con, dataset)
+            _refresh_aggregates(con, (dataset,))
+    except Exception:
+        with con:
+            con.execute(f"DROP TABLE IF EXISTS {staging}")
+            if staging_docs:
+                con.execute(f"DROP TABLE IF EXISTS {staging_docs}")
+        raise
+    finally:
+        reader.close()
+    bump_data_version()
+
+    seconds = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None,
+        "rss_growth_mb": round(rss_high - rss_start, 1) if rss_start is not None else None,
+    }
+
+
+def _prepare_import(dataset: str, df: pd.DataFrame) -> pd.DataFrame:
+    df = df.drop(columns=[KEY_COLUMN], errors="ignore")
+    df["date"] = pd.to_datetime(df["date"])
     if dataset == "invoices":
         df["month"] = df["date"].dt.to_period("M").dt.to_timestamp()
         df = _ensure_columns(df, ["match_id", "status", "invoice_no", "type"])
     else:
         df = _ensure_columns(df, ["partner", "memo", "match_id", "status", "direction"])
         df["month"] = df["date"].dt.to_period("M").dt.to_timestamp()
+    return df
 
-    with get_connection() as con:
-        df.to_sql(dataset, con, if_exists="replace", index=False)
-    return len(df)
+
+def _current_rss_mb() -> float | None:
+    """Resident memory of this process now, where /proc reports it (Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
 
 
 def append_invoices(rows: pd.DataFrame) -> int:
@@ -121,15 +975,446 @@ def append_invoices(rows: pd.DataFrame) -> int:
     rows = _normalize_dates(rows.copy())
     rows["month"] = rows["date"].dt.to_period("M").dt.to_timestamp()
     rows = _ensure_columns(rows, ["match_id", "status", "invoice_no"])
+    rows = rows.drop(columns=[KEY_COLUMN], errors="ignore")
     with get_connection() as con:
-        rows.to_sql("invoices", con, if_exists="append", index=False)
+        # The write lock is taken before the last row id is read, so the ids
+        # given to rows and their documents cannot be claimed by another
+        # append; rows, documents, aggregates and generation commit together.
+        con.execute("BEGIN IMMEDIATE")
+        if "invoices" not in _table_names(con):
+            rows, docs = _split_documents(rows, first_id=1)
+            _replace_table(con, "invoices", rows)
+            con.execute(f"DELETE FROM {DOCUMENT_TABLE}")
+            _touch(con, "invoices")
+            _refresh_aggregates(con, ("invoices",))
+        else:
+            last = con.execute(f"SELECT MAX({KEY_COLUMN}) FROM invoices").fetchone()[0] or 0
+            rows, docs = _split_documents(rows, first_id=last + 1)
+            _add_missing_columns(con, "invoices", rows)
+            rows.insert(0, KEY_COLUMN, np.arange(last + 1, last + 1 + len(rows)))
+            _insert_rows(con, "invoices", rows)
+            _touch(con, "invoices", rows["entity"] if "entity" in rows.columns else None)
+            _add_aggregates(con, "invoices", f"WHERE {KEY_COLUMN} > ?", (last,))
+        _write_documents(con, DOCUMENT_TABLE, docs)
+    bump_data_version()
     return len(rows)
 
 
-def persist_frames(inv: pd.DataFrame, bank: pd.DataFrame):
+def known_invoices(
+    hashes: Iterable[str], numbers: Iterable[tuple[str, str]]
+) -> tuple[set[str], set[tuple[str, str]]]:
+    """The source file ``hashes`` and ``(partner, invoice_no)`` pairs already in the invoices."""
+    hashes, numbers = set(hashes), set(numbers)
+    if not DB_PATH.exists():
+        return set(), set()
+    con = get_connection()
+    present = dataset_columns(con, "invoices")
+    known_hashes: set[str] = set()
+    if hashes and SOURCE_HASH_COLUMN in present:
+        known_hashes = {
+            row[0]
+            for row in con.execute(
+                f"SELECT DISTINCT {SOURCE_HASH_COLUMN} FROM invoices "
+                f"WHERE {SOURCE_HASH_COLUMN} IN ({', '.join('?' * len(hashes))})",
+                list(hashes),
+            )
+        }
+    known_numbers: set[tuple[str, str]] = set()
+    invoice_nos = {number for _, number in numbers}
+    if invoice_nos and {"partner", "invoice_no"}.issubset(present):
+        known_numbers = numbers & {
+            (row[0], row[1])
+            for row in con.execute(
+                "SELECT DISTINCT partner, invoice_no FROM invoices "
+                f"WHERE invoice_no IN ({', '.join('?' * len(invoice_nos))})",
+                list(invoice_nos),
+            )
+        }
+    return known_hashes, known_numbers
+
+
+def _add_missing_columns(con: sqlite3.Connection, name: str, df: pd.DataFrame):
+    """Widen ``name`` with the columns of ``df`` it does not have yet (e.g. OCR fields)."""
+    present = dataset_columns(con, name)
+    for col, dtype in df.dtypes.items():
+        if col in present:
+            continue
+        sql_type = {"f": "REAL", "i": "INTEGER", "u": "INTEGER", "b": "INTEGER", "M": "TIMESTAMP"}
+        con.execute(f'ALTER TABLE {name} ADD COLUMN "{col}" {sql_type.get(dtype.kind, "TEXT")}')
+
+
+def persist_frames(inv: pd.DataFrame, bank: pd.DataFrame) -> dict[str, int]:
+    """Persist reconciliation results row by row.
+
+    The frames (indexed by ``row_id``, as returned by ``load_data``) are
+    diffed on ``match_id``/``status`` against what was loaded, and only the
+    changed rows are updated, all in one transaction: persist time follows
+    the number of matches, and a failed write leaves the tables intact.
+    """
+    changed = {}
     with get_connection() as con:
-        inv.to_sql("invoices", con, if_exists="replace", index=False)
-        bank.to_sql("bank_tx", con, if_exists="replace", index=False)
+        for name, df in (("invoices", inv), ("bank_tx", bank)):
+            changed[name] = _update_match_columns(con, name, _changed_rows(con, name, df))
+    bump_data_version()
+    return changed
+
+
+def _changed_rows(con: sqlite3.Connection, name: str, df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty or not set(MATCH_COLUMNS).issubset(df.columns):
+        return pd.DataFrame(columns=list(MATCH_COLUMNS))
+    new = df[list(MATCH_COLUMNS)]
+    base = _cached_match_columns(name)
+    if base is None:
+        base = pd.read_sql_query(
+            f"SELECT {KEY_COLUMN}, match_id, status FROM {name}", con, index_col=KEY_COLUMN
+        )
+    old = base.reindex(new.index)
+    changed = pd.Series(False, index=new.index)
+    for col in MATCH_COLUMNS:
+        # Compared as plain values: categoricals only compare on equal categories.
+        before, after = old[col].astype(object), new[col].astype(object)
+        changed |= ~((before == after) | (before.isna() & after.isna()))
+    return new[changed]
+
+
+def _cached_match_columns(name: str) -> pd.DataFrame | None:
+    with _cache_lock:
+        cached = _frame_cache.get(_data_version)
+    if cached is None:
+        return None
+    frame = cached[DATASETS.index(name)]
+    if not set(MATCH_COLUMNS).issubset(frame.columns):
+        return None
+    return frame[list(MATCH_COLUMNS)]
+
+
+@dataclass
+class DatasetQuery:
+    """Projection and filters for paging through a dataset in SQL.
+
+    ``month`` is ``YYYY-MM``; ``matched`` selects rows with or without a
+    ``match_id``. Pages are ordered by ``row_id`` or by ``(date, row_id)``.
+    """
+
+    dataset: Literal["invoices", "bank_tx"]
+    columns: list[str] | None = None
+    entity: str | None = None
+    month: str | None = None
+    status: str | None = None
+    matched: bool | None = None
+    order: Literal["row_id", "date"] = "row_id"
+
+
+def query_page(
+    query: DatasetQuery, cursor: str | None = None, limit: int = 1000
+) -> Tuple[pd.DataFrame, str | None]:
+    """One keyset page of ``query`` after ``cursor``, plus the next cursor."""
+    if not DB_PATH.exists():
+        return pd.DataFrame(), None
+    page, last = _read_page(get_connection(), query, cursor, limit)
+    return page, (last if len(page) == limit else None)
+
+
+def iter_pages(
+    query: DatasetQuery,
+    cursor: str | None = None,
+    batch_rows: int = 10_000,
+    limit: int | None = None,
+) -> Iterator[pd.DataFrame]:
+    """Stream ``query`` as DataFrames of at most ``batch_rows`` rows.
+
+    Every batch is its own keyset query, so no read transaction stays open
+    for the whole stream and memory stays bounded. Uses a private connection
+    because streaming responses are iterated from varying threads.
+    """
+    if not DB_PATH.exists():
+        return
+    con = _open_connection(DB_PATH, check_same_thread=False)
+    try:
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = batch_rows if remaining is None else min(batch_rows, remaining)
+            page, cursor = _read_page(con, query, cursor, size)
+            if page.empty:
+                break
+            yield page
+            if len(page) < size:
+                break
+            if remaining is not None:
+                remaining -= len(page)
+    finally:
+        con.close()
+
+
+def page_records(page: pd.DataFrame) -> list[dict]:
+    """Rows of a page as JSON-ready dicts: timestamps in ISO format, missing values None."""
+    return iso_dates(page).astype(object).where(page.notna(), None).to_dict("records")
+
+
+def pages_to_ndjson(pages: Iterable[pd.DataFrame]) -> Iterator[bytes]:
+    for page in pages:
+        yield iso_dates(page).to_json(orient="records", lines=True).encode()
+
+
+def iso_dates(page: pd.DataFrame) -> pd.DataFrame:
+    """``page`` with every timestamp column as ISO text; the one format all outputs share."""
+    dates = page.select_dtypes(include="datetime").columns
+    return page.assign(**{c: page[c].dt.strftime(ISO_DATE_FORMAT) for c in dates})
+
+
+def pages_to_arrow(query: DatasetQuery, pages: Iterable[pd.DataFrame]) -> Iterator[bytes]:
+    """Encode pages as one Arrow IPC stream; requires pyarrow.
+
+    The schema follows the declared SQLite column types, so every batch has
+    the same schema regardless of which values it happens to contain.
+    Match columns are always text: a table created before reconciliation
+    ran declares them REAL (all-null at creation).
+    """
+    try:
+        import pyarrow as pa
+    except ImportError as exc:
+        raise RuntimeError("Arrow output requires 'pyarrow' (see backend/requirements.txt)") from exc
+
+    declared = dataset_columns(get_connection(), query.dataset) if DB_PATH.exists() else {}
+    arrow_types = {"INTEGER": pa.int64(), "REAL": pa.float64(), "TIMESTAMP": pa.timestamp("ns")}
+
+    def encode() -> Iterator[bytes]:
+        buf = io.BytesIO()
+        writer = schema = None
+        for page in pages:
+            if writer is None:
+                schema = pa.schema(
+                    [
+                        (
+                            c,
+                            pa.string()
+                            if c in MATCH_COLUMNS
+                            else arrow_types.get(declared.get(c, "").upper(), pa.string()),
+                        )
+                        for c in page.columns
+                    ]
+                )
+                writer = pa.ipc.new_stream(buf, schema)
+            for field in schema:
+                if pa.types.is_timestamp(field.type):
+                    page[field.name] = pd.to_datetime(page[field.name])
+                elif pa.types.is_string(field.type):
+                    page[field.name] = page[field.name].astype("string")
+            writer.write_table(pa.Table.from_pandas(page, schema=schema, preserve_index=False))
+            yield _drain(buf)
+        if writer is not None:
+            writer.close()
+            yield _drain(buf)
+
+    return encode()
+
+
+def _drain(buf: io.BytesIO) -> bytes:
+    data = buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+    return data
+
+
+def dataset_columns(con: sqlite3.Connection, dataset: str) -> dict[str, str]:
+    """Column name -> declared SQLite type for ``dataset``."""
+    return {col[1]: col[2] for col in con.execute(f"PRAGMA table_info({dataset})")}
+
+
+def _read_page(
+    con: sqlite3.Connection, query: DatasetQuery, cursor: str | None, limit: int
+) -> Tuple[pd.DataFrame, str | None]:
+    """Rows of one keyset page and the cursor pointing after its last row."""
+    available = dataset_columns(con, query.dataset)
+    if not available:
+        return pd.DataFrame(), None
+    columns = query.columns or [c for c in available if c != KEY_COLUMN]
+    unknown = sorted(set(columns) - set(available))
+    if unknown:
+        raise ValueError(f"Unknown columns for {query.dataset}: {', '.join(unknown)}")
+    select = [KEY_COLUMN] + [c for c in columns if c != KEY_COLUMN]
+    if query.order == "date" and "date" not in select:
+        select.append("date")
+
+    where, params = [], []
+    if query.entity is not None:
+        where.append("entity = ?")
+        params.append(query.entity)
+    if query.month is not None:
+        try:
+            start = pd.Period(query.month, freq="M")
+        except ValueError as exc:
+            raise ValueError(f"Invalid month {query.month!r}, expected YYYY-MM") from exc
+        where.append("date >= ? AND date < ?")
+        params += [str(start.start_time), str((start + 1).start_time)]
+    if query.status is not None:
+        where.append("status = ?")
+        params.append(query.status)
+    if query.matched is not None:
+        where.append("match_id IS NOT NULL" if query.matched else "match_id IS NULL")
+    if cursor:
+        if query.order == "date":
+            date_key, _, rid = cursor.rpartition("|")
+            if date_key:
+                # NULL dates sort first, so they all lie before a dated cursor.
+                where.append(f"(date, {KEY_COLUMN}) > (?, ?)")
+                params += [_cursor_date(date_key), _cursor_int(rid)]
+            else:
+                where.append(f"(date IS NULL AND {KEY_COLUMN} > ?) OR date IS NOT NULL")
+                params.append(_cursor_int(rid))
+        else:
+            where.append(f"{KEY_COLUMN} > ?")
+            params.append(_cursor_int(cursor))
+
+    # Served by the (date, row_id) index, or (entity, date) under an entity filter.
+    order_by = f"date, {KEY_COLUMN}" if query.order == "date" else KEY_COLUMN
+    sql = (
+        "SELECT " + ", ".join(f'"{c}"' for c in select) + f" FROM {query.dataset}"
+        + (" WHERE " + " AND ".join(f"({w})" for w in where) if where else "")
+        + f" ORDER BY {order_by} LIMIT ?"
+    )
+    page = pd.read_sql_query(sql, con, params=params + [int(limit)])
+    for c in page.columns:
+        if available.get(c, "").upper() == "TIMESTAMP" or c == "date":
+            page[c] = pd.to_datetime(page[c])
+    last = None
+    if not page.empty:
+        last = str(int(page[KEY_COLUMN].iloc[-1]))
+        if query.order == "date":
+            last_date = page["date"].iloc[-1]
+            last = f"{'' if pd.isna(last_date) else last_date.strftime(ISO_DATE_FORMAT)}|{last}"
+    if query.order == "date" and "date" not in columns:
+        page = page.drop(columns=["date"])
+    return page, last
+
+
+def _cursor_date(value: str) -> str:
+    try:
+        return pd.Timestamp(value).strftime(STORED_DATE_FORMAT)
+    except ValueError as exc:
+        raise ValueError(f"Invalid cursor {value!r}") from exc
+
+
+def _cursor_int(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError as exc:
+        raise ValueError(f"Invalid cursor {value!r}") from exc
+
+
+@dataclass
+class MonthlyAggregates:
+    """What the reporting views need, without reading the datasets in full."""
+
+    # One row per (entity, month) with the AGGREGATE_MEASURES, money rounded
+    # to cents; '' marks a missing entity, NaT a missing month.
+    table: pd.DataFrame
+    # The five largest open revenue invoices, as full rows.
+    top_open_revenue: pd.DataFrame
+    currencies: list[str]
+    # Whether the invoices carry net_amount / vat_amount columns at all.
+    has_net_vat: bool
+
+
+def load_monthly_aggregates() -> MonthlyAggregates:
+    if not DB_PATH.exists():
+        return MonthlyAggregates(pd.DataFrame(), pd.DataFrame(), [], False)
+    started = time.perf_counter()
+    con = get_connection()
+    table = pd.read_sql_query(f"SELECT * FROM {AGGREGATE_TABLE}", con)
+    table["month"] = pd.to_datetime(table["month"].replace("", None))
+    # The running sums pick up float noise from every add and subtract.
+    money = [c for c in table.columns if c not in ("entity", "month") and not c.endswith("_count")]
+    table[money] = table[money].round(2)
+    columns = dataset_columns(con, "invoices")
+    top = pd.DataFrame()
+    if {"type", "match_id", "amount"}.issubset(columns):
+        top = pd.read_sql_query(
+            "SELECT * FROM invoices WHERE type = 'revenue' AND match_id IS NULL "
+            f"ORDER BY amount DESC, {KEY_COLUMN} LIMIT 5",
+            con,
+            index_col=KEY_COLUMN,
+        )
+        top = _normalize_dates(top).reset_index(drop=True)
+    currencies = []
+    if "currency" in columns:
+        rows = con.execute(
+            "SELECT DISTINCT currency FROM invoices WHERE currency IS NOT NULL"
+        ).fetchall()
+        currencies = sorted({str(row[0]) for row in rows})
+    _record_load("load_monthly_aggregates", started)
+    return MonthlyAggregates(
+        table=table,
+        top_open_revenue=top,
+        currencies=currencies,
+        has_net_vat={"net_amount", "vat_amount"}.issubset(columns),
+    )
+
+
+def kpi_totals(
+    entity: str | None = None,
+    date_from: date | None = None,
+    date_to: date | None = None,
+) -> dict[str, float]:
+    """Row counts and revenue sums behind the KPI tiles, computed in SQLite.
+
+    Without a date range they are read off the monthly aggregates; with one,
+    the datasets are filtered on their (entity, date) index. ``date_to`` is
+    inclusive.
+    """
+    totals = {"invoices_count": 0, "bank_count": 0, "revenue": 0.0, "matched_revenue": 0.0}
+    if not DB_PATH.exists():
+        return totals
+    con = get_connection()
+    if date_from is None and date_to is None:
+        where, params = ("WHERE entity = ?", (entity,)) if entity else ("", ())
+        row = con.execute(
+            "SELECT TOTAL(invoice_count), TOTAL(bank_count), TOTAL(revenue), "
+            f"TOTAL(matched_revenue) FROM {AGGREGATE_TABLE} {where}",
+            params,
+        ).fetchone()
+        return dict(zip(totals, (int(row[0]), int(row[1]), row[2], row[3])))
+
+    tables = _table_names(con)
+    invoice_measures = AGGREGATE_MEASURES["invoices"]
+    for name, count, measures in (
+        ("invoices", "invoices_count", ["revenue", "matched_revenue"]),
+        ("bank_tx", "bank_count", []),
+    ):
+        if name not in tables:
+            continue
+        where, params = _kpi_filter(con, name, entity, date_from, date_to)
+        row = con.execute(
+            "SELECT COUNT(*)"
+            + "".join(f", {invoice_measures[m]}" for m in measures)
+            + f" FROM {_measure_source(con, name, where)}",
+            params,
+        ).fetchone()
+        totals[count] = row[0]
+        totals.update(zip(measures, row[1:]))
+    return totals
+
+
+def _kpi_filter(
+    con: sqlite3.Connection,
+    name: str,
+    entity: str | None,
+    date_from: date | None,
+    date_to: date | None,
+) -> tuple[str, tuple]:
+    present = dataset_columns(con, name)
+    clauses, params = [], []
+    if entity:
+        clauses.append("entity = ?" if "entity" in present else f"'{DEFAULT_ENTITY}' = ?")
+        params.append(entity)
+    # Dates are stored as ISO text, so the range compares as strings.
+    if date_from is not None:
+        clauses.append("date >= ?")
+        params.append(date_from.isoformat())
+    if date_to is not None:
+        clauses.append("date < ?")
+        params.append((date_to + timedelta(days=1)).isoformat())
+    return ("WHERE " + " AND ".join(clauses) if clauses else ""), tuple(params)
 
 
 @dataclass
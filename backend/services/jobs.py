@@ -0,0 +1,381 @@
+from __future__ import annotations
+
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Any, Callable
+
+from backend import metrics
+from backend.config import get_settings
+
+from . import data_layer, parallel, reconciliation, sweep
+
+FINISHED = ("succeeded", "failed", "cancelled")
+KEEP_FINISHED = 50
+
+stats_log = logging.getLogger("backend.recon_stats")
+
+
+class JobConflict(RuntimeError):
+    """A job cannot start now: a persisting run is active or no worker is free."""
+
+
+def recon_workers() -> int:
+    """Processes for a parallel reconciliation: the setting, else every core."""
+    return get_settings().recon_workers or os.cpu_count() or 1
+
+
+def run_reconcile(params: dict, progress: Callable[[str, dict], None] | None = None) -> dict:
+    """Load, reconcile and optionally persist, as requested by ``/reconcile``."""
+    report = progress or (lambda stage, info: None)
+    report("loading", {})
+    focus = None
+    if params.get("incremental"):
+        batch = data_layer.load_incremental(params["date_window_days"])
+        inv, bank, focus = batch.invoices, batch.bank, batch.focus()
+    else:
+        inv, bank = data_layer.load_data()
+    settings_obj = reconciliation.ReconSettings(
+        date_window_days=params["date_window_days"],
+        amount_tolerance=params["amount_tolerance"],
+        psp_fee_abs=params["psp_fee_abs"],
+        psp_fee_pct=params["psp_fee_pct"] / 100.0,
+        only_psp_names=params["only_psp_names"],
+        persist=params["persist"],
+        max_batch_size=params["max_batch_size"],
+        batch_search_budget=params["batch_search_budget"],
+        workers=recon_workers() if params.get("parallel") else 1,
+        profile_memory=params.get("profile_memory", False),
+        assignment=params.get("assignment", "greedy"),
+    )
+    result = reconciliation.run_reconciliation(inv, bank, settings_obj, progress, focus)
+    if get_settings().recon_stats_log:
+        _log_stats(result.summary, params)
+    if params["persist"]:
+        report("persisting", {})
+    if params["persist"] and params.get("incremental"):
+        data_layer.persist_matches(result.invoices, result.bank, batch.watermarks)
+    elif params["persist"]:
+        data_layer.persist_frames(result.invoices, result.bank)
+    summary = result.summary.__dict__
+    summary["recent"] = result.summary.recent
+    response = {
+        "summary": summary,
+        "invoices": len(result.invoices),
+        "bank": len(result.bank),
+    }
+    if params.get("incremental"):
+        response["incremental"] = {
+            "new_rows": batch.new_rows,
+            "watermarks": batch.watermarks,
+        }
+    return response
+
+
+def run_inline(params: dict) -> dict:
+    """``run_reconcile`` in this process, recorded in the metrics."""
+    started = time.perf_counter()
+    try:
+        result = run_reconcile(params)
+    except Exception:
+        record_run("inline", "failed", time.perf_counter() - started)
+        raise
+    record_run("inline", "succeeded", time.perf_counter() - started, result)
+    return result
+
+
+def run_sweep(params: dict) -> dict:
+    """Per-rule counts and amounts for every point of a settings grid; nothing is persisted.
+
+    Fee percentages come in and go out in percent, as for ``run_reconcile``.
+    """
+    points = sweep.grid(
+        params["date_window_days"],
+        params["amount_tolerance"],
+        params["psp_fee_abs"],
+        [pct / 100.0 for pct in params["psp_fee_pct"]],
+        only_psp_names=params["only_psp_names"],
+        max_batch_size=params["max_batch_size"],
+        batch_search_budget=params["batch_search_budget"],
+        assignment=params.get("assignment", "greedy"),
+    )
+    started = time.perf_counter()
+    try:
+        inv, bank = data_layer.load_data()
+        workers = recon_workers() if params.get("parallel") else 1
+        result = sweep.run_sweep(inv, bank, points, workers)
+    except Exception:
+        metrics.RECON_SECONDS.observe(time.perf_counter() - started, mode="sweep", status="failed")
+        raise
+    for point in result["points"]:
+        point["settings"]["psp_fee_pct"] = round(point["settings"]["psp_fee_pct"] * 100, 10)
+    metrics.RECON_SECONDS.observe(time.perf_counter() - started, mode="sweep", status="succeeded")
+    return result
+
+
+def record_run(mode: str, status: str, seconds: float, result: dict | None = None):
+    metrics.RECON_SECONDS.observe(seconds, mode=mode, status=status)
+    if result is not None:
+        summary = result["summary"]
+        for rule, key in zip(reconciliation.RULES, ("total_rule1", "total_rule2", "total_rule3")):
+            metrics.RECON_MATCHES.inc(summary[key], rule=rule)
+
+
+def _log_stats(summary: reconciliation.ReconSummary, params: dict):
+    """One JSON line per rule and entity, then one for the whole run."""
+    if not stats_log.handlers:
+        # Own handler: the app configures no logging, and workers are fresh processes.
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        stats_log.addHandler(handler)
+        stats_log.setLevel(logging.INFO)
+        stats_log.propagate = False
+    for stage in summary.stages:
+        stats_log.info(json.dumps({"event": "recon_stage", **stage}))
+    stats_log.info(
+        json.dumps(
+            {
+                "event": "recon_run",
+                "seconds": summary.seconds,
+                "matches": [summary.total_rule1, summary.total_rule2, summary.total_rule3],
+                "rules": summary.rules,
+                "settings": {
+                    key: params.get(key)
+                    for key in ("date_window_days", "amount_tolerance", "psp_fee_abs", "psp_fee_pct")
+                },
+                "parallel": bool(params.get("parallel")),
+            }
+        )
+    )
+
+
+def _terminated(signum, frame):
+    raise SystemExit(128 + signum)
+
+
+def _worker(params: dict, db_path: str, conn) -> None:
+    """Entry point of a job process; everything goes back over ``conn``."""
+    # Unwind on cancel so the worker pool and shared memory are released.
+    signal.signal(signal.SIGTERM, _terminated)
+    data_layer.DB_PATH = Path(db_path)
+    try:
+        result = run_reconcile(params, lambda stage, info: conn.send(("progress", stage, info)))
+    except Exception as exc:
+        conn.send(("failed", f"{type(exc).__name__}: {exc}"))
+    else:
+        conn.send(("done", result))
+    finally:
+        conn.close()
+        parallel.shutdown_pool()
+
+
+@dataclass
+class Job:
+    id: str
+    params: dict
+    status: str = "running"
+    stage: str = "starting"
+    rules: dict = field(
+        default_factory=lambda: {rule: {"status": "pending"} for rule in reconciliation.RULES}
+    )
+    detail: dict = field(default_factory=dict)
+    result: dict | None = None
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    process: Any = field(default=None, repr=False)
+    conn: Any = field(default=None, repr=False)
+    cancel_requested: bool = field(default=False, repr=False)
+
+    @property
+    def persist(self) -> bool:
+        return bool(self.params.get("persist"))
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "rules": self.rules,
+            "detail": self.detail,
+            "persist": self.persist,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobRunner:
+    """Runs reconciliations in spawned worker processes and tracks their state.
+
+    Each worker reports progress and its result over its own pipe, drained
+    by a listener thread; a pipe per job means terminating one worker cannot
+    corrupt another's channel. At most ``max_running`` workers run at once, and only
+    one persisting reconciliation (background or inline) at any time.
+    """
+
+    def __init__(self, max_running: int):
+        self.max_running = max(1, max_running)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._listener: threading.Thread | None = None
+        self._jobs: dict[str, Job] = {}
+        self._persisting: str | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, params: dict) -> Job:
+        job = Job(id=uuid.uuid4().hex, params=params)
+        with self._lock:
+            running = sum(1 for j in self._jobs.values() if j.status == "running")
+            if running >= self.max_running:
+                raise JobConflict(f"{running} reconciliation jobs are already running")
+            if job.persist:
+                self._claim_persist(job.id)
+            job.conn, child_conn = self._ctx.Pipe(duplex=False)
+            job.process = self._ctx.Process(
+                target=_worker,
+                args=(params, str(data_layer.DB_PATH), child_conn),
+                name=f"recon-{job.id[:8]}",
+                # Not a daemon: parallel runs start their own worker pool.
+                daemon=False,
+            )
+            self._jobs[job.id] = job
+            self._prune()
+        try:
+            job.process.start()
+        except Exception as exc:
+            self._finish(job, "failed", error=f"{type(exc).__name__}: {exc}")
+        finally:
+            # Only the worker holds the sending end now: its exit reads as EOF.
+            child_conn.close()
+        self._ensure_listener()
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def list(self) -> list[Job]:
+        return sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+    def cancel(self, job_id: str) -> Job | None:
+        job = self._jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        job.cancel_requested = True
+        job.process.terminate()
+        job.process.join(5)
+        # A persist is one transaction, so a killed worker leaves nothing half
+        # written; its readers still need to drop what they cached.
+        self._finish(job, "cancelled")
+        return job
+
+    def shutdown(self):
+        """Terminate the running workers; they are not daemons and would hold up exit."""
+        for job in list(self._jobs.values()):
+            if job.status == "running":
+                self.cancel(job.id)
+
+    @contextmanager
+    def persist_slot(self, owner: str = "inline"):
+        """Hold the persisting slot for an inline reconciliation."""
+        with self._lock:
+            self._claim_persist(owner)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._persisting = None
+
+    def _claim_persist(self, owner: str):
+        if self._persisting is not None:
+            raise JobConflict("A persisting reconciliation is already running")
+        self._persisting = owner
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen, name="recon-jobs", daemon=True
+                )
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            running = {
+                job.conn: job
+                for job in list(self._jobs.values())
+                if job.status == "running" and job.conn is not None
+            }
+            if not running:
+                time.sleep(0.2)
+                continue
+            try:
+                ready = wait(list(running), timeout=0.5)
+            except (OSError, ValueError):
+                # A pipe was closed under us by cancel(); take a new snapshot.
+                continue
+            for conn in ready:
+                self._receive(running[conn])
+
+    def _receive(self, job: Job):
+        if job.status in FINISHED:
+            return
+        try:
+            kind, *payload = job.conn.recv()
+        except (EOFError, OSError):
+            # The worker went away without a result (cancelled, killed, out of memory...).
+            job.process.join(1)
+            if job.cancel_requested:
+                self._finish(job, "cancelled")
+            else:
+                self._finish(
+                    job, "failed", error=f"Worker exited with code {job.process.exitcode}"
+                )
+            return
+        if kind == "progress":
+            stage, info = payload
+            job.stage = stage
+            if stage in job.rules:
+                job.rules[stage].update(info)
+            else:
+                job.detail = info
+        elif kind == "done":
+            self._finish(job, "succeeded", result=payload[0])
+        else:
+            self._finish(job, "failed", error=payload[0])
+
+    def _finish(self, job: Job, status: str, result: dict | None = None, error: str | None = None):
+        with self._lock:
+            if job.status in FINISHED:
+                return
+            if job.persist:
+                # The worker wrote through its own connection; invalidate this
+                # process's frame and response caches before anyone can see
+                # the job finished.
+                data_layer.bump_data_version()
+            job.status = status
+            job.stage = status
+            job.result = result
+            job.error = error
+            job.finished_at = time.time()
+            if self._persisting == job.id:
+                self._persisting = None
+        record_run("background", status, job.finished_at - job.created_at, result)
+        job.conn.close()
+        if job.process is not None and job.process.pid is not None:
+            job.process.join(1)
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.status in FINISHED]
+        finished.sort(key=lambda j: j.finished_at or 0)
+        for job in finished[: max(0, len(finished) - KEEP_FINISHED)]:
+            del self._jobs[job.id]
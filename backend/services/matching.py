@@ -0,0 +1,548 @@
+from __future__ import annotations
+
+from typing import Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Upper bound on candidate pairs materialised at once by band_join.
+MAX_PAIRS_PER_CHUNK = 2_000_000
+
+NAT = np.iinfo(np.int64).min
+DAY_NS = 86_400 * 10**9
+# Left nodes solved at once by min_cost_assignment; larger components go in chunks.
+MAX_ASSIGNMENT_NODES = 200
+
+
+def to_cents(values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """Money as int64 cents plus a validity mask (False for missing amounts)."""
+    arr = pd.to_numeric(values, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    valid = np.isfinite(arr)
+    cents = np.zeros(len(arr), dtype=np.int64)
+    cents[valid] = np.rint(arr[valid] * 100).astype(np.int64)
+    return cents, valid
+
+
+def to_ns(values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """Datetimes as int64 nanoseconds plus a validity mask (False for NaT)."""
+    ns = pd.to_datetime(values).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    return ns, ns != NAT
+
+
+def entity_codes(left: pd.Series, right: pd.Series) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Factorize entity labels over both sides; missing entities get -1.
+
+    Returns the codes of each side and the label per code.
+    """
+    codes, labels = pd.factorize(pd.concat([left, right], ignore_index=True), use_na_sentinel=True)
+    return codes[: len(left)], codes[len(left):], np.asarray(labels)
+
+
+def entity_groups(
+    left_codes: np.ndarray, right_codes: np.ndarray
+) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+    """Yield (code, left positions, right positions) for entities present on both sides.
+
+    Positions inside each group keep their original (ascending) order.
+    """
+    l_order = np.argsort(left_codes, kind="stable")
+    r_order = np.argsort(right_codes, kind="stable")
+    l_sorted = left_codes[l_order]
+    r_sorted = right_codes[r_order]
+    for code in np.intersect1d(l_sorted, r_sorted):
+        if code < 0:
+            continue
+        l_lo, l_hi = np.searchsorted(l_sorted, [code, code + 1])
+        r_lo, r_hi = np.searchsorted(r_sorted, [code, code + 1])
+        yield int(code), l_order[l_lo:l_hi], r_order[r_lo:r_hi]
+
+
+def band_join(
+    sorted_keys: np.ndarray,
+    lo: np.ndarray,
+    hi: np.ndarray,
+    max_pairs: int = MAX_PAIRS_PER_CHUNK,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Sort-merge band join.
+
+    For every left row ``i`` yields the pairs ``(i, j)`` with
+    ``lo[i] <= sorted_keys[j] <= hi[i]``, where ``j`` indexes ``sorted_keys``.
+    Pairs come out ordered by ``i`` then ``j`` and are emitted in chunks of at
+    most ``max_pairs`` (a single left row with more candidates gets its own
+    chunk), so memory stays bounded on dense key ranges.
+    """
+    start = np.searchsorted(sorted_keys, lo, side="left")
+    stop = np.searchsorted(sorted_keys, hi, side="right")
+    counts = np.maximum(stop - start, 0)
+    if not counts.any():
+        return
+    ends = np.cumsum(counts)
+    n = len(counts)
+    first = 0
+    while first < n:
+        base = ends[first - 1] if first else 0
+        last = int(np.searchsorted(ends, base + max_pairs, side="right"))
+        last = max(last, first + 1)
+        c = counts[first:last]
+        total = int(c.sum())
+        if total:
+            left = np.repeat(np.arange(first, last), c)
+            offsets = np.arange(total) - np.repeat(np.cumsum(c) - c, c)
+            right = np.repeat(start[first:last], c) + offsets
+            yield left, right
+        first = last
+
+
+def unique_candidates(
+    inv_cents: np.ndarray,
+    inv_ns: np.ndarray,
+    bank_cents: np.ndarray,
+    bank_ns: np.ndarray,
+    tol_cents: int,
+    window_ns: int,
+    stats=None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """R1 kernel for one entity: invoices with exactly one bank candidate.
+
+    A bank row is a candidate when its amount lies within ``tol_cents`` of the
+    invoice and its date within ``window_ns``. Returns aligned (invoice, bank)
+    positions into the input arrays, ordered by invoice. ``stats`` (a
+    ``profiling.StageStats``) counts the pairs tested and the invoices skipped
+    for having several candidates.
+    """
+    order = np.argsort(bank_cents, kind="stable")
+    keys = bank_cents[order]
+    hits = np.zeros(len(inv_cents), dtype=np.int64)
+    partner = np.full(len(inv_cents), -1, dtype=np.int64)
+    for left, right in band_join(keys, inv_cents - tol_cents, inv_cents + tol_cents):
+        b = order[right]
+        ok = np.abs(bank_ns[b] - inv_ns[left]) <= window_ns
+        if stats is not None:
+            stats.candidate_pairs += len(left)
+        left, b = left[ok], b[ok]
+        hits += np.bincount(left, minlength=len(inv_cents))
+        partner[left] = b
+    if stats is not None:
+        stats.ambiguous_skipped += int(np.count_nonzero(hits > 1))
+    inv_pos = np.flatnonzero(hits == 1)
+    return inv_pos, partner[inv_pos]
+
+
+def fee_candidates(
+    inv_cents: np.ndarray,
+    inv_ns: np.ndarray,
+    bank_cents: np.ndarray,
+    bank_ns: np.ndarray,
+    window_ns: int,
+    fee_abs_cents: int,
+    fee_pct: float,
+    stats=None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """R2 kernel for one entity: PSP payouts net of a fee.
+
+    A pair qualifies when the bank line falls within ``window_ns`` of the
+    invoice and is net of a positive fee that is at most ``fee_abs_cents`` and
+    at most ``fee_pct`` of the invoice gross. The fee limits bound the bank
+    amount to a narrow band below the gross, so the join runs on amount and
+    the date window and exact fee test are applied to the surviving pairs.
+    Returns (invoice, bank) positions ordered by invoice, then bank position;
+    ``stats`` counts the pairs tested.
+    """
+    order = np.argsort(bank_cents, kind="stable")
+    keys = bank_cents[order]
+    max_fee = np.minimum(fee_abs_cents, np.ceil(np.maximum(inv_cents, 0) * fee_pct))
+    lo = inv_cents - max_fee.astype(np.int64)
+    hi = np.where(inv_cents > 0, inv_cents - 1, lo - 1)
+    inv_out, bank_out = [], []
+    for left, right in band_join(keys, lo, hi):
+        b = order[right]
+        gross = inv_cents[left]
+        fee = gross - bank_cents[b]
+        ok = (np.abs(bank_ns[b] - inv_ns[left]) <= window_ns) & (fee > 0) & (fee <= fee_abs_cents)
+        ok[ok] = fee[ok] / gross[ok] <= fee_pct
+        if stats is not None:
+            stats.candidate_pairs += len(left)
+        inv_out.append(left[ok])
+        bank_out.append(b[ok])
+    if not inv_out:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    inv_pos = np.concatenate(inv_out)
+    bank_pos = np.concatenate(bank_out)
+    order = np.lexsort((bank_pos, inv_pos))
+    return inv_pos[order], bank_pos[order]
+
+
+def first_free(left: np.ndarray, right: np.ndarray, stats=None) -> Tuple[np.ndarray, np.ndarray]:
+    """Greedy one-to-one assignment over pairs sorted by (left, preference).
+
+    Each left row, in order, takes its first right row not yet taken.
+    ``stats`` counts the left rows left over because all theirs were taken.
+    """
+    if len(left) == 0:
+        return left, right
+    # Fast path: when every left row's first choice is distinct nothing collides.
+    head = np.r_[True, left[1:] != left[:-1]]
+    if len(np.unique(right[head])) == int(head.sum()):
+        return left[head], right[head]
+    taken: set[int] = set()
+    out_l: list[int] = []
+    out_r: list[int] = []
+    last = -1
+    for l, r in zip(left.tolist(), right.tolist()):
+        if l == last or r in taken:
+            continue
+        taken.add(r)
+        last = l
+        out_l.append(l)
+        out_r.append(r)
+    if stats is not None:
+        stats.ambiguous_skipped += int(head.sum()) - len(out_l)
+    return np.asarray(out_l, dtype=np.int64), np.asarray(out_r, dtype=np.int64)
+
+
+def exact_pairs(
+    inv_cents: np.ndarray,
+    inv_ns: np.ndarray,
+    bank_cents: np.ndarray,
+    bank_ns: np.ndarray,
+    tol_cents: int,
+    window_ns: int,
+    stats=None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Every R1 candidate pair of one entity (see ``unique_candidates``).
+
+    Returns (invoice, bank) positions ordered by invoice, then bank position;
+    ``stats`` counts the pairs tested.
+    """
+    order = np.argsort(bank_cents, kind="stable")
+    keys = bank_cents[order]
+    inv_out, bank_out = [], []
+    for left, right in band_join(keys, inv_cents - tol_cents, inv_cents + tol_cents):
+        b = order[right]
+        ok = np.abs(bank_ns[b] - inv_ns[left]) <= window_ns
+        if stats is not None:
+            stats.candidate_pairs += len(left)
+        inv_out.append(left[ok])
+        bank_out.append(b[ok])
+    if not inv_out:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    inv_pos = np.concatenate(inv_out)
+    bank_pos = np.concatenate(bank_out)
+    order = np.lexsort((bank_pos, inv_pos))
+    return inv_pos[order], bank_pos[order]
+
+
+def pair_costs(
+    inv_cents: np.ndarray,
+    inv_ns: np.ndarray,
+    bank_cents: np.ndarray,
+    bank_ns: np.ndarray,
+    day_cost_cents: float,
+) -> np.ndarray:
+    """Cost of aligned (invoice, bank) pairs, in cents.
+
+    The amount difference (for a PSP payout: the fee) plus ``day_cost_cents``
+    per day between the two dates.
+    """
+    days = np.abs(bank_ns - inv_ns) / DAY_NS
+    return np.abs(inv_cents - bank_cents) + day_cost_cents * days
+
+
+def min_cost_assignment(
+    left: np.ndarray,
+    right: np.ndarray,
+    cost: np.ndarray,
+    left_key: np.ndarray | None = None,
+    max_nodes: int = MAX_ASSIGNMENT_NODES,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """One-to-one matching over candidate pairs: as many pairs as possible, then cheapest.
+
+    ``left``/``right``/``cost`` describe the sparse candidate graph, one
+    entry per pair. It is split into connected components; a component with
+    one node on either side takes its cheapest pair, the rest are solved
+    exactly (Hungarian method on the component's dense cost matrix). A
+    component with more than ``max_nodes`` left nodes is solved in chunks of
+    that many, in ``left_key`` order (e.g. invoice dates), each chunk on the
+    right nodes earlier chunks left over. Returns the chosen (left, right)
+    pairs ordered by left.
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if not len(left):
+        return empty, empty
+    left_nodes, li = np.unique(left, return_inverse=True)
+    right_nodes, ri = np.unique(right, return_inverse=True)
+    n_left = len(left_nodes)
+    label = _components(li, ri + n_left, n_left + len(right_nodes))
+    comp = label[li]
+    left_count = np.bincount(label[:n_left], minlength=len(label))
+    right_count = np.bincount(label[n_left:], minlength=len(label))
+    simple = np.minimum(left_count, right_count)[comp] == 1
+
+    # Cheapest pair per simple component; ties go to the lowest positions.
+    order = np.lexsort((ri, li, cost, comp))
+    order = order[simple[order]]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = comp[order][1:] != comp[order][:-1]
+    out_l, out_r = [li[order[first]]], [ri[order[first]]]
+
+    rest = np.flatnonzero(~simple)
+    rest = rest[np.argsort(comp[rest], kind="stable")]
+    bounds = np.flatnonzero(np.r_[True, comp[rest][1:] != comp[rest][:-1], True])
+    keys = left_key[left_nodes] if left_key is not None else np.arange(n_left)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        edges = rest[start:stop]
+        pl, pr = _solve_component(li[edges], ri[edges], cost[edges], keys, max_nodes)
+        out_l.append(pl)
+        out_r.append(pr)
+
+    sel_l = np.concatenate(out_l)
+    sel_r = np.concatenate(out_r)
+    order = np.argsort(sel_l, kind="stable")
+    return left_nodes[sel_l[order]], right_nodes[sel_r[order]]
+
+
+def _components(a: np.ndarray, b: np.ndarray, n: int) -> np.ndarray:
+    """Connected component label (its smallest node) per node of the graph with edges a-b.
+
+    Min-label hooking plus pointer jumping, so long chains settle in few
+    rounds.
+    """
+    label = np.arange(n)
+    while True:
+        low = np.minimum(label[a], label[b])
+        new = label.copy()
+        # Hook the endpoints and their current roots onto the smaller label.
+        for nodes in (a, b, label[a], label[b]):
+            np.minimum.at(new, nodes, low)
+        while True:
+            jumped = new[new]
+            if np.array_equal(jumped, new):
+                break
+            new = jumped
+        if np.array_equal(new, label):
+            return label
+        label = new
+
+
+def _solve_component(li, ri, cost, keys, max_nodes):
+    rows = np.unique(li)
+    if len(rows) > max_nodes:
+        rows = rows[np.argsort(keys[rows], kind="stable")]
+    taken = np.zeros(0, dtype=np.int64)
+    out_l, out_r = [], []
+    for start in range(0, len(rows), max_nodes):
+        chunk = rows[start:start + max_nodes]
+        keep = np.isin(li, chunk) & ~np.isin(ri, taken)
+        if not keep.any():
+            continue
+        pl, pr = _solve_dense(li[keep], ri[keep], cost[keep])
+        out_l.append(pl)
+        out_r.append(pr)
+        taken = np.concatenate([taken, pr])
+    if not out_l:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(out_l), np.concatenate(out_r)
+
+
+def _solve_dense(li, ri, cost):
+    """Exact min-cost maximum matching of one small component."""
+    rows, r_idx = np.unique(li, return_inverse=True)
+    cols, c_idx = np.unique(ri, return_inverse=True)
+    # A missing pair costs more than all real ones together, so the solver
+    # only uses one where no assignment of that row to a real pair exists.
+    big = float(cost.sum()) + 1.0
+    matrix = np.full((len(rows), len(cols)), big)
+    matrix[r_idx, c_idx] = cost
+    if len(rows) <= len(cols):
+        r_sel, c_sel = np.arange(len(rows)), _hungarian(matrix)
+    else:
+        c_sel, r_sel = np.arange(len(cols)), _hungarian(matrix.T)
+    real = matrix[r_sel, c_sel] < big
+    return rows[r_sel[real]], cols[c_sel[real]]
+
+
+def _hungarian(cost: np.ndarray) -> np.ndarray:
+    """Column assigned to each row in a min-cost assignment (rows <= columns).
+
+    Shortest augmenting paths with row/column potentials, O(rows^2 * columns);
+    the scan over the columns is vectorized.
+    """
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    # Column j (1-based; 0 is the virtual start) is assigned to row owner[j] (1-based, 0 free).
+    owner = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        owner[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            free = ~used
+            free[0] = False
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free[1:] & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            slack = np.where(free, minv, np.inf)
+            j1 = int(np.argmin(slack))
+            delta = slack[j1]
+            u[owner[used]] += delta
+            v[used] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+    assigned = np.empty(n, dtype=np.int64)
+    cols = np.flatnonzero(owner[1:])
+    assigned[owner[1:][cols] - 1] = cols
+    return assigned
+
+
+def batch_window(amounts: np.ndarray, lo: int, hi: int, max_size: int):
+    """Earliest contiguous run of ``amounts`` whose sum lies in ``[lo, hi]``.
+
+    ``amounts`` must be positive, which keeps the prefix sums strictly
+    increasing so every start position resolves with one searchsorted.
+    Returns ``(start, stop)`` or ``None``.
+    """
+    n = len(amounts)
+    prefix = np.concatenate(([0], np.cumsum(amounts)))
+    starts = np.arange(n)
+    stop = np.searchsorted(prefix, prefix[:-1] + lo, side="left")
+    stop = np.minimum(np.maximum(stop, starts + 1), n)
+    ok = (prefix[stop] - prefix[:-1] >= lo) & (prefix[stop] - prefix[:-1] <= hi)
+    ok &= stop - starts <= max_size
+    hit = np.flatnonzero(ok)
+    if not len(hit):
+        return None
+    return int(hit[0]), int(stop[hit[0]])
+
+
+def batch_subset(amounts: np.ndarray, lo: int, hi: int, max_size: int, budget: int):
+    """Bounded subset-sum search for a batch whose sum lies in ``[lo, hi]``.
+
+    Depth-first over the amounts in descending order, pruning branches that
+    overshoot ``hi`` or can no longer reach ``lo``. Gives up after ``budget``
+    nodes. Returns the chosen positions (ascending) or ``None``.
+    """
+    order = np.argsort(-amounts, kind="stable")
+    vals = amounts[order].tolist()
+    suffix = np.cumsum(amounts[order][::-1])[::-1].tolist()
+    n = len(vals)
+    picked: list[int] = []
+    nodes = 0
+
+    def dfs(start: int, total: int) -> bool:
+        nonlocal nodes
+        if picked and lo <= total <= hi:
+            return True
+        if len(picked) >= max_size:
+            return False
+        for k in range(start, n):
+            if total + suffix[k] < lo:
+                return False
+            nodes += 1
+            if nodes > budget:
+                return False
+            if total + vals[k] > hi:
+                continue
+            picked.append(k)
+            if dfs(k + 1, total + vals[k]):
+                return True
+            picked.pop()
+            if nodes > budget:
+                return False
+        return False
+
+    if not dfs(0, 0):
+        return None
+    return np.sort(order[picked])
+
+
+def batch_targets(
+    bank_cents: np.ndarray, tol_cents: int, fee_abs_cents: int, fee_pct: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Accepted gross range ``[lo, hi]`` per payout.
+
+    A batch is accepted when its gross is within tolerance of the payout, or
+    exceeds it by a fee no larger than ``fee_abs_cents`` and ``fee_pct`` of the
+    gross. Both conditions together cover one contiguous interval.
+    """
+    net = bank_cents
+    lo = net - tol_cents
+    if fee_pct < 1:
+        by_pct = np.floor(net / (1 - fee_pct) + 1e-6).astype(np.int64)
+    else:
+        by_pct = np.full(len(net), np.iinfo(np.int64).max)
+    fee_hi = np.where(net > 0, np.minimum(net + fee_abs_cents, by_pct), net)
+    hi = np.maximum(net + tol_cents, fee_hi)
+    return lo, hi
+
+
+def batch_matches(
+    inv_cents: np.ndarray,
+    inv_ns: np.ndarray,
+    bank_cents: np.ndarray,
+    bank_ns: np.ndarray,
+    window_ns: int,
+    tol_cents: int,
+    fee_abs_cents: int,
+    fee_pct: float,
+    max_size: int,
+    budget: int,
+    stats=None,
+) -> list[Tuple[int, np.ndarray]]:
+    """R3 kernel for one entity: many invoices settled by one payout.
+
+    Payouts are served in input order. For each, the open invoices within the
+    date window are tried first as contiguous date-ordered runs (prefix sums),
+    then with a bounded subset-sum search. Invoices claimed by an earlier
+    payout are not reused. Returns ``(bank position, invoice positions)``
+    with invoice positions in date order. ``stats`` counts the open invoices
+    tried per payout and the payouts left without a batch.
+    """
+    order = np.argsort(inv_ns, kind="stable")
+    keys = inv_ns[order]
+    amounts = inv_cents[order]
+    usable = amounts > 0
+    prefix = np.concatenate(([0], np.cumsum(np.where(usable, amounts, 0))))
+    start = np.searchsorted(keys, bank_ns - window_ns, side="left")
+    stop = np.searchsorted(keys, bank_ns + window_ns, side="right")
+    lo, hi = batch_targets(bank_cents, tol_cents, fee_abs_cents, fee_pct)
+    # Payouts whose window cannot reach the target even with every invoice open.
+    feasible = (stop > start) & (hi > 0) & (prefix[stop] - prefix[start] >= lo)
+
+    claimed = ~usable
+    out = []
+    for b in np.flatnonzero(feasible).tolist():
+        s, e = int(start[b]), int(stop[b])
+        free = np.flatnonzero(~claimed[s:e]) + s
+        if not len(free):
+            continue
+        cand = amounts[free]
+        b_lo, b_hi = int(lo[b]), int(hi[b])
+        if int(cand.sum()) < b_lo:
+            continue
+        if stats is not None:
+            stats.candidate_pairs += len(free)
+        run = batch_window(cand, b_lo, b_hi, max_size)
+        if run is not None:
+            chosen = free[run[0]:run[1]]
+        else:
+            picked = batch_subset(cand, b_lo, b_hi, max_size, budget)
+            if picked is None:
+                if stats is not None:
+                    stats.ambiguous_skipped += 1
+                continue
+            chosen = free[picked]
+        claimed[chosen] = True
+        out.append((b, order[chosen]))
+    return out
@@ -2,16 +2,30 @@ from __future__ import annotations
 
 import base64
 import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
 from functools import lru_cache
 from pathlib import Path
-from typing import Iterable, List
+from typing import Any, Callable, Iterable, List
 
 import pandas as pd
+from google.api_core import exceptions as api_exceptions
+from google.api_core.retry import if_transient_error
 from google.cloud import documentai as docai
 from google.oauth2 import service_account
 
+from backend import metrics
 from backend.config import get_settings
 
+from . import data_layer
+from .ocr_cache import OcrCache, content_key, get_ocr_cache
+
+log = logging.getLogger(__name__)
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 DEFAULT_KEY_PATH = BASE_DIR / "tug-docai-key.json"
 
@@ -81,8 +95,8 @@ def _processor_name() -> str:
     return f"projects/{settings.docai_project_id}/locations/{settings.docai_location}/processors/{settings.docai_processor_id}"
 
 
-def process_invoice_document(content: bytes, filename: str) -> dict:
-    client = get_docai_client()
+def process_invoice_document(content: bytes, filename: str, client=None) -> dict:
+    client = client or get_docai_client()
     raw_document = docai.RawDocument(content=content, mime_type=_guess_mime_type(filename))
     request = {"name": _processor_name(), "raw_document": raw_document}
     result = client.process_document(request=request)
@@ -124,13 +138,197 @@ def document_to_rows(ocr_doc: dict) -> list[dict]:
     return [row]
 
 
-def process_files(files: Iterable[tuple[str, bytes]]) -> pd.DataFrame:
-    rows: list[dict] = []
-    for filename, content in files:
-        document = process_invoice_document(content, filename)
-        rows.extend(document_to_rows(document))
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+@lru_cache
+def get_rate_limiter() -> TokenBucket:
+    """The process-wide limiter, so concurrent scans share one quota."""
+    settings = get_settings()
+    return TokenBucket(settings.ocr_rate_per_sec, settings.ocr_burst)
+
+
+@dataclass
+class OcrResult:
+    filename: str
+    rows: List[dict] = field(default_factory=list)
+    error: str | None = None
+    attempts: int = 0
+    # Served from the OCR cache.
+    cached: bool = False
+    # Already in the invoices (same file, or same partner and invoice number)
+    # or repeated earlier in the batch.
+    duplicate: bool = False
+
+
+def _is_transient(exc: Exception) -> bool:
+    return if_transient_error(exc) or isinstance(
+        exc, (api_exceptions.DeadlineExceeded, api_exceptions.GatewayTimeout)
+    )
+
+
+def _scan_one(
+    filename: str,
+    content: bytes,
+    key: str,
+    get_client: Callable[[], Any],
+    limiter: TokenBucket,
+    cache: OcrCache | None,
+) -> OcrResult:
+    settings = get_settings()
+    result = OcrResult(filename)
+    try:
+        # Inside the per-file guard: a misconfigured processor fails the file, not the batch.
+        processor = _processor_name()
+        if cache is not None:
+            document = cache.get(key, processor)
+            metrics.CACHE_REQUESTS.inc(cache="ocr", result="miss" if document is None else "hit")
+            if document is not None:
+                result.rows = document_to_rows(document)
+                result.cached = True
+                return result
+    except Exception as exc:
+        result.error = f"{type(exc).__name__}: {exc}"
+        return result
+    while True:
+        limiter.acquire()
+        result.attempts += 1
+        started = time.perf_counter()
+        try:
+            document = process_invoice_document(content, filename, get_client())
+            result.rows = document_to_rows(document)
+            metrics.OCR_LATENCY.observe(time.perf_counter() - started, outcome="ok")
+            break
+        except Exception as exc:  # isolate per file: one bad PDF must not fail the batch
+            transient = _is_transient(exc)
+            metrics.OCR_LATENCY.observe(time.perf_counter() - started, outcome="error")
+            metrics.OCR_ERRORS.inc(kind="transient" if transient else "permanent")
+            if not transient or result.attempts > settings.ocr_max_retries:
+                result.error = f"{type(exc).__name__}: {exc}"
+                return result
+        # Exponential backoff with full jitter.
+        delay = min(
+            settings.ocr_backoff_max,
+            settings.ocr_backoff_base * 2 ** (result.attempts - 1),
+        )
+        time.sleep(random.uniform(0, delay))
+    if cache is not None:
+        try:
+            cache.put(key, processor, document)
+        except Exception:  # the file was read; only its cache entry is lost
+            log.warning("Could not cache the OCR result of %s", filename, exc_info=True)
+    return result
+
+
+def scan_files(
+    files: Iterable[tuple[str, bytes]],
+    client=None,
+    workers: int | None = None,
+    limiter: TokenBucket | None = None,
+    cache: OcrCache | None | bool = True,
+) -> list[OcrResult]:
+    """OCR ``files`` concurrently, one result per file in input order.
+
+    Files already in the OCR cache are answered from it; identical files in
+    one batch are processed once. Files whose content or (partner, invoice
+    number) the invoices table already holds are flagged as duplicates. At
+    most ``workers`` requests are in flight and every attempt, retries
+    included, takes a token from ``limiter``.
+    Transient Document AI errors are retried with exponential backoff;
+    anything else is reported on the file's result. ``client`` replaces the
+    Document AI client, e.g. with a local fake; the real one is only built
+    once a file misses the cache. ``cache=False`` bypasses the cache.
+    """
+    files = list(files)
+    if not files:
+        return []
+    if cache is True:
+        cache = get_ocr_cache()
+    cache = cache or None
+    get_client = (lambda: client) if client is not None else get_docai_client
+    limiter = limiter or get_rate_limiter()
+
+    keys = [content_key(content) for _, content in files]
+    first_of: dict[str, int] = {}
+    unique = []
+    for key, (filename, content) in zip(keys, files):
+        if key not in first_of:
+            first_of[key] = len(unique)
+            unique.append((filename, content, key))
+
+    workers = max(1, min(workers or get_settings().ocr_workers, len(unique)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr") as pool:
+        scanned = list(
+            pool.map(lambda item: _scan_one(*item, get_client, limiter, cache), unique)
+        )
+    for (_, _, key), result in zip(unique, scanned):
+        for row in result.rows:
+            row[data_layer.SOURCE_HASH_COLUMN] = key
+    _flag_known(scanned)
+
+    results = []
+    seen = set()
+    for key, (filename, _) in zip(keys, files):
+        result = scanned[first_of[key]]
+        if key in seen:
+            # A repeat within the batch: same rows, flagged as a duplicate.
+            result = replace(result, filename=filename, duplicate=True, attempts=0)
+        seen.add(key)
+        results.append(result)
+    return results
+
+
+def _flag_known(results: list[OcrResult]):
+    """Flag the results the invoices table already holds, by file or by invoice number."""
+    def numbers(result: OcrResult) -> set[tuple[str, str]]:
+        return {(row["partner"], row["invoice_no"]) for row in result.rows if row["invoice_no"]}
+
+    known_hashes, known_numbers = data_layer.known_invoices(
+        (row[data_layer.SOURCE_HASH_COLUMN] for r in results for row in r.rows),
+        (number for r in results for number in numbers(r)),
+    )
+    for result in results:
+        result.duplicate = bool(result.rows) and (
+            result.rows[0][data_layer.SOURCE_HASH_COLUMN] in known_hashes
+            or bool(numbers(result) & known_numbers)
+        )
+
+
+def results_to_frame(
+    results: Iterable[OcrResult], skip_duplicates: bool = False
+) -> pd.DataFrame:
+    rows = [
+        row
+        for result in results
+        if not (skip_duplicates and result.duplicate)
+        for row in result.rows
+    ]
     if not rows:
         return pd.DataFrame()
     return pd.DataFrame(rows)
 
 
+def process_files(files: Iterable[tuple[str, bytes]]) -> pd.DataFrame:
+    return results_to_frame(scan_files(files))
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from functools import lru_cache
+from pathlib import Path
+
+from backend.config import get_settings
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CACHE_PATH = BASE_DIR / "ocr_cache.db"
+
+
+def content_key(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class OcrCache:
+    """Parsed Document AI output keyed by (sha256 of the file, processor).
+
+    Documents are stored zlib-compressed in their own SQLite file, so the
+    cache survives restarts and resets of the main database. Once the stored
+    payloads exceed ``max_bytes`` the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_documents ("
+            "sha256 TEXT NOT NULL, processor TEXT NOT NULL, size INTEGER NOT NULL, "
+            "payload BLOB NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (sha256, processor))"
+        )
+        self._con.execute(
+            "CREATE INDEX IF NOT EXISTS ix_ocr_documents_last_used ON ocr_documents (last_used)"
+        )
+        self._con.commit()
+
+    def get(self, sha256: str, processor: str) -> dict | None:
+        with self._lock:
+            row = self._con.execute(
+                "SELECT payload FROM ocr_documents WHERE sha256 = ? AND processor = ?",
+                (sha256, processor),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._con.execute(
+                "UPDATE ocr_documents SET last_used = ? WHERE sha256 = ? AND processor = ?",
+                (time.time(), sha256, processor),
+            )
+            self._con.commit()
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, sha256: str, processor: str, document: dict):
+        payload = zlib.compress(json.dumps(document).encode(), 6)
+        if len(payload) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._con.execute(
+                "INSERT OR REPLACE INTO ocr_documents "
+                "(sha256, processor, size, payload, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (sha256, processor, len(payload), payload, now, now),
+            )
+            self._evict()
+            self._con.commit()
+
+    def _evict(self):
+        total = self._con.execute("SELECT TOTAL(size) FROM ocr_documents").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for sha256, processor, size in self._con.execute(
+            "SELECT sha256, processor, size FROM ocr_documents ORDER BY last_used"
+        ):
+            victims.append((sha256, processor))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self._con.executemany(
+            "DELETE FROM ocr_documents WHERE sha256 = ? AND processor = ?", victims
+        )
+        self.evictions += len(victims)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._con.execute(
+                "SELECT COUNT(*), TOTAL(size) FROM ocr_documents"
+            ).fetchone()
+        return {
+            "entries": entries,
+            "bytes": int(size),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._con.execute("DELETE FROM ocr_documents")
+            self._con.commit()
+
+
+@lru_cache
+def get_ocr_cache() -> OcrCache | None:
+    """The configured cache, or None when it is disabled (max bytes of 0)."""
+    settings = get_settings()
+    if settings.ocr_cache_max_bytes <= 0:
+        return None
+    return OcrCache(settings.ocr_cache_path or DEFAULT_CACHE_PATH, settings.ocr_cache_max_bytes)
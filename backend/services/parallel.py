@@ -0,0 +1,303 @@
+"""Entity-partitioned reconciliation in a process pool.
+
+Every rule only pairs invoices and bank lines of the same entity, so the
+whole R1 -> R2 -> R3 pipeline runs independently per entity. The open rows
+are sorted by entity into one shared-memory block; workers map the block,
+slice their entity out of it without copying and send back positions only.
+``map_entities`` runs any such per-entity function (parameter sweeps use it
+too).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from multiprocessing import get_context
+from multiprocessing.pool import Pool
+from multiprocessing.shared_memory import SharedMemory
+from typing import TYPE_CHECKING, Callable, Tuple
+
+import numpy as np
+import pandas as pd
+
+from . import matching, profiling
+
+if TYPE_CHECKING:
+    from .reconciliation import ReconSettings
+
+_pool: Pool | None = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class SharedArrays:
+    """Name of a shared-memory block and where each array sits inside it."""
+
+    name: str
+    layout: tuple  # (key, dtype, byte offset, length) per array
+
+    @classmethod
+    def create(cls, arrays: dict[str, np.ndarray]) -> Tuple[SharedMemory, "SharedArrays"]:
+        layout, size = [], 0
+        for key, arr in arrays.items():
+            size = -(-size // 8) * 8
+            layout.append((key, arr.dtype.str, size, len(arr)))
+            size += arr.nbytes
+        shm = SharedMemory(create=True, size=max(size, 1))
+        for key, dtype, offset, length in layout:
+            np.ndarray(length, dtype, shm.buf, offset)[:] = arrays[key]
+        return shm, cls(shm.name, tuple(layout))
+
+    def views(self, shm: SharedMemory) -> dict[str, np.ndarray]:
+        return {
+            key: np.ndarray(length, dtype, shm.buf, offset)
+            for key, dtype, offset, length in self.layout
+        }
+
+
+def entity_rules(
+    inv_cents: np.ndarray,
+    inv_ns: np.ndarray,
+    bank_cents: np.ndarray,
+    bank_ns: np.ndarray,
+    bank_psp: np.ndarray,
+    settings: "ReconSettings",
+):
+    """R1 -> R2 -> R3 for the open rows of one entity, in frame order.
+
+    Each rule sees what the previous ones left open, exactly like the serial
+    path. Returns (R1 pairs, R2 pairs, R3 batches) as local positions and the
+    ``profiling.StageStats`` of each rule.
+    """
+    # Imported here: reconciliation imports this module.
+    from .reconciliation import RULES, rule1_pairs, rule2_pairs
+
+    memory = settings.profile_memory
+    stages = []
+    window_ns = pd.Timedelta(days=settings.date_window_days).value
+    tol_cents = int(round(settings.amount_tolerance * 100))
+    fee_abs_cents = int(round(settings.psp_fee_abs * 100))
+    inv_open = np.ones(len(inv_cents), dtype=bool)
+    bank_open = np.ones(len(bank_cents), dtype=bool)
+
+    stage = profiling.StageStats(RULES[0], invoice_rows=len(inv_cents), bank_rows=len(bank_cents))
+    with profiling.measure(stage, memory):
+        rule1 = rule1_pairs(inv_cents, inv_ns, bank_cents, bank_ns, settings, stage)
+    stage.matches = len(rule1[0])
+    stages.append(stage)
+    inv_open[rule1[0]] = False
+    bank_open[rule1[1]] = False
+
+    rule2 = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    ip, bp = np.flatnonzero(inv_open), np.flatnonzero(bank_open & bank_psp)
+    if len(ip) and len(bp):
+        stage = profiling.StageStats(RULES[1], invoice_rows=len(ip), bank_rows=len(bp))
+        with profiling.measure(stage, memory):
+            i_sel, b_sel = rule2_pairs(
+                inv_cents[ip], inv_ns[ip], bank_cents[bp], bank_ns[bp], settings, stage
+            )
+        stage.matches = len(i_sel)
+        stages.append(stage)
+        rule2 = (ip[i_sel], bp[b_sel])
+        inv_open[rule2[0]] = False
+        bank_open[rule2[1]] = False
+
+    rule3 = []
+    ip, bp = np.flatnonzero(inv_open), np.flatnonzero(bank_open)
+    if len(ip) and len(bp):
+        stage = profiling.StageStats(RULES[2], invoice_rows=len(ip), bank_rows=len(bp))
+        with profiling.measure(stage, memory):
+            batches = matching.batch_matches(
+                inv_cents[ip], inv_ns[ip], bank_cents[bp], bank_ns[bp],
+                window_ns,
+                tol_cents,
+                fee_abs_cents,
+                settings.psp_fee_pct,
+                settings.max_batch_size,
+                settings.batch_search_budget,
+                stage,
+            )
+        stage.matches = len(batches)
+        stages.append(stage)
+        rule3 = [(int(bp[b_sel]), ip[i_sel]) for b_sel, i_sel in batches]
+    return rule1, rule2, rule3, stages
+
+
+def _run_entity(task):
+    """Pool task: one entity, read straight from the shared block."""
+    key, fn, block, inv_span, bank_span, arg = task
+    shm = SharedMemory(name=block.name)
+    arrays = None
+    try:
+        arrays = block.views(shm)
+        (i0, i1), (b0, b1) = inv_span, bank_span
+        return key, fn(
+            arrays["inv_cents"][i0:i1],
+            arrays["inv_ns"][i0:i1],
+            arrays["bank_cents"][b0:b1],
+            arrays["bank_ns"][b0:b1],
+            arrays["bank_psp"][b0:b1],
+            arg,
+        )
+    finally:
+        # Views pin the buffer; drop them before unmapping.
+        arrays = None
+        shm.close()
+
+
+def _partition(codes: np.ndarray):
+    """Stable order grouping ``codes`` by entity, and each entity's span in it.
+
+    Rows with code -1 (no entity, amount or date) can never match and are
+    left out.
+    """
+    order = np.argsort(codes, kind="stable")
+    order = order[codes[order] >= 0]
+    present, starts, counts = np.unique(codes[order], return_index=True, return_counts=True)
+    spans = {int(c): (int(s), int(s + n)) for c, s, n in zip(present, starts, counts)}
+    return order, spans
+
+
+def _size(span) -> int:
+    return span[1] - span[0]
+
+
+def _watch_parent(parent_pid: int):
+    """Pool initializer: exit once the process that owns the pool is gone.
+
+    A cancelled job can be killed outright, which would otherwise leave its
+    pool workers waiting for tasks forever.
+    """
+
+    def watch():
+        while os.getppid() == parent_pid:
+            time.sleep(0.5)
+        os._exit(1)
+
+    threading.Thread(target=watch, name="parent-watch", daemon=True).start()
+
+
+def get_pool(workers: int) -> Pool:
+    """The shared worker pool, (re)created when the requested size changes.
+
+    Pool workers are daemons: they never hold up exit and ``terminate``
+    stops them mid-task.
+    """
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size != workers:
+            if _pool is not None:
+                _pool.terminate()
+            _pool = get_context("spawn").Pool(
+                workers, initializer=_watch_parent, initargs=(os.getpid(),)
+            )
+            _pool_size = workers
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.terminate()
+            _pool = None
+
+
+def map_entities(
+    inv_a: dict,
+    bank_a: dict,
+    bank_psp: np.ndarray,
+    fn: Callable,
+    arg,
+    workers: int,
+    progress: Callable[[int, int], None] | None = None,
+):
+    """``fn(inv_cents, inv_ns, bank_cents, bank_ns, bank_psp, arg)`` per entity.
+
+    ``inv_a`` / ``bank_a`` are the side arrays of the open rows (cents, ns,
+    entity codes) and ``bank_psp`` marks the bank lines R2 may use. ``fn``
+    runs on up to ``workers`` processes (so it and ``arg`` must pickle) and
+    gets each entity's rows in frame order. Returns the entity codes, the
+    output per code, and per side the partition order and each code's span
+    in it, which the local positions ``fn`` returns refer to.
+    ``progress(done, total)`` follows the entities as they finish.
+    """
+    inv_order, inv_spans = _partition(inv_a["entity"])
+    bank_order, bank_spans = _partition(bank_a["entity"])
+    codes = [c for c in inv_spans if c in bank_spans]
+    # Largest entities first so a big one does not start last and trail.
+    codes.sort(key=lambda c: -_size(inv_spans[c]) * _size(bank_spans[c]))
+
+    arrays = {
+        "inv_cents": inv_a["cents"][inv_order],
+        "inv_ns": inv_a["ns"][inv_order],
+        "bank_cents": bank_a["cents"][bank_order],
+        "bank_ns": bank_a["ns"][bank_order],
+        "bank_psp": bank_psp[bank_order],
+    }
+    if workers <= 1 or len(codes) <= 1:
+        outputs = []
+        for code in codes:
+            (i0, i1), (b0, b1) = inv_spans[code], bank_spans[code]
+            outputs.append(
+                fn(
+                    *(arrays[k][i0:i1] for k in ("inv_cents", "inv_ns")),
+                    *(arrays[k][b0:b1] for k in ("bank_cents", "bank_ns", "bank_psp")),
+                    arg,
+                )
+            )
+            if progress is not None:
+                progress(len(outputs), len(codes))
+    else:
+        outputs = _run_pool(arrays, codes, inv_spans, bank_spans, fn, arg, workers, progress)
+    return codes, outputs, (inv_order, inv_spans), (bank_order, bank_spans)
+
+
+def run_partitioned(
+    inv_a: dict,
+    bank_a: dict,
+    bank_psp: np.ndarray,
+    settings: "ReconSettings",
+    workers: int,
+    progress: Callable[[int, int], None] | None = None,
+):
+    """All three rules, entity by entity, on up to ``workers`` processes.
+
+    Arguments as for ``map_entities``. Returns R1 hits, R2 hits and R3
+    batches as positions into the side arrays, in the shapes the serial
+    rules build, and the stage stats with the entity code as their entity.
+    """
+    codes, outputs, (inv_order, inv_spans), (bank_order, bank_spans) = map_entities(
+        inv_a, bank_a, bank_psp, entity_rules, settings, workers, progress
+    )
+    rule1, rule2, rule3, stages = [], [], [], []
+    for code, (r1, r2, r3, entity_stages) in zip(codes, outputs):
+        i0, b0 = inv_spans[code][0], bank_spans[code][0]
+        for hits, (i_sel, b_sel) in ((rule1, r1), (rule2, r2)):
+            hits.append((inv_order[i_sel + i0], bank_order[b_sel + b0]))
+        rule3.extend((int(bank_order[b + b0]), inv_order[i + i0]) for b, i in r3)
+        for stage in entity_stages:
+            stage.entity = code
+            stages.append(stage)
+    return rule1, rule2, rule3, stages
+
+
+def _run_pool(arrays, codes, inv_spans, bank_spans, fn, arg, workers, progress):
+    shm, block = SharedArrays.create(arrays)
+    try:
+        tasks = [
+            (k, fn, block, inv_spans[c], bank_spans[c], arg) for k, c in enumerate(codes)
+        ]
+        outputs = [None] * len(codes)
+        results = get_pool(workers).imap_unordered(_run_entity, tasks)
+        for done, (key, output) in enumerate(results, 1):
+            outputs[key] = output
+            if progress is not None:
+                progress(done, len(codes))
+        return outputs
+    finally:
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,86 @@
+"""Per-stage statistics for reconciliation runs.
+
+One ``StageStats`` covers one rule on one entity. Wall time and the counters
+are always collected; peak memory only when asked for, since it needs
+``tracemalloc``, which slows every allocation down while it traces.
+"""
+
+from __future__ import annotations
+
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Iterable, Iterator
+
+
+@dataclass
+class StageStats:
+    rule: str
+    entity: str | None = None
+    seconds: float = 0.0
+    invoice_rows: int = 0
+    bank_rows: int = 0
+    # Pairs the kernel looked at (after the amount join, before the other tests).
+    candidate_pairs: int = 0
+    # R1: invoices with more than one candidate. R2: invoices whose every
+    # candidate was claimed by an earlier one. R3: payouts no batch was found for.
+    # With optimal assignment (R1/R2): invoices with candidates left unassigned.
+    ambiguous_skipped: int = 0
+    matches: int = 0
+    # What the greedy rule would have matched on the same candidates; only
+    # set when the stage ran the optimal assignment.
+    greedy_matches: int | None = None
+    # Peak of the memory allocated during the stage; None unless traced.
+    peak_mb: float | None = None
+
+    def to_dict(self) -> dict:
+        out = asdict(self)
+        out["seconds"] = round(self.seconds, 6)
+        return out
+
+
+@contextmanager
+def measure(stats: StageStats, memory: bool = False) -> Iterator[StageStats]:
+    """Add the wall time of the block to ``stats``, and its memory peak if ``memory``.
+
+    Memory is only traced when nothing else is tracing already, so an outer
+    ``tracemalloc`` user (e.g. the benchmark runner) keeps its own peak.
+    """
+    traced = memory and not tracemalloc.is_tracing()
+    if traced:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.seconds += time.perf_counter() - started
+        if traced:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            stats.peak_mb = round(max(stats.peak_mb or 0.0, peak / 2**20), 3)
+
+
+def totals(stages: Iterable[StageStats], rules: Iterable[str]) -> dict[str, dict]:
+    """Per rule: the stage counters and times summed, the largest memory peak."""
+    out = {}
+    stages = list(stages)
+    for rule in rules:
+        mine = [s for s in stages if s.rule == rule]
+        peaks = [s.peak_mb for s in mine if s.peak_mb is not None]
+        greedy = [s.greedy_matches for s in mine if s.greedy_matches is not None]
+        matches = sum(s.matches for s in mine)
+        out[rule] = {
+            "entities": len(mine),
+            "seconds": round(sum(s.seconds for s in mine), 6),
+            "invoice_rows": sum(s.invoice_rows for s in mine),
+            "bank_rows": sum(s.bank_rows for s in mine),
+            "candidate_pairs": sum(s.candidate_pairs for s in mine),
+            "ambiguous_skipped": sum(s.ambiguous_skipped for s in mine),
+            "matches": matches,
+            "peak_mb": max(peaks) if peaks else None,
+        }
+        if greedy:
+            out[rule]["greedy_matches"] = sum(greedy)
+            out[rule]["extra_matches"] = matches - sum(greedy)
+    return out
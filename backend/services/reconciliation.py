@@ -1,11 +1,17 @@
 from __future__ import annotations
 
+import time
 from dataclasses import dataclass, field
-from typing import Any, List
+from typing import Any, Callable, List, Tuple
 
 import numpy as np
 import pandas as pd
 
+from . import matching, parallel, profiling, schema
+
+
+RULES = ("R1 exact", "R2 fee", "R3 batch")
+
 
 @dataclass
 class ReconSettings:
@@ -15,6 +21,19 @@ class ReconSettings:
     psp_fee_pct: float = 0.04
     only_psp_names: bool = True
     persist: bool = False
+    max_batch_size: int = 50
+    batch_search_budget: int = 2000
+    # Processes for the entity-partitioned mode; 1 runs the rules serially.
+    workers: int = 1
+    # Trace each stage's memory peak (tracemalloc; slows the run down).
+    profile_memory: bool = False
+    # "optimal": R1 and R2 take a min-cost one-to-one assignment over all
+    # their candidate pairs instead of the greedy rules below.
+    assignment: str = "greedy"
+    # Cost of a day between invoice and bank date, against cents of amount
+    # difference or fee.
+    assignment_day_cost: float = 100.0
+    assignment_max_nodes: int = matching.MAX_ASSIGNMENT_NODES
 
 
 @dataclass
@@ -23,6 +42,11 @@ class ReconSummary:
     total_rule2: int
     total_rule3: int
     recent: list[dict[str, Any]] = field(default_factory=list)
+    # Wall time of the whole run, and per rule and entity the work it took
+    # (see profiling.StageStats), plus those summed per rule.
+    seconds: float = 0.0
+    stages: list[dict[str, Any]] = field(default_factory=list)
+    rules: dict[str, dict] = field(default_factory=dict)
 
 
 @dataclass
@@ -32,35 +56,6 @@ class ReconResult:
     summary: ReconSummary
 
 
-def fee_ok(gross, net, fee_abs_max, fee_pct_max):
-    gross = float(gross)
-    net = float(net)
-    fee = round(gross - net, 2)
-    if fee <= 0:
-        return False, 0.0
-    if fee <= fee_abs_max and (gross > 0) and (fee / gross) <= fee_pct_max:
-        return True, fee
-    return False, 0.0
-
-
-def greedy_many_to_one(open_rows, target_net, tol, fee_abs_max, fee_pct_max):
-    rows = open_rows.sort_values("date")
-    picked, gross_sum = [], 0.0
-    for idx, r in rows.iterrows():
-        if pd.notna(r.get("match_id")) and str(r.get("match_id")) != "":
-            continue
-        amt = float(r["amount"])
-        if gross_sum + amt <= target_net + fee_abs_max:
-            picked.append(int(idx))
-            gross_sum += amt
-        if abs(gross_sum - target_net) <= tol:
-            return picked, gross_sum, 0.0, True
-        ok, fee = fee_ok(gross_sum, target_net, fee_abs_max, fee_pct_max)
-        if ok:
-            return picked, gross_sum, fee, True
-    return [], 0.0, 0.0, False
-
-
 def ensure_columns(inv: pd.DataFrame, bank: pd.DataFrame):
     for c in ["match_id", "status", "invoice_no"]:
         if c not in inv.columns:
@@ -71,7 +66,308 @@ def ensure_columns(inv: pd.DataFrame, bank: pd.DataFrame):
     return inv, bank
 
 
-def run_reconciliation(inv: pd.DataFrame, bank: pd.DataFrame, settings: ReconSettings) -> ReconResult:
+def _mark(frame: pd.DataFrame, labels: list, match_ids: list, status: str):
+    if not labels:
+        return
+    for col in ("match_id", "status"):
+        values = frame[col]
+        if col == "status" and isinstance(values.dtype, pd.CategoricalDtype):
+            if status not in values.cat.categories:
+                frame[col] = values.cat.add_categories([status])
+        elif values.dtype != object:
+            frame[col] = values.astype(object)
+    frame.loc[labels, "match_id"] = match_ids
+    frame.loc[labels, "status"] = status
+
+
+def rule1_pairs(inv_cents, inv_ns, bank_cents, bank_ns, settings: ReconSettings, stage):
+    """R1 on one entity's open rows: matched (invoice, bank) positions, by invoice.
+
+    Greedy: an invoice matches when exactly one bank line qualifies. Optimal:
+    the min-cost assignment over all qualifying pairs, with the greedy count
+    kept in ``stage.greedy_matches`` for comparison.
+    """
+    tol_cents = int(round(settings.amount_tolerance * 100))
+    window_ns = pd.Timedelta(days=settings.date_window_days).value
+    if settings.assignment != "optimal":
+        return matching.unique_candidates(
+            inv_cents, inv_ns, bank_cents, bank_ns, tol_cents, window_ns, stage
+        )
+    i_all, b_all = matching.exact_pairs(
+        inv_cents, inv_ns, bank_cents, bank_ns, tol_cents, window_ns, stage
+    )
+    counts = np.bincount(i_all, minlength=len(inv_cents))
+    stage.greedy_matches = int(np.count_nonzero(counts == 1))
+    return _assign(i_all, b_all, inv_cents, inv_ns, bank_cents, bank_ns, settings, stage)
+
+
+def rule2_pairs(inv_cents, inv_ns, bank_cents, bank_ns, settings: ReconSettings, stage):
+    """R2 on one entity's open rows (PSP lines only): matched positions, by invoice.
+
+    Greedy: invoices in order each take their first qualifying bank line
+    that is still free. Optimal: as for ``rule1_pairs``.
+    """
+    window_ns = pd.Timedelta(days=settings.date_window_days).value
+    fee_abs_cents = int(round(settings.psp_fee_abs * 100))
+    i_all, b_all = matching.fee_candidates(
+        inv_cents, inv_ns, bank_cents, bank_ns,
+        window_ns, fee_abs_cents, settings.psp_fee_pct, stage,
+    )
+    if settings.assignment != "optimal":
+        return matching.first_free(i_all, b_all, stage)
+    stage.greedy_matches = len(matching.first_free(i_all, b_all)[0])
+    return _assign(i_all, b_all, inv_cents, inv_ns, bank_cents, bank_ns, settings, stage)
+
+
+def _assign(i_all, b_all, inv_cents, inv_ns, bank_cents, bank_ns, settings, stage):
+    cost = matching.pair_costs(
+        inv_cents[i_all], inv_ns[i_all], bank_cents[b_all], bank_ns[b_all],
+        settings.assignment_day_cost,
+    )
+    i_sel, b_sel = matching.min_cost_assignment(
+        i_all, b_all, cost, inv_ns, settings.assignment_max_nodes
+    )
+    stage.ambiguous_skipped += len(np.unique(i_all)) - len(i_sel)
+    return i_sel, b_sel
+
+
+def _rule1_exact(inv_u: pd.DataFrame, bank_u: pd.DataFrame, settings: ReconSettings, stages: list):
+    """R1: per-entity sort-merge join on integer cents within the date window.
+
+    An invoice matches when exactly one open bank line qualifies (or, with
+    ``assignment="optimal"``, by min-cost assignment; see ``rule1_pairs``).
+    """
+    inv_a, bank_a, labels = _side_arrays(inv_u, bank_u)
+
+    hits = []
+    for code, i_pos, b_pos in matching.entity_groups(inv_a["entity"], bank_a["entity"]):
+        stage = _stage("R1 exact", labels[code], i_pos, b_pos)
+        with profiling.measure(stage, settings.profile_memory):
+            i_sel, b_sel = rule1_pairs(
+                inv_a["cents"][i_pos], inv_a["ns"][i_pos],
+                bank_a["cents"][b_pos], bank_a["ns"][b_pos],
+                settings, stage,
+            )
+        stage.matches = len(i_sel)
+        stages.append(stage)
+        hits.append((i_pos[i_sel], b_pos[b_sel]))
+    return _pairs_to_matches(inv_u, bank_u, hits, "M")
+
+
+def _rule2_fee(inv_u: pd.DataFrame, bank_u: pd.DataFrame, settings: ReconSettings, stages: list):
+    """R2: per-entity date-window interval join with a vectorized PSP fee test.
+
+    Invoices are served in frame order and each takes the first qualifying
+    bank line (in frame order) that no earlier invoice has claimed, unless
+    ``assignment="optimal"`` (see ``rule2_pairs``).
+    """
+    inv_a, bank_a, labels = _side_arrays(inv_u, bank_u)
+
+    hits = []
+    for code, i_pos, b_pos in matching.entity_groups(inv_a["entity"], bank_a["entity"]):
+        stage = _stage("R2 fee", labels[code], i_pos, b_pos)
+        with profiling.measure(stage, settings.profile_memory):
+            i_sel, b_sel = rule2_pairs(
+                inv_a["cents"][i_pos], inv_a["ns"][i_pos],
+                bank_a["cents"][b_pos], bank_a["ns"][b_pos],
+                settings, stage,
+            )
+        stage.matches = len(i_sel)
+        stages.append(stage)
+        hits.append((i_pos[i_sel], b_pos[b_sel]))
+    return _pairs_to_matches(inv_u, bank_u, hits, "F")
+
+
+def _rule3_batch(inv_u: pd.DataFrame, bank_u: pd.DataFrame, settings: ReconSettings, stages: list):
+    """R3: one payout settling a batch of open invoices (Stripe/Adyen style).
+
+    Payouts are served in frame order; see ``matching.batch_matches``.
+    """
+    inv_a, bank_a, labels = _side_arrays(inv_u, bank_u)
+    window_ns = pd.Timedelta(days=settings.date_window_days).value
+
+    found = []
+    for code, i_pos, b_pos in matching.entity_groups(inv_a["entity"], bank_a["entity"]):
+        stage = _stage("R3 batch", labels[code], i_pos, b_pos)
+        with profiling.measure(stage, settings.profile_memory):
+            batches = matching.batch_matches(
+                inv_a["cents"][i_pos], inv_a["ns"][i_pos],
+                bank_a["cents"][b_pos], bank_a["ns"][b_pos],
+                window_ns,
+                int(round(settings.amount_tolerance * 100)),
+                int(round(settings.psp_fee_abs * 100)),
+                settings.psp_fee_pct,
+                settings.max_batch_size,
+                settings.batch_search_budget,
+                stage,
+            )
+        stage.matches = len(batches)
+        stages.append(stage)
+        found.extend((int(b_pos[b_sel]), i_pos[i_sel]) for b_sel, i_sel in batches)
+    return _batches_to_matches(inv_u, bank_u, found)
+
+
+def _stage(rule: str, entity, i_pos: np.ndarray, b_pos: np.ndarray) -> profiling.StageStats:
+    return profiling.StageStats(
+        rule, entity=str(entity), invoice_rows=len(i_pos), bank_rows=len(b_pos)
+    )
+
+
+def _batches_to_matches(inv_u: pd.DataFrame, bank_u: pd.DataFrame, found):
+    found = sorted(found, key=lambda m: m[0])
+    bank_labels = bank_u.index[[b for b, _ in found]].tolist()
+    matches = []
+    for b_idx, (_, inv_positions) in zip(bank_labels, found):
+        ids = inv_u.index[inv_positions].tolist()
+        mid = f"B{b_idx}-" + ",".join(map(str, ids))
+        matches.append((ids, b_idx, mid))
+    return matches
+
+
+def _side_arrays(inv_u: pd.DataFrame, bank_u: pd.DataFrame):
+    """Cents, nanosecond dates and entity codes for both sides, and the entity per code.
+
+    Rows with a missing amount or date get entity code -1 so they never join.
+    """
+    inv_codes, bank_codes, labels = matching.entity_codes(inv_u["entity"], bank_u["entity"])
+    out = []
+    for frame, codes in ((inv_u, inv_codes), (bank_u, bank_codes)):
+        cents, amount_ok = schema.money_cents(frame, "amount")
+        ns, date_ok = matching.to_ns(frame["date"])
+        out.append(
+            dict(cents=cents, ns=ns, entity=np.where(amount_ok & date_ok, codes, -1))
+        )
+    return out[0], out[1], labels
+
+
+def _pairs_to_matches(inv_u: pd.DataFrame, bank_u: pd.DataFrame, hits, prefix: str):
+    hits = [h for h in hits if len(h[0])]
+    if not hits:
+        return []
+    inv_hits = np.concatenate([h[0] for h in hits])
+    bank_hits = np.concatenate([h[1] for h in hits])
+    order = np.argsort(inv_hits, kind="stable")
+    inv_labels = inv_u.index[inv_hits[order]]
+    bank_labels = bank_u.index[bank_hits[order]]
+    return [(i, b, f"{prefix}{i}-{b}") for i, b in zip(inv_labels, bank_labels)]
+
+
+def _psp_mask(bank_u: pd.DataFrame, settings: ReconSettings) -> pd.Series | None:
+    """Bank lines R2 may use when ``only_psp_names`` is set, else None."""
+    if settings.only_psp_names and ("partner" in bank_u.columns or "memo" in bank_u.columns):
+        txtcol = "partner" if "partner" in bank_u.columns else "memo"
+        return schema.str_contains(
+            bank_u[txtcol],
+            r"stripe|adyen|mollie|paypal|checkout\.com|braintree",
+            case=False,
+        )
+    return None
+
+
+def _record(inv, bank, recent, rule: str, matches, bank_status: str) -> int:
+    """Write one rule's (invoice, bank, match id) matches into both frames."""
+    for i_idx, b_idx, mid in matches:
+        recent.append(dict(rule=rule, inv_id=i_idx, bank_id=b_idx, match_id=mid))
+    _mark(inv, [m[0] for m in matches], [m[2] for m in matches], "Matched")
+    _mark(bank, [m[1] for m in matches], [m[2] for m in matches], bank_status)
+    return len(matches)
+
+
+def _record_batches(inv, bank, recent, batch_matches) -> int:
+    for ids, b_idx, mid in batch_matches:
+        recent.append(
+            dict(rule="R3 batch", inv_ids=",".join(map(str, ids)), bank_id=b_idx, match_id=mid)
+        )
+    _mark(
+        inv,
+        [i for ids, _, _ in batch_matches for i in ids],
+        [mid for ids, _, mid in batch_matches for _ in ids],
+        "Matched",
+    )
+    _mark(bank, [m[1] for m in batch_matches], [m[2] for m in batch_matches], "Matched (batch)")
+    return len(batch_matches)
+
+
+def _focused(matches: list, focus) -> list:
+    """The (invoice(s), bank, match id) matches touching a focus row; all without focus."""
+    if focus is None:
+        return matches
+    inv_focus, bank_focus = (set(labels) for labels in focus)
+    return [
+        m for m in matches
+        if m[1] in bank_focus
+        or any(i in inv_focus for i in (m[0] if isinstance(m[0], list) else [m[0]]))
+    ]
+
+
+def _report(progress: Callable[[str, dict], None] | None, rule: str, **info):
+    if progress is not None:
+        progress(rule, info)
+
+
+def _run_partitioned(inv, bank, inv_u, bank_u, settings, progress) -> ReconResult:
+    """All rules per entity in a process pool (see ``parallel``).
+
+    The rules never pair across entities, so running R1 -> R2 -> R3 entity by
+    entity and merging gives exactly the serial matches, ids and order.
+    """
+    for rule in RULES:
+        _report(progress, rule, status="running")
+    inv_a, bank_a, labels = _side_arrays(inv_u, bank_u)
+    psp = _psp_mask(bank_u, settings)
+    bank_psp = np.ones(len(bank_u), dtype=bool) if psp is None else psp.to_numpy(dtype=bool)
+
+    def entities_done(done: int, total: int):
+        _report(progress, "entities", done=done, total=total)
+
+    hits1, hits2, found, stages = parallel.run_partitioned(
+        inv_a, bank_a, bank_psp, settings, settings.workers, entities_done
+    )
+    # Workers report entity codes.
+    for stage in stages:
+        stage.entity = str(labels[stage.entity])
+
+    recent: List[dict[str, Any]] = []
+    matches = _pairs_to_matches(inv_u, bank_u, hits1, "M")
+    total_rule1 = _record(inv, bank, recent, "R1 exact", matches, "Matched")
+    psp_matches = _pairs_to_matches(inv_u, bank_u, hits2, "F")
+    total_rule2 = _record(inv, bank, recent, "R2 fee", psp_matches, "Matched (fee)")
+    total_rule3 = _record_batches(inv, bank, recent, _batches_to_matches(inv_u, bank_u, found))
+    for rule, total in zip(RULES, (total_rule1, total_rule2, total_rule3)):
+        _report(progress, rule, status="done", matches=total)
+
+    summary = ReconSummary(total_rule1, total_rule2, total_rule3, recent=recent)
+    return ReconResult(invoices=inv, bank=bank, summary=_with_stats(summary, stages))
+
+
+def _with_stats(summary: ReconSummary, stages: list) -> ReconSummary:
+    stages = sorted(stages, key=lambda st: (RULES.index(st.rule), st.entity))
+    summary.stages = [stage.to_dict() for stage in stages]
+    summary.rules = profiling.totals(stages, RULES)
+    return summary
+
+
+def run_reconciliation(
+    inv: pd.DataFrame,
+    bank: pd.DataFrame,
+    settings: ReconSettings,
+    progress: Callable[[str, dict], None] | None = None,
+    focus: Tuple[pd.Index, pd.Index] | None = None,
+) -> ReconResult:
+    """Run the three rules in order; ``progress(rule, info)`` is told as each starts and ends.
+
+    With ``focus`` (invoice and bank labels), a rule's matches are only
+    kept when they involve one of those rows; the other rows are context
+    that only competes for them. Incremental runs focus on the new rows and
+    always run serially: their batches are small.
+    """
+    started = time.perf_counter()
+    result = _reconcile(inv, bank, settings, progress, focus)
+    result.summary.seconds = round(time.perf_counter() - started, 6)
+    return result
+
+
+def _reconcile(inv, bank, settings, progress, focus=None) -> ReconResult:
     if inv.empty or bank.empty:
         return ReconResult(
             invoices=inv,
@@ -83,105 +379,39 @@ def run_reconciliation(inv: pd.DataFrame, bank: pd.DataFrame, settings: ReconSet
     bank = bank.copy()
     inv, bank = ensure_columns(inv, bank)
 
-    date_window = pd.Timedelta(days=settings.date_window_days)
-
     total_rule1 = total_rule2 = total_rule3 = 0
     recent: List[dict[str, Any]] = []
+    stages: List[profiling.StageStats] = []
 
     inv_u = inv[(inv.get("type") == "revenue") & (inv["match_id"].isna())].copy()
     bank_u = bank[(bank.get("direction") == "in") & (bank["match_id"].isna())].copy()
 
-    matches = []
-    for i_idx, irow in inv_u.iterrows():
-        cands = bank_u[
-            (bank_u["entity"] == irow["entity"])
-            & (
-                bank_u["amount"].round(2).between(
-                    round(irow["amount"] - settings.amount_tolerance, 2),
-                    round(irow["amount"] + settings.amount_tolerance, 2),
-                )
-            )
-            & ((bank_u["date"] - irow["date"]).abs() <= date_window)
-        ]
-        if len(cands) == 1:
-            b_idx = cands.index[0]
-            mid = f"M{i_idx}-{b_idx}"
-            matches.append((i_idx, b_idx, mid))
+    if settings.workers > 1 and focus is None:
+        return _run_partitioned(inv, bank, inv_u, bank_u, settings, progress)
 
-    for i_idx, b_idx, mid in matches:
-        inv.loc[i_idx, ["match_id", "status"]] = [mid, "Matched"]
-        bank.loc[b_idx, ["match_id", "status"]] = [mid, "Matched"]
-        recent.append(dict(rule="R1 exact", inv_id=i_idx, bank_id=b_idx, match_id=mid))
-    total_rule1 = len(matches)
+    _report(progress, "R1 exact", status="running")
+    matches = _focused(_rule1_exact(inv_u, bank_u, settings, stages), focus)
+    total_rule1 = _record(inv, bank, recent, "R1 exact", matches, "Matched")
+    _report(progress, "R1 exact", status="done", matches=total_rule1)
 
     inv_u2 = inv[(inv.get("type") == "revenue") & (inv["match_id"].isna())].copy()
     bank_u2 = bank[(bank.get("direction") == "in") & (bank["match_id"].isna())].copy()
+    psp = _psp_mask(bank_u2, settings)
+    if psp is not None:
+        bank_u2 = bank_u2[psp]
 
-    if settings.only_psp_names and ("partner" in bank_u2.columns or "memo" in bank_u2.columns):
-        txtcol = "partner" if "partner" in bank_u2.columns else "memo"
-        bank_u2 = bank_u2[
-            bank_u2[txtcol]
-            .fillna("")
-            .str.contains(
-                r"stripe|adyen|mollie|paypal|checkout\.com|braintree",
-                case=False,
-                regex=True,
-            )
-        ]
-
-    psp_matches = []
-    for i_idx, irow in inv_u2.iterrows():
-        cands = bank_u2[
-            (bank_u2["entity"] == irow["entity"])
-            & ((bank_u2["date"] - irow["date"]).abs() <= date_window)
-        ]
-        for b_idx, brow in cands.iterrows():
-            ok, fee = fee_ok(
-                irow["amount"],
-                brow["amount"],
-                settings.psp_fee_abs,
-                settings.psp_fee_pct,
-            )
-            if ok:
-                mid = f"F{i_idx}-{b_idx}"
-                psp_matches.append((i_idx, b_idx, mid))
-                break
-
-    for i_idx, b_idx, mid in psp_matches:
-        inv.loc[i_idx, ["match_id", "status"]] = [mid, "Matched"]
-        bank.loc[b_idx, ["match_id", "status"]] = [mid, "Matched (fee)"]
-        recent.append(dict(rule="R2 fee", inv_id=i_idx, bank_id=b_idx, match_id=mid))
-    total_rule2 = len(psp_matches)
+    _report(progress, "R2 fee", status="running")
+    psp_matches = _focused(_rule2_fee(inv_u2, bank_u2, settings, stages), focus)
+    total_rule2 = _record(inv, bank, recent, "R2 fee", psp_matches, "Matched (fee)")
+    _report(progress, "R2 fee", status="done", matches=total_rule2)
 
     inv_u3 = inv[(inv.get("type") == "revenue") & (inv["match_id"].isna())].copy()
     bank_u3 = bank[(bank.get("direction") == "in") & (bank["match_id"].isna())].copy()
 
-    batch_matches = []
-    for b_idx, brow in bank_u3.iterrows():
-        cands = inv_u3[
-            (inv_u3["entity"] == brow["entity"])
-            & ((inv_u3["date"] - brow["date"]).abs() <= date_window)
-        ]
-        if cands.empty:
-            continue
-        ids, gross_sum, fee, ok = greedy_many_to_one(
-            cands,
-            float(brow["amount"]),
-            settings.amount_tolerance,
-            settings.psp_fee_abs,
-            settings.psp_fee_pct,
-        )
-        if ok and ids:
-            mid = f"B{b_idx}-" + ",".join(map(str, ids))
-            batch_matches.append((ids, b_idx, mid))
-
-    for ids, b_idx, mid in batch_matches:
-        inv.loc[ids, ["match_id", "status"]] = [mid, "Matched"]
-        bank.loc[b_idx, ["match_id", "status"]] = [mid, "Matched (batch)"]
-        recent.append(
-            dict(rule="R3 batch", inv_ids=",".join(map(str, ids)), bank_id=b_idx, match_id=mid)
-        )
-    total_rule3 = len(batch_matches)
+    _report(progress, "R3 batch", status="running")
+    batch_matches = _focused(_rule3_batch(inv_u3, bank_u3, settings, stages), focus)
+    total_rule3 = _record_batches(inv, bank, recent, batch_matches)
+    _report(progress, "R3 batch", status="done", matches=total_rule3)
 
     summary = ReconSummary(
         total_rule1=total_rule1,
@@ -190,6 +420,4 @@ def run_reconciliation(inv: pd.DataFrame, bank: pd.DataFrame, settings: ReconSet
         recent=recent,
     )
 
-    return ReconResult(invoices=inv, bank=bank, summary=summary)
-
-
+    return ReconResult(invoices=inv, bank=bank, summary=_with_stats(summary, stages))
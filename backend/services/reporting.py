@@ -6,50 +6,111 @@ from typing import Dict, List, Tuple
 import numpy as np
 import pandas as pd
 
-from .data_layer import build_board_pack
+from . import schema
+from .data_layer import MonthlyAggregates, build_board_pack
 
 
-def _group_revenue_expense(inv: pd.DataFrame) -> pd.DataFrame:
-    required = {"type", "amount", "month", "entity"}
-    if inv.empty or not required.issubset(inv.columns):
-        return pd.DataFrame()
-    revexp = (
-        inv.assign(
-            revenue=np.where(inv["type"].eq("revenue"), inv["amount"], 0.0),
-            expense=np.where(inv["type"].eq("expense"), inv["amount"], 0.0),
-        )
-        .groupby(["entity", "month"], as_index=False)[["revenue", "expense"]]
+def _sum_by_entity_month(frame: pd.DataFrame, cents: Dict[str, np.ndarray]) -> pd.DataFrame:
+    """Per-(entity, month) sums of the given cent columns, in euros.
+
+    Sums are taken in integer cents, so they carry no float rounding error.
+    """
+    grouped = (
+        pd.DataFrame(cents, index=frame.index)
+        .assign(entity=frame["entity"], month=frame["month"])
+        .groupby(["entity", "month"], as_index=False, observed=True)[list(cents)]
         .sum()
     )
-    revexp_all = (
-        revexp.groupby("month", as_index=False)[["revenue", "expense"]]
-        .sum()
-        .assign(entity="ALL")
+    for col in cents:
+        grouped[col] = grouped[col] / 100
+    grouped["entity"] = grouped["entity"].astype(object)
+    return grouped
+
+
+def _with_all_rollup(grouped: pd.DataFrame, measures: List[str]) -> pd.DataFrame:
+    rollup = _sum_euros(grouped, "month", measures).assign(entity="ALL")
+    return pd.concat([grouped, rollup], ignore_index=True)
+
+
+def _sum_euros(frame: pd.DataFrame, by: str, measures: List[str]) -> pd.DataFrame:
+    """Per-``by`` sums of euro columns, taken in integer cents."""
+    cents = frame[measures].mul(100).round().astype("int64")
+    summed = cents.assign(**{by: frame[by]}).groupby(by, as_index=False)[measures].sum()
+    summed[measures] = summed[measures] / 100
+    return summed
+
+
+def _cents_total(values: pd.Series) -> float:
+    return int(values.mul(100).round().sum()) / 100
+
+
+def _group_revenue_expense(inv: pd.DataFrame) -> pd.DataFrame:
+    required = {"type", "month", "entity"}
+    if inv.empty or not required.issubset(inv.columns) or not schema.has_money(inv, "amount"):
+        return pd.DataFrame()
+    cents, _ = schema.money_cents(inv, "amount")
+    revexp = _sum_by_entity_month(
+        inv,
+        {
+            "revenue": np.where(inv["type"].eq("revenue"), cents, 0),
+            "expense": np.where(inv["type"].eq("expense"), cents, 0),
+        },
     )
-    return pd.concat([revexp, revexp_all], ignore_index=True)
+    return _with_all_rollup(revexp, ["revenue", "expense"])
 
 
 def _group_cash(bank: pd.DataFrame) -> pd.DataFrame:
-    required = {"direction", "amount", "month", "entity"}
-    if bank.empty or not required.issubset(bank.columns):
+    required = {"direction", "month", "entity"}
+    if bank.empty or not required.issubset(bank.columns) or not schema.has_money(bank, "amount"):
         return pd.DataFrame()
-    bank2 = bank.copy()
-    bank2["inflow"] = np.where(bank2["direction"].eq("in"), bank2["amount"], 0.0)
-    bank2["outflow"] = np.where(bank2["direction"].eq("out"), bank2["amount"], 0.0)
-    cash = (
-        bank2.groupby(["entity", "month"], as_index=False)[["inflow", "outflow"]]
-        .sum()
-        .assign(net_cash=lambda d: d["inflow"] - d["outflow"])
-    )
-    cash_all = (
-        cash.groupby("month", as_index=False)[["inflow", "outflow", "net_cash"]]
-        .sum()
-        .assign(entity="ALL")
+    cents, _ = schema.money_cents(bank, "amount")
+    inflow = np.where(bank["direction"].eq("in"), cents, 0)
+    outflow = np.where(bank["direction"].eq("out"), cents, 0)
+    cash = _sum_by_entity_month(
+        bank, {"inflow": inflow, "outflow": outflow, "net_cash": inflow - outflow}
     )
-    return pd.concat([cash, cash_all], ignore_index=True)
+    return _with_all_rollup(cash, ["inflow", "outflow", "net_cash"])
 
 
-def build_overview(inv: pd.DataFrame, bank: pd.DataFrame, entity: str = "ALL") -> dict:
+def _aggregate_groups(table: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """``_group_revenue_expense`` / ``_group_cash`` read off the monthly aggregates."""
+    if table.empty:
+        return pd.DataFrame(), pd.DataFrame()
+    keyed = table[table["entity"].ne("") & table["month"].notna()].sort_values(
+        ["entity", "month"]
+    )
+    groups = []
+    for count, measures in (
+        ("invoice_count", ["revenue", "expense"]),
+        ("bank_count", ["inflow", "outflow", "net_cash"]),
+    ):
+        rows = keyed.loc[keyed[count] > 0, ["entity", "month", *measures]]
+        groups.append(
+            _with_all_rollup(rows.reset_index(drop=True), measures)
+            if not rows.empty
+            else pd.DataFrame()
+        )
+    return groups[0], groups[1]
+
+
+@dataclass
+class OverviewInputs:
+    revexp: pd.DataFrame
+    cash: pd.DataFrame
+    # Matched revenue per calendar month of the invoice date, all entities.
+    matched_by_month: pd.DataFrame
+    # month / net_amount / vat_amount over all entities; None without the columns.
+    net_vat: pd.DataFrame | None
+    matched_amount: float
+    unmatched_amount: float
+    matched_count: int
+    unmatched_count: int
+    vat_total: float
+    currencies: List[str]
+    top_ar: pd.DataFrame
+
+
+def _inputs_from_frames(inv: pd.DataFrame, bank: pd.DataFrame) -> OverviewInputs:
     inv = inv.copy()
     bank = bank.copy()
     if not inv.empty and "entity" not in inv.columns:
@@ -57,8 +118,141 @@ def build_overview(inv: pd.DataFrame, bank: pd.DataFrame, entity: str = "ALL") -
     if not bank.empty and "entity" not in bank.columns:
         bank["entity"] = "TUG_NL"
 
-    revexp = _group_revenue_expense(inv)
-    cash = _group_cash(bank)
+    matched_inv = inv[(inv.get("type") == "revenue") & (inv["match_id"].notna())].copy()
+    unmatched_inv = inv[(inv.get("type") == "revenue") & (inv["match_id"].isna())].copy()
+
+    if not matched_inv.empty:
+        matched_m = (
+            pd.DataFrame(
+                {
+                    "month": pd.to_datetime(matched_inv["date"])
+                    .dt.to_period("M")
+                    .dt.to_timestamp(),
+                    "matched_revenue": schema.money_cents(matched_inv, "amount")[0],
+                }
+            )
+            .groupby("month", as_index=True)[["matched_revenue"]]
+            .sum()
+            / 100
+        )
+    else:
+        matched_m = pd.DataFrame(columns=["matched_revenue"])
+
+    net_vat = None
+    if "month" in inv.columns and all(
+        schema.has_money(inv, col) for col in ("net_amount", "vat_amount")
+    ):
+        net_vat = (
+            pd.DataFrame(
+                {
+                    "month": inv["month"],
+                    "net_amount": schema.money_cents(inv, "net_amount")[0],
+                    "vat_amount": schema.money_cents(inv, "vat_amount")[0],
+                }
+            )
+            .groupby("month", as_index=False)[["net_amount", "vat_amount"]]
+            .sum()
+        )
+        net_vat[["net_amount", "vat_amount"]] /= 100
+
+    # Positions of the open invoices by amount, largest first.
+    largest = (
+        schema.euros(unmatched_inv, "amount")
+        .reset_index(drop=True)
+        .sort_values(ascending=False)
+        .index
+    )
+
+    def total(frame: pd.DataFrame, col: str) -> float:
+        if frame.empty or not schema.has_money(frame, col):
+            return 0.0
+        return int(schema.money_cents(frame, col)[0].sum()) / 100
+
+    currencies = (
+        sorted(
+            inv.get("currency", pd.Series(dtype=str))
+            .dropna()
+            .astype(str)
+            .unique()
+            .tolist()
+        )
+        if not inv.empty and "currency" in inv.columns
+        else []
+    )
+
+    return OverviewInputs(
+        revexp=_group_revenue_expense(inv),
+        cash=_group_cash(bank),
+        matched_by_month=matched_m,
+        net_vat=net_vat,
+        matched_amount=total(matched_inv, "amount"),
+        unmatched_amount=total(unmatched_inv, "amount"),
+        matched_count=int(matched_inv.shape[0]),
+        unmatched_count=int(unmatched_inv.shape[0]),
+        vat_total=total(inv, "vat_amount"),
+        currencies=currencies,
+        top_ar=schema.to_external(unmatched_inv.iloc[largest[:5]]),
+    )
+
+
+def _inputs_from_aggregates(aggs: MonthlyAggregates) -> OverviewInputs:
+    table = aggs.table
+    revexp, cash = _aggregate_groups(table)
+    if table.empty:
+        table = pd.DataFrame(
+            columns=["entity", "month", "matched_revenue", "matched_count", "invoice_count"]
+        )
+    dated = table[table["month"].notna()]
+
+    matched = dated[dated["matched_count"] > 0]
+    matched_m = (
+        _sum_euros(matched, "month", ["matched_revenue"]).set_index("month")
+        if not matched.empty
+        else pd.DataFrame(columns=["matched_revenue"])
+    )
+
+    net_vat = None
+    if aggs.has_net_vat:
+        net_vat = _sum_euros(
+            dated[dated["invoice_count"] > 0], "month", ["net_amount", "vat_amount"]
+        )
+
+    def total(col: str) -> float:
+        return _cents_total(table[col]) if col in table.columns else 0.0
+
+    matched_count = int(total("matched_count"))
+    return OverviewInputs(
+        revexp=revexp,
+        cash=cash,
+        matched_by_month=matched_m,
+        net_vat=net_vat,
+        matched_amount=total("matched_revenue"),
+        unmatched_amount=_cents_total(table["revenue"] - table["matched_revenue"])
+        if "revenue" in table.columns
+        else 0.0,
+        matched_count=matched_count,
+        unmatched_count=int(total("revenue_count")) - matched_count,
+        vat_total=total("vat_amount"),
+        currencies=aggs.currencies,
+        top_ar=aggs.top_open_revenue,
+    )
+
+
+def build_overview(inv: pd.DataFrame, bank: pd.DataFrame, entity: str = "ALL") -> dict:
+    return _overview(_inputs_from_frames(inv, bank), entity)
+
+
+def build_overview_from_aggregates(aggs: MonthlyAggregates, entity: str = "ALL") -> dict:
+    """``build_overview`` computed from the monthly aggregate table.
+
+    Costs grow with the number of (entity, month) pairs, not with rows.
+    """
+    return _overview(_inputs_from_aggregates(aggs), entity)
+
+
+def _overview(parts: OverviewInputs, entity: str) -> dict:
+    revexp = parts.revexp
+    cash = parts.cash
 
     if not revexp.empty:
         re_ent = revexp[revexp["entity"].eq(entity)].sort_values("month")
@@ -70,9 +264,6 @@ def build_overview(inv: pd.DataFrame, bank: pd.DataFrame, entity: str = "ALL") -
     else:
         cash_ent = pd.DataFrame()
 
-    matched_inv = inv[(inv.get("type") == "revenue") & (inv["match_id"].notna())].copy()
-    unmatched_inv = inv[(inv.get("type") == "revenue") & (inv["match_id"].isna())].copy()
-
     if not re_ent.empty:
         last_rev = re_ent["revenue"].iloc[-1]
         last_exp = re_ent["expense"].iloc[-1]
@@ -92,46 +283,14 @@ def build_overview(inv: pd.DataFrame, bank: pd.DataFrame, entity: str = "ALL") -
         (cash_balance / max(1.0, prev_burn)) if prev_burn > 0 else None
     )
 
-    matched_amt = float(matched_inv["amount"].sum()) if not matched_inv.empty else 0.0
-    unmatched_amt = (
-        float(unmatched_inv["amount"].sum()) if not unmatched_inv.empty else 0.0
-    )
-    matched_cnt = int(matched_inv.shape[0])
-    unmatched_cnt = int(unmatched_inv.shape[0])
+    matched_amt = parts.matched_amount
     total_revenue = float(re_ent["revenue"].sum()) if not re_ent.empty else 0.0
     collection_rate = matched_amt / total_revenue if total_revenue > 0 else 0.0
 
-    vat_total = float(inv.get("vat_amount", pd.Series([], dtype=float)).sum())
-    currencies = (
-        sorted(
-            inv.get("currency", pd.Series(dtype=str))
-            .dropna()
-            .astype(str)
-            .unique()
-            .tolist()
-        )
-        if not inv.empty and "currency" in inv.columns
-        else []
-    )
-
     accrual_series = (
         re_ent[["month", "revenue"]].set_index("month") if not re_ent.empty else pd.DataFrame()
     )
-    if not matched_inv.empty:
-        matched_m = (
-            matched_inv.assign(
-                month=pd.to_datetime(matched_inv["date"])
-                .dt.to_period("M")
-                .dt.to_timestamp()
-            )
-            .groupby("month", as_index=True)["amount"]
-            .sum()
-            .to_frame("matched_revenue")
-        )
-    else:
-        matched_m = pd.DataFrame(columns=["matched_revenue"])
-
-    both = accrual_series.join(matched_m, how="outer").fillna(0.0)
+    both = accrual_series.join(parts.matched_by_month, how="outer").fillna(0.0)
     rev_vs_collected = (
         both.reset_index()
         .melt(
@@ -145,11 +304,9 @@ def build_overview(inv: pd.DataFrame, bank: pd.DataFrame, entity: str = "ALL") -
         else []
     )
 
-    if {"month", "net_amount", "vat_amount"}.issubset(inv.columns):
+    if parts.net_vat is not None:
         net_vat_df = (
-            inv.groupby("month", as_index=False)[["net_amount", "vat_amount"]]
-            .sum()
-            .rename(columns={"net_amount": "Net revenue", "vat_amount": "VAT"})
+            parts.net_vat.rename(columns={"net_amount": "Net revenue", "vat_amount": "VAT"})
             .melt(
                 id_vars=["month"],
                 value_vars=["Net revenue", "VAT"],
@@ -163,12 +320,12 @@ def build_overview(inv: pd.DataFrame, bank: pd.DataFrame, entity: str = "ALL") -
 
     overview = {
         "kpis": {
-            "matched_count": matched_cnt,
+            "matched_count": parts.matched_count,
             "matched_amount": matched_amt,
-            "unmatched_amount": unmatched_amt,
+            "unmatched_amount": parts.unmatched_amount,
             "runway_months": runway_months,
-            "vat_total": vat_total,
-            "currencies": currencies,
+            "vat_total": parts.vat_total,
+            "currencies": parts.currencies,
             "gross_profit": gross_prof,
             "cash_balance": cash_balance,
             "collection_rate": collection_rate,
@@ -177,9 +334,7 @@ def build_overview(inv: pd.DataFrame, bank: pd.DataFrame, entity: str = "ALL") -
         "net_vat": net_vat,
         "revenue_table": re_ent.to_dict("records"),
         "cash_table": cash_ent.to_dict("records"),
-        "top_ar": unmatched_inv.sort_values("amount", ascending=False)
-        .head(5)
-        .to_dict("records"),
+        "top_ar": parts.top_ar.to_dict("records"),
     }
     return overview
 
@@ -196,119 +351,134 @@ def build_exceptions(inv: pd.DataFrame, bank: pd.DataFrame) -> dict:
         else pd.DataFrame()
     )
     partial = (
-        bank[bank["status"].fillna("").str.contains("fee|batch|Partial", case=False)]
+        bank[schema.str_contains(bank["status"], "fee|batch|Partial", case=False)]
         if "status" in bank.columns
         else pd.DataFrame()
     )
     return {
-        "unmatched_invoices": unmatched_invoices.to_dict("records"),
-        "unmatched_bank": unmatched_bank.to_dict("records"),
-        "psp_batch": partial.to_dict("records"),
+        "unmatched_invoices": schema.to_external(unmatched_invoices).to_dict("records"),
+        "unmatched_bank": schema.to_external(unmatched_bank).to_dict("records"),
+        "psp_batch": schema.to_external(partial).to_dict("records"),
     }
 
 
-def build_journal(inv: pd.DataFrame, bank: pd.DataFrame) -> pd.DataFrame:
-    COA = {
-        "Revenue": "4000-Revenue",
-        "Cash": "1000-Cash",
-        "AR": "1200-Accounts Receivable",
-        "PSP Fees": "6060-Payment Processing Fees",
-    }
+COA = {
+    "Revenue": "4000-Revenue",
+    "Cash": "1000-Cash",
+    "AR": "1200-Accounts Receivable",
+    "PSP Fees": "6060-Payment Processing Fees",
+}
 
-    journal = []
-
-    def matched_bank_amount_and_fee(inv_row):
-        mid = inv_row.get("match_id")
-        if pd.isna(mid):
-            return None, 0.0
-        b = bank.loc[bank["match_id"] == mid]
-        if b.empty:
-            return None, 0.0
-        bank_amt = float(b.iloc[0]["amount"])
-        is_fee_context = "fee" in str(b.iloc[0]["status"]).lower() or "fee" in str(
-            inv_row.get("status", "")
-        ).lower()
-        fee = max(0.0, float(inv_row["amount"]) - bank_amt) if is_fee_context else 0.0
-        return bank_amt, fee
-
-    for _, r in inv.dropna(subset=["match_id"]).iterrows():
-        bank_amt, fee = matched_bank_amount_and_fee(r)
-        if bank_amt is None:
-            journal += [
-                dict(
-                    date=r["date"],
-                    entity=r.get("entity", ""),
-                    account=COA["AR"],
-                    debit=float(r["amount"]),
-                    credit=0.0,
-                    ref="UNRESOLVED",
-                ),
-                dict(
-                    date=r["date"],
-                    entity=r.get("entity", ""),
-                    account=COA["Revenue"],
-                    debit=0.0,
-                    credit=float(r["amount"]),
-                    ref="UNRESOLVED",
-                ),
-            ]
-            continue
-        journal += [
-            dict(
-                date=r["date"],
-                entity=r.get("entity", ""),
-                account=COA["Cash"],
-                debit=float(bank_amt),
-                credit=0.0,
-                ref=r["match_id"],
-            ),
-            dict(
-                date=r["date"],
-                entity=r.get("entity", ""),
-                account=COA["Revenue"],
-                debit=0.0,
-                credit=float(r["amount"]),
-                ref=r["match_id"],
-            ),
-        ]
-        if fee > 0.0001:
-            journal.append(
-                dict(
-                    date=r["date"],
-                    entity=r.get("entity", ""),
-                    account=COA["PSP Fees"],
-                    debit=float(fee),
-                    credit=0.0,
-                    ref=r["match_id"],
-                )
-            )
+def _mentions_fee(frame: pd.DataFrame) -> np.ndarray:
+    if "status" not in frame.columns:
+        return np.zeros(len(frame), dtype=bool)
+    return schema.str_contains(frame["status"], "fee", case=False, regex=False).to_numpy(dtype=bool)
 
-    for _, r in inv[(inv.get("type") == "revenue") & (inv["match_id"].isna())].iterrows():
-        journal += [
-            dict(
-                date=r["date"],
-                entity=r.get("entity", ""),
-                account=COA["AR"],
-                debit=float(r["amount"]),
-                credit=0.0,
-                ref="UNMATCHED",
-            ),
-            dict(
-                date=r["date"],
-                entity=r.get("entity", ""),
-                account=COA["Revenue"],
-                debit=0.0,
-                credit=float(r["amount"]),
-                ref="UNMATCHED",
-            ),
-        ]
 
-    return pd.DataFrame(journal)
+def build_journal(inv: pd.DataFrame, bank: pd.DataFrame) -> pd.DataFrame:
+    """Double-entry lines for matched and open revenue invoices.
+
+    Each matched invoice is resolved against the first bank row carrying its
+    ``match_id`` (one indexed lookup for the whole frame) and yields Cash /
+    Revenue lines, plus a PSP-fee line when either side is in a fee context
+    and the bank received less than invoiced. Matches without a bank row
+    book to AR as ``UNRESOLVED``; open revenue invoices follow as
+    ``UNMATCHED`` AR / Revenue pairs.
+    """
+    if inv.empty or "match_id" not in inv.columns:
+        return pd.DataFrame()
+    entity = (
+        schema.plain(inv["entity"]) if "entity" in inv.columns else pd.Series("", index=inv.index)
+    )
+    amount = schema.euros(inv, "amount").to_numpy()
+    amount_cents, amount_ok = schema.money_cents(inv, "amount")
+    match_ids = inv["match_id"]
+    is_matched = match_ids.notna().to_numpy()
+    is_revenue = (
+        inv["type"].eq("revenue").to_numpy()
+        if "type" in inv.columns
+        else np.zeros(len(inv), dtype=bool)
+    )
+
+    # Matched invoices: first bank row per match_id. A trailing sentinel row
+    # answers misses (index -1) with NaN / no fee.
+    pos = np.flatnonzero(is_matched)
+    if "match_id" in bank.columns and schema.has_money(bank, "amount"):
+        first = bank[bank["match_id"].notna()].drop_duplicates("match_id")
+        hit = pd.Index(first["match_id"]).get_indexer(match_ids.iloc[pos])
+        first_cents, first_ok = schema.money_cents(first, "amount")
+        bank_cents = np.append(first_cents, 0)
+        bank_ok = np.append(first_ok, False)
+        bank_fee = np.append(_mentions_fee(first), False)
+    else:
+        hit = np.full(len(pos), -1)
+        bank_cents, bank_ok, bank_fee = np.zeros(1, np.int64), np.array([False]), np.array([False])
+    found = hit >= 0
+    paid_ok = bank_ok[hit]
+    paid = np.where(paid_ok, bank_cents[hit] / 100, np.nan)
+    fee_context = found & (bank_fee[hit] | _mentions_fee(inv)[pos])
+    # What the bank received short of the invoice, in exact cents.
+    fee_cents = np.where(
+        fee_context & paid_ok & amount_ok[pos],
+        np.maximum(amount_cents[pos] - bank_cents[hit], 0),
+        0,
+    )
+    fee = fee_cents / 100
+    with_fee = found & (fee_cents > 0)
+
+    # Two lines per matched invoice (three with a fee), in invoice order.
+    counts = 2 + with_fee.astype(np.int64)
+    line_of = np.repeat(np.arange(len(pos)), counts)
+    slot = np.arange(len(line_of)) - np.repeat(np.cumsum(counts) - counts, counts)
+    src = pos[line_of]
+    line_found = found[line_of]
+    matched_account = np.where(
+        slot == 0,
+        np.where(line_found, COA["Cash"], COA["AR"]),
+        np.where(slot == 1, COA["Revenue"], COA["PSP Fees"]),
+    )
+    matched_debit = np.where(
+        slot == 0,
+        np.where(line_found, paid[line_of], amount[src]),
+        np.where(slot == 1, 0.0, fee[line_of]),
+    )
+    matched_credit = np.where(slot == 1, amount[src], 0.0)
+    matched_ref = np.where(
+        line_found, match_ids.to_numpy(dtype=object)[src], "UNRESOLVED"
+    ).astype(object)
+
+    # Open revenue invoices: AR / Revenue pair each.
+    open_pos = np.flatnonzero(is_revenue & ~is_matched)
+    open_src = np.repeat(open_pos, 2)
+    open_slot = np.tile([0, 1], len(open_pos))
+    open_account = np.where(open_slot == 0, COA["AR"], COA["Revenue"])
+    open_debit = np.where(open_slot == 0, amount[open_src], 0.0)
+    open_credit = np.where(open_slot == 1, amount[open_src], 0.0)
+
+    rows = np.concatenate([src, open_src])
+    if not len(rows):
+        return pd.DataFrame()
+    return pd.DataFrame(
+        {
+            "date": inv["date"].to_numpy()[rows],
+            "entity": entity.to_numpy(dtype=object)[rows],
+            "account": np.concatenate([matched_account, open_account]).astype(object),
+            "debit": np.concatenate([matched_debit, open_debit]),
+            "credit": np.concatenate([matched_credit, open_credit]),
+            "ref": np.concatenate(
+                [matched_ref, np.full(len(open_src), "UNMATCHED", dtype=object)]
+            ),
+        }
+    )
 
 
-def board_pack(inv: pd.DataFrame, bank: pd.DataFrame) -> Tuple[bytes, int]:
-    revexp = _group_revenue_expense(inv)
-    cash = _group_cash(bank)
+def board_pack(
+    inv: pd.DataFrame, bank: pd.DataFrame, aggs: MonthlyAggregates | None = None
+) -> Tuple[bytes, int]:
+    if aggs is not None:
+        revexp, cash = _aggregate_groups(aggs.table)
+    else:
+        revexp, cash = _group_revenue_expense(inv), _group_cash(bank)
     pnl_df = (
         revexp.groupby("month", as_index=False)[["revenue", "expense"]].sum()
         if not revexp.empty
@@ -320,8 +490,8 @@ def board_pack(inv: pd.DataFrame, bank: pd.DataFrame) -> Tuple[bytes, int]:
         else pd.DataFrame()
     )
     journal = build_journal(inv, bank)
-    pack = build_board_pack(journal, pnl_df, cash_df, inv, bank)
+    pack = build_board_pack(
+        journal, pnl_df, cash_df, schema.to_external(inv), schema.to_external(bank)
+    )
     blob = pack.to_zip_bytes()
     return blob, len(blob)
-
-
@@ -0,0 +1,102 @@
+"""Typed in-memory representation of the datasets.
+
+Frames handed out by ``data_layer`` hold the low-cardinality text columns as
+categoricals, money as nullable int64 cents in ``<column>_cents`` (so
+amounts compare exactly) and ``date``/``month`` as datetime64. Services read
+money through ``money_cents``/``euros``, which also accept plain frames with
+float euro columns; ``to_external`` turns a typed frame back into euros and
+plain values for API responses and exports.
+"""
+
+from __future__ import annotations
+
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from . import matching
+
+CATEGORY_COLUMNS = ("entity", "type", "direction", "status", "currency", "partner")
+MONEY_COLUMNS = ("amount", "net_amount", "vat_amount")
+DATE_COLUMNS = ("date", "month")
+CENTS_SUFFIX = "_cents"
+CENTS_DTYPE = pd.Int64Dtype()
+
+
+def cents_column(name: str) -> str:
+    return f"{name}{CENTS_SUFFIX}"
+
+
+def to_typed(df: pd.DataFrame) -> pd.DataFrame:
+    """``df`` (plain values, as read from SQLite) in the typed representation."""
+    if not len(df.columns):
+        return df
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        if col in MONEY_COLUMNS:
+            cents, valid = matching.to_cents(values)
+            columns[cents_column(col)] = pd.arrays.IntegerArray(cents, ~valid)
+        elif col in CATEGORY_COLUMNS:
+            columns[col] = values.astype("category")
+        elif col in DATE_COLUMNS and values.dtype.kind != "M":
+            columns[col] = pd.to_datetime(values, errors="coerce")
+        else:
+            columns[col] = values
+    return pd.DataFrame(columns, index=df.index)
+
+
+def to_external(df: pd.DataFrame) -> pd.DataFrame:
+    """A typed frame with euros in the original money columns and plain text.
+
+    Missing categoricals come back as ``None``, as they are read from SQLite.
+    """
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        name = col[: -len(CENTS_SUFFIX)] if col.endswith(CENTS_SUFFIX) else None
+        if name in MONEY_COLUMNS:
+            columns[name] = euros(df, name)
+        else:
+            columns[col] = plain(values)
+    return pd.DataFrame(columns, index=df.index)
+
+
+def plain(values: pd.Series) -> pd.Series:
+    """A categorical as object values with ``None`` where missing; others as is."""
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        return values
+    return values.astype(object).where(values.notna(), None)
+
+
+def has_money(frame: pd.DataFrame, name: str) -> bool:
+    return cents_column(name) in frame.columns or name in frame.columns
+
+
+def money_cents(frame: pd.DataFrame, name: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Money column ``name`` as int64 cents plus a validity mask, typed or plain."""
+    typed = cents_column(name)
+    if typed not in frame.columns:
+        return matching.to_cents(frame[name])
+    values = frame[typed].array
+    return values.to_numpy(dtype=np.int64, na_value=0), ~values.isna()
+
+
+def euros(frame: pd.DataFrame, name: str) -> pd.Series:
+    """Money column ``name`` as float euros, NaN where missing."""
+    cents, valid = money_cents(frame, name)
+    return pd.Series(np.where(valid, cents / 100, np.nan), index=frame.index, name=name)
+
+
+def str_contains(values: pd.Series, pattern: str, case: bool = True, regex: bool = True) -> pd.Series:
+    """``values.str.contains`` with missing values as False.
+
+    Categoricals are matched once per category rather than once per row.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        hits = values.cat.categories.astype(str).str.contains(pattern, case=case, regex=regex)
+        # Code -1 (missing) picks the trailing False.
+        hits = np.append(np.asarray(hits, dtype=bool), False)
+        return pd.Series(hits[values.cat.codes.to_numpy()], index=values.index)
+    return values.fillna("").str.contains(pattern, case=case, regex=regex)
@@ -0,0 +1,222 @@
+"""Reconciliation parameter sweeps: a grid of settings evaluated on one load.
+
+Per entity, the R1 and R2 candidate pairs are built once at the widest
+window, tolerance and fee of the grid, with each pair's amount difference,
+fee and date gap. A grid point then only filters those pairs and assigns,
+exactly like the rules would on their own scan; R3 runs on what the point
+left open. Entities go through ``parallel.map_entities``, so on a pool when
+there are workers. Nothing is written back.
+"""
+
+from __future__ import annotations
+
+import itertools
+import time
+from dataclasses import dataclass, replace
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from . import matching, parallel
+from .reconciliation import RULES, ReconSettings, _psp_mask, _side_arrays, ensure_columns
+
+AXES = ("date_window_days", "amount_tolerance", "psp_fee_abs", "psp_fee_pct")
+MAX_POINTS = 1000
+# Per rule and point: matches, invoices matched, their cents, bank cents.
+_TALLY = ("matches", "invoices", "invoice_amount", "bank_amount")
+
+
+@dataclass
+class Candidates:
+    """One entity's open rows and its R1 / R2 candidate pairs at the widest settings.
+
+    Pairs are ordered by invoice, then bank position, as the kernels return
+    them; the R2 pairs only use bank lines R2 may take.
+    """
+
+    inv_cents: np.ndarray
+    inv_ns: np.ndarray
+    bank_cents: np.ndarray
+    bank_ns: np.ndarray
+    r1_inv: np.ndarray
+    r1_bank: np.ndarray
+    r1_diff: np.ndarray  # |invoice - bank| in cents
+    r1_gap: np.ndarray  # |date difference| in ns
+    r2_inv: np.ndarray
+    r2_bank: np.ndarray
+    r2_fee: np.ndarray  # invoice - bank in cents
+    r2_gap: np.ndarray
+
+
+def grid(
+    date_window_days: Iterable[int],
+    amount_tolerance: Iterable[float],
+    psp_fee_abs: Iterable[float],
+    psp_fee_pct: Iterable[float],
+    **common,
+) -> list[ReconSettings]:
+    """Every combination of the axis values, as settings sharing ``common``."""
+    axes = [sorted(set(values)) for values in
+            (date_window_days, amount_tolerance, psp_fee_abs, psp_fee_pct)]
+    if not all(axes):
+        raise ValueError("Every sweep axis needs at least one value")
+    size = int(np.prod([len(values) for values in axes]))
+    if size > MAX_POINTS:
+        raise ValueError(f"Sweep has {size} points; at most {MAX_POINTS} are allowed")
+    return [
+        ReconSettings(**dict(zip(AXES, values)), **common)
+        for values in itertools.product(*axes)
+    ]
+
+
+def widest(points: list[ReconSettings]) -> ReconSettings:
+    """Settings that admit every candidate pair of every point."""
+    return replace(points[0], **{axis: max(getattr(p, axis) for p in points) for axis in AXES})
+
+
+def build_candidates(inv_cents, inv_ns, bank_cents, bank_ns, bank_psp, settings: ReconSettings):
+    window_ns = pd.Timedelta(days=settings.date_window_days).value
+    r1_inv, r1_bank = matching.exact_pairs(
+        inv_cents, inv_ns, bank_cents, bank_ns,
+        int(round(settings.amount_tolerance * 100)), window_ns,
+    )
+    r2_inv, r2_bank = matching.fee_candidates(
+        inv_cents, inv_ns, bank_cents, bank_ns,
+        window_ns, int(round(settings.psp_fee_abs * 100)), settings.psp_fee_pct,
+    )
+    psp = bank_psp[r2_bank]
+    r2_inv, r2_bank = r2_inv[psp], r2_bank[psp]
+    return Candidates(
+        inv_cents, inv_ns, bank_cents, bank_ns,
+        r1_inv, r1_bank,
+        np.abs(inv_cents[r1_inv] - bank_cents[r1_bank]),
+        np.abs(inv_ns[r1_inv] - bank_ns[r1_bank]),
+        r2_inv, r2_bank,
+        inv_cents[r2_inv] - bank_cents[r2_bank],
+        np.abs(inv_ns[r2_inv] - bank_ns[r2_bank]),
+    )
+
+
+def evaluate(c: Candidates, settings: ReconSettings) -> np.ndarray:
+    """R1 -> R2 -> R3 for one point: a (rule, tally) array of int64 counts and cents."""
+    out = np.zeros((len(RULES), len(_TALLY)), dtype=np.int64)
+    window_ns = pd.Timedelta(days=settings.date_window_days).value
+    tol_cents = int(round(settings.amount_tolerance * 100))
+    fee_abs_cents = int(round(settings.psp_fee_abs * 100))
+    inv_open = np.ones(len(c.inv_cents), dtype=bool)
+    bank_open = np.ones(len(c.bank_cents), dtype=bool)
+
+    keep = (c.r1_diff <= tol_cents) & (c.r1_gap <= window_ns)
+    i_all, b_all = c.r1_inv[keep], c.r1_bank[keep]
+    if settings.assignment == "optimal":
+        i_sel, b_sel = _assign(c, i_all, b_all, settings)
+    else:
+        unique = np.bincount(i_all, minlength=len(c.inv_cents))[i_all] == 1
+        i_sel, b_sel = i_all[unique], b_all[unique]
+    _tally(out[0], c, len(i_sel), i_sel, b_sel)
+    inv_open[i_sel] = False
+    bank_open[b_sel] = False
+
+    gross = c.inv_cents[c.r2_inv]
+    keep = inv_open[c.r2_inv] & bank_open[c.r2_bank] & (c.r2_gap <= window_ns)
+    keep &= c.r2_fee <= fee_abs_cents
+    keep[keep] = c.r2_fee[keep] / gross[keep] <= settings.psp_fee_pct
+    i_all, b_all = c.r2_inv[keep], c.r2_bank[keep]
+    if settings.assignment == "optimal":
+        i_sel, b_sel = _assign(c, i_all, b_all, settings)
+    else:
+        i_sel, b_sel = matching.first_free(i_all, b_all)
+    _tally(out[1], c, len(i_sel), i_sel, b_sel)
+    inv_open[i_sel] = False
+    bank_open[b_sel] = False
+
+    # R3 shares nothing between points and dominates a sweep's time;
+    # max_batch_size=0 leaves it out.
+    ip, bp = np.flatnonzero(inv_open), np.flatnonzero(bank_open)
+    if settings.max_batch_size > 0 and len(ip) and len(bp):
+        batches = matching.batch_matches(
+            c.inv_cents[ip], c.inv_ns[ip], c.bank_cents[bp], c.bank_ns[bp],
+            window_ns,
+            tol_cents,
+            fee_abs_cents,
+            settings.psp_fee_pct,
+            settings.max_batch_size,
+            settings.batch_search_budget,
+        )
+        if batches:
+            i_sel = ip[np.concatenate([i for _, i in batches])]
+            b_sel = bp[[b for b, _ in batches]]
+            _tally(out[2], c, len(batches), i_sel, b_sel)
+    return out
+
+
+def _assign(c: Candidates, i_all, b_all, settings: ReconSettings):
+    """As ``reconciliation.rule1_pairs`` / ``rule2_pairs`` with ``assignment="optimal"``."""
+    cost = matching.pair_costs(
+        c.inv_cents[i_all], c.inv_ns[i_all], c.bank_cents[b_all], c.bank_ns[b_all],
+        settings.assignment_day_cost,
+    )
+    return matching.min_cost_assignment(
+        i_all, b_all, cost, c.inv_ns, settings.assignment_max_nodes
+    )
+
+
+def _tally(row: np.ndarray, c: Candidates, matches: int, i_sel, b_sel):
+    row[:] = matches, len(i_sel), c.inv_cents[i_sel].sum(), c.bank_cents[b_sel].sum()
+
+
+def entity_sweep(inv_cents, inv_ns, bank_cents, bank_ns, bank_psp, points):
+    """Pool task: every point on one entity, from one set of candidates."""
+    c = build_candidates(inv_cents, inv_ns, bank_cents, bank_ns, bank_psp, widest(points))
+    return np.stack([evaluate(c, point) for point in points])
+
+
+def run_sweep(inv: pd.DataFrame, bank: pd.DataFrame, points: list[ReconSettings], workers: int = 1):
+    """Per point, per rule: matches, invoices matched and both sides' amounts.
+
+    The rows and PSP filter are those of ``run_reconciliation`` (``only_psp_names``
+    is taken from the first point; the grid shares it). Results are in
+    ``points`` order, amounts in euros.
+    """
+    started = time.perf_counter()
+    totals = np.zeros((len(points), len(RULES), len(_TALLY)), dtype=np.int64)
+    inv, bank = ensure_columns(inv.copy(), bank.copy())
+    inv_u = inv[(inv.get("type") == "revenue") & (inv["match_id"].isna())]
+    bank_u = bank[(bank.get("direction") == "in") & (bank["match_id"].isna())]
+    if points and not inv_u.empty and not bank_u.empty:
+        inv_a, bank_a, _ = _side_arrays(inv_u, bank_u)
+        psp = _psp_mask(bank_u, points[0])
+        bank_psp = np.ones(len(bank_u), dtype=bool) if psp is None else psp.to_numpy(dtype=bool)
+        _, outputs, _, _ = parallel.map_entities(
+            inv_a, bank_a, bank_psp, entity_sweep, points, workers
+        )
+        for output in outputs:
+            totals += output
+
+    results = []
+    for point, counts in zip(points, totals):
+        rules = {rule: _tally_dict(row) for rule, row in zip(RULES, counts)}
+        results.append(
+            {
+                "settings": {axis: getattr(point, axis) for axis in AXES},
+                "rules": rules,
+                **_tally_dict(counts.sum(axis=0)),
+            }
+        )
+    return {
+        "points": results,
+        "open_invoices": len(inv_u),
+        "open_bank": len(bank_u),
+        "seconds": round(time.perf_counter() - started, 6),
+    }
+
+
+def _tally_dict(row: np.ndarray) -> dict:
+    matches, invoices, inv_cents, bank_cents = (int(v) for v in row)
+    return {
+        "matches": matches,
+        "invoices": invoices,
+        "invoice_amount": inv_cents / 100,
+        "bank_amount": bank_cents / 100,
+    }
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import io
+
+import pandas as pd
+import pytest
+
+from backend.benchmarks import generator
+from backend.services import data_layer
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """An empty database of its own, with the frame cache cleared."""
+    monkeypatch.setattr(data_layer, "DB_PATH", tmp_path / "test.db")
+    data_layer.bump_data_version()
+    yield tmp_path / "test.db"
+    data_layer.bump_data_version()
+
+
+@pytest.fixture
+def import_csv(db):
+    """Replace a dataset of ``db`` with a frame, through the CSV import."""
+
+    def load(dataset: str, df: pd.DataFrame):
+        data_layer.import_csv_stream(dataset, io.BytesIO(df.to_csv(index=False).encode()))
+
+    return load
+
+
+@pytest.fixture
+def recon_params() -> dict:
+    """Reconciliation request parameters, as the API takes them."""
+    return dict(
+        date_window_days=3,
+        amount_tolerance=0.5,
+        psp_fee_abs=50.0,
+        psp_fee_pct=4.0,
+        only_psp_names=True,
+        persist=False,
+        max_batch_size=50,
+        batch_search_budget=2000,
+    )
+
+
+@pytest.fixture(scope="session")
+def frames() -> tuple[pd.DataFrame, pd.DataFrame]:
+    """A small seeded (invoices, bank) pair over a few entities."""
+    return generator.generate(1500, seed=11, entities=4)
+
+
+@pytest.fixture
+def client(db):
+    """The API over the ``db`` database."""
+    from fastapi.testclient import TestClient
+
+    from backend import api
+
+    with TestClient(api.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    """Override settings by name for one test: ``settings(ocr_workers=2)``."""
+    from backend.config import get_settings
+
+    def configure(**values):
+        for name, value in values.items():
+            monkeypatch.setenv(f"TUG_{name.upper()}", "" if value is None else str(value))
+        get_settings.cache_clear()
+        return get_settings()
+
+    yield configure
+    # Restore the environment now: later teardowns may read the settings again.
+    monkeypatch.undo()
+    get_settings.cache_clear()
@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import io
+import json
+import sqlite3
+import threading
+import time
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from backend import core
+from backend.services import data_layer
+from backend.services.reconciliation import _mark
+
+
+def test_edits_to_loaded_frames_do_not_reach_the_cache(import_csv, frames):
+    inv, bank = frames
+    import_csv("invoices", inv.head(50))
+    import_csv("bank_tx", bank.head(50))
+    loaded, _ = data_layer.load_data()
+    before = loaded.copy()
+
+    loaded.loc[loaded.index[0], "amount_cents"] = -1
+    loaded["entity"] = "X"
+    loaded.iloc[1:3, loaded.columns.get_loc("date")] = pd.Timestamp("2000-01-01")
+
+    again, _ = data_layer.load_data()
+    pd.testing.assert_frame_equal(again, before)
+    # Without relying on a process-wide pandas mode.
+    assert pd.get_option("mode.copy_on_write") is False
+
+
+def test_date_order_is_served_by_an_index(import_csv, frames):
+    inv, _ = frames
+    import_csv("invoices", inv.head(50))
+    con = data_layer.get_connection()
+    for cursor in (None, "2024-03-01T00:00:00|7", "|7"):
+        query = data_layer.DatasetQuery("invoices", order="date")
+        plan = " ".join(
+            row[-1] for row in con.execute(f"EXPLAIN QUERY PLAN {_page_sql(con, query, cursor)}")
+        )
+        assert "USING INDEX ix_invoices_date_row_id" in plan
+        assert "TEMP B-TREE" not in plan
+
+
+def _page_sql(con, query, cursor) -> str:
+    """The SQL, parameters bound, that ``_read_page`` runs for one page."""
+    seen = []
+    con.set_trace_callback(seen.append)
+    try:
+        data_layer._read_page(con, query, cursor, 10)
+    finally:
+        con.set_trace_callback(None)
+    return next(s for s in seen if s.lstrip().upper().startswith("SELECT") and "LIMIT" in s)
+
+
+def test_date_pages_share_one_date_format_and_walk_past_null_dates(client, import_csv, frames):
+    inv, _ = frames
+    rows = inv.head(30).copy()
+    rows.loc[rows.index[:6], "date"] = pd.NaT
+    import_csv("invoices", rows)
+
+    walked, cursor = [], None
+    while True:
+        body = client.get(
+            "/datasets/invoices",
+            params={"order": "date", "limit": 4, "columns": "date,month", "cursor": cursor},
+        ).json()
+        walked += body["rows"]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+        date_key = cursor.rpartition("|")[0]
+        assert not date_key or date_key == pd.Timestamp(date_key).isoformat()
+    assert len(walked) == len(rows)
+    assert len({r["row_id"] for r in walked}) == len(rows)
+
+    streamed = [
+        json.loads(line)
+        for line in client.get(
+            "/datasets/invoices", params={"order": "date", "columns": "date,month", "format": "ndjson"}
+        ).text.splitlines()
+    ]
+    assert streamed == walked
+    dated = [r for r in walked if r["date"] is not None]
+    assert [r["date"] for r in walked[:6]] == [None] * 6
+    assert [r["date"] for r in dated] == sorted(r["date"] for r in dated)
+    assert dated[0]["date"] == pd.Timestamp(dated[0]["date"]).isoformat()
+    assert dated[0]["month"] == pd.Timestamp(dated[0]["date"]).to_period("M").start_time.isoformat()
+
+
+def test_arrow_stream_matches_the_json_rows(client, import_csv, frames):
+    import pyarrow as pa
+
+    inv, _ = frames
+    import_csv("invoices", inv.head(40))
+    params = {"columns": "date,entity,amount,match_id"}
+    rows = client.get("/datasets/invoices", params=params).json()["rows"]
+    table = pa.ipc.open_stream(
+        client.get("/datasets/invoices", params={**params, "format": "arrow"}).content
+    ).read_all()
+    assert table.schema.field("date").type == pa.timestamp("ns")
+    assert data_layer.page_records(table.to_pandas()) == rows
+
+
+def _match_columns(name: str) -> pd.DataFrame:
+    return pd.read_sql_query(
+        f"SELECT row_id, match_id, status FROM {name} ORDER BY row_id", data_layer.get_connection()
+    )
+
+
+def test_persist_writes_only_the_changed_rows(import_csv, frames):
+    inv, bank = frames
+    import_csv("invoices", inv.head(50))
+    import_csv("bank_tx", bank.head(50))
+    loaded_inv, loaded_bank = data_layer.load_data()
+    _mark(loaded_inv, list(loaded_inv.index[[1, 4, 9]]), ["M1", "M2", "M3"], "Matched")
+    _mark(loaded_bank, [loaded_bank.index[2]], ["M1"], "Matched")
+
+    con = data_layer.get_connection()
+    statements = []
+    con.set_trace_callback(statements.append)
+    try:
+        written = data_layer.persist_frames(loaded_inv, loaded_bank)
+    finally:
+        con.set_trace_callback(None)
+
+    assert written == {"invoices": 3, "bank_tx": 1}
+    assert sum(s.lstrip().startswith("UPDATE invoices SET match_id") for s in statements) == 3
+    assert sum(s.lstrip().startswith("UPDATE bank_tx SET match_id") for s in statements) == 1
+    stored = _match_columns("invoices").set_index("row_id")
+    assert stored["match_id"].notna().sum() == 3
+    assert stored.loc[loaded_inv.index[[1, 4, 9]], "match_id"].tolist() == ["M1", "M2", "M3"]
+    # Persisting the same frames again has nothing left to write.
+    assert data_layer.persist_frames(*data_layer.load_data()) == {"invoices": 0, "bank_tx": 0}
+
+
+def test_a_failed_persist_leaves_the_tables_intact(import_csv, frames, monkeypatch):
+    inv, bank = frames
+    import_csv("invoices", inv.head(50))
+    import_csv("bank_tx", bank.head(50))
+    before = {name: _match_columns(name) for name in data_layer.DATASETS}
+    kpis = data_layer.kpi_totals()
+    loaded_inv, loaded_bank = data_layer.load_data()
+    _mark(loaded_inv, list(loaded_inv.index), ["M1"] * len(loaded_inv), "Matched")
+    _mark(loaded_bank, list(loaded_bank.index), ["M1"] * len(loaded_bank), "Matched")
+
+    update = data_layer._update_match_columns
+
+    def fail_on_bank(con, name, df):
+        if name == "bank_tx":
+            raise sqlite3.OperationalError("disk I/O error")
+        return update(con, name, df)
+
+    monkeypatch.setattr(data_layer, "_update_match_columns", fail_on_bank)
+    with pytest.raises(sqlite3.OperationalError):
+        data_layer.persist_frames(loaded_inv, loaded_bank)
+
+    for name in data_layer.DATASETS:
+        pd.testing.assert_frame_equal(_match_columns(name), before[name])
+    assert data_layer.kpi_totals() == kpis
+
+
+def test_tables_from_before_row_id_migrate_without_loss(db, frames):
+    inv, bank = frames
+    legacy = sqlite3.connect(db)
+    for name, df in (("invoices", inv.head(30)), ("bank_tx", bank.head(30))):
+        df.to_sql(name, legacy, index=False)
+    # A deleted row leaves a gap the migration must keep.
+    legacy.execute("DELETE FROM invoices WHERE rowid = 5")
+    legacy.commit()
+    expected = pd.read_sql_query("SELECT rowid AS row_id, * FROM invoices", legacy)
+    legacy.close()
+
+    con = data_layer.get_connection()
+    migrated = pd.read_sql_query("SELECT * FROM invoices ORDER BY row_id", con)
+    pd.testing.assert_frame_equal(migrated, expected)
+    assert 5 not in migrated["row_id"].tolist()
+    assert len(pd.read_sql_query("SELECT * FROM bank_tx", con)) == 30
+    loaded_inv, _ = data_layer.load_data()
+    assert loaded_inv.index.tolist() == expected["row_id"].tolist()
+
+
+def test_overlapping_imports_keep_their_own_staging_tables(import_csv, frames, monkeypatch):
+    inv, bank = frames
+    prepare, chunks = data_layer._prepare_import, []
+
+    def prepare_and_interleave(dataset, df):
+        chunks.append(dataset)
+        if len(chunks) == 2:
+            # A second upload lands while the first is still staging chunks.
+            import_csv("invoices", inv.tail(7))
+            import_csv("bank_tx", bank.head(5))
+        return prepare(dataset, df)
+
+    monkeypatch.setattr(data_layer, "_prepare_import", prepare_and_interleave)
+    data_layer.import_csv_stream(
+        "invoices", io.BytesIO(inv.head(40).to_csv(index=False).encode()), chunk_rows=10
+    )
+
+    loaded_inv, loaded_bank = data_layer.load_data()
+    assert loaded_inv["invoice_no"].tolist() == inv.head(40)["invoice_no"].tolist()
+    assert len(loaded_bank) == 5
+    con = data_layer.get_connection()
+    assert not [t for t in data_layer._table_names(con) if t.startswith("_staging")]
+
+
+def test_reading_datasets_does_not_create_the_database(client, db):
+    for fmt in ("json", "ndjson", "arrow"):
+        response = client.get("/datasets/invoices", params={"format": fmt})
+        assert response.status_code == 200
+    assert client.get("/datasets/bank_tx").json() == {
+        "dataset": "bank_tx",
+        "rows": [],
+        "next_cursor": None,
+    }
+    assert not db.exists()
+
+
+def _kpis_agree_with_rows() -> dict:
+    """KPIs off the aggregates, checked against the same KPIs computed from the rows."""
+    kpis = core.get_kpis()
+    assert kpis == pytest.approx(core.get_kpis(date_from=date(1900, 1, 1)))
+    assert kpis["invoices_count"] == len(data_layer.load_data()[0])
+    return kpis
+
+
+def test_a_failed_append_leaves_rows_aggregates_and_kpis_in_step(import_csv, frames, monkeypatch):
+    inv, bank = frames
+    import_csv("invoices", inv.head(40))
+    import_csv("bank_tx", bank.head(40))
+    kpis = _kpis_agree_with_rows()
+    aggs = data_layer.load_monthly_aggregates().table
+    con = data_layer.get_connection()
+    token = data_layer._generation(con, "invoices")
+
+    add = data_layer._add_aggregates
+
+    def fail_after_insert(con, name, *args, **kwargs):
+        if name == "invoices":
+            raise sqlite3.OperationalError("database or disk is full")
+        return add(con, name, *args, **kwargs)
+
+    monkeypatch.setattr(data_layer, "_add_aggregates", fail_after_insert)
+    with pytest.raises(sqlite3.OperationalError):
+        data_layer.append_invoices(inv.iloc[40:60])
+
+    assert _kpis_agree_with_rows() == kpis
+    pd.testing.assert_frame_equal(data_layer.load_monthly_aggregates().table, aggs)
+    assert data_layer._generation(con, "invoices") == token
+
+    monkeypatch.setattr(data_layer, "_add_aggregates", add)
+    assert data_layer.append_invoices(inv.iloc[40:60]) == 20
+    assert _kpis_agree_with_rows()["invoices_count"] == 60
+
+
+def test_a_failed_first_append_creates_no_table(db, frames, monkeypatch):
+    inv, _ = frames
+    con = data_layer.get_connection()
+
+    def fail(con, datasets=data_layer.DATASETS):
+        raise sqlite3.OperationalError("database or disk is full")
+
+    monkeypatch.setattr(data_layer, "_refresh_aggregates", fail)
+    with pytest.raises(sqlite3.OperationalError):
+        data_layer.append_invoices(inv.head(10))
+    assert "invoices" not in data_layer._table_names(con)
+
+
+def test_concurrent_ocr_appends_keep_their_own_documents(import_csv, frames, monkeypatch):
+    inv, _ = frames
+    import_csv("invoices", inv.head(10))
+    split = data_layer._split_documents
+
+    def slow_split(df, first_id):
+        # Widen the gap between reading the last row id and inserting after it.
+        time.sleep(0.2)
+        return split(df, first_id)
+
+    monkeypatch.setattr(data_layer, "_split_documents", slow_split)
+
+    def append(batch: int):
+        rows = inv.iloc[10 + 5 * batch : 15 + 5 * batch].copy()
+        rows["invoice_no"] = [f"OCR-{batch}-{i}" for i in range(5)]
+        rows[data_layer.DOCUMENT_COLUMN] = [json.dumps({"invoice_no": n}) for n in rows["invoice_no"]]
+        data_layer.append_invoices(rows)
+
+    threads = [threading.Thread(target=append, args=(batch,)) for batch in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stored, _ = data_layer.load_data()
+    scanned = stored[stored["invoice_no"].str.startswith("OCR-", na=False)]
+    assert len(scanned) == 15
+    for row_id, invoice_no in scanned["invoice_no"].items():
+        assert data_layer.get_invoice_document(row_id) == {"invoice_no": invoice_no}
+
+
+def test_snapshots_follow_appends_only_once_they_commit(
+    import_csv, frames, settings, tmp_path, monkeypatch
+):
+    settings(storage_backend="parquet", columnar_path=tmp_path / "columnar")
+    inv, _ = frames
+    import_csv("invoices", inv.head(40))
+    data_layer.load_data()
+    con = data_layer.get_connection()
+    store = data_layer._columnar_store()
+    token = data_layer._generation(con, "invoices")
+    assert store.current("invoices").token == token
+
+    add = data_layer._add_aggregates
+
+    def fail_after_insert(con, name, *args, **kwargs):
+        raise sqlite3.OperationalError("database or disk is full")
+
+    monkeypatch.setattr(data_layer, "_add_aggregates", fail_after_insert)
+    with pytest.raises(sqlite3.OperationalError):
+        data_layer.append_invoices(inv.iloc[40:60])
+    data_layer.bump_data_version()
+    # The rows rolled back with the token: the snapshot still matches the table.
+    assert data_layer._generation(con, "invoices") == token
+    assert store.current("invoices").token == token
+    assert len(data_layer.load_data()[0]) == 40
+
+    monkeypatch.setattr(data_layer, "_add_aggregates", add)
+    data_layer.append_invoices(inv.iloc[40:60])
+    snapshot = store.current("invoices")
+    assert snapshot.token == data_layer._generation(con, "invoices") != token
+    assert sum(p["rows"] for p in snapshot.partitions.values()) == 60
+    assert data_layer.load_data()[0]["invoice_no"].tolist() == inv.head(60)["invoice_no"].tolist()
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import pandas as pd
+import pytest
+
+from backend.services import data_layer, jobs
+
+
+def _append_bank(df: pd.DataFrame):
+    rows = data_layer._prepare_import("bank_tx", df.copy())
+    with data_layer.get_connection() as con:
+        rows.to_sql("bank_tx", con, if_exists="append", index=False)
+    data_layer.bump_data_version()
+
+
+@pytest.fixture
+def run(recon_params):
+    """``run(**overrides)``: one reconciliation over ``db``, as the API runs it."""
+    return lambda **overrides: jobs.run_reconcile({**recon_params, **overrides})
+
+
+def _pairs(response: dict) -> set:
+    """(rule, invoice row ids, bank row id) of every match in a run."""
+    out = set()
+    for m in response["summary"]["recent"]:
+        inv_ids = m.get("inv_ids") or str(m["inv_id"])
+        out.add((m["rule"], inv_ids, int(m["bank_id"])))
+    return out
+
+
+def _touching(pairs: set, since: dict) -> set:
+    return {
+        p for p in pairs
+        if p[2] > since["bank_tx"] or any(int(i) > since["invoices"] for i in p[1].split(","))
+    }
+
+
+@pytest.mark.parametrize(
+    "invoice_date, old_bank, new_bank",
+    [
+        # A new row next to an old, ambiguous pair.
+        ("2024-01-13", [("2024-01-10", 100.0), ("2024-01-15", 100.0)], ("2024-01-16", 55.0)),
+        # The new row is another candidate of the old, ambiguous invoice; the
+        # old candidates lie more than a window before it.
+        ("2024-01-13", [("2024-01-10", 100.0), ("2024-01-10", 100.0)], ("2024-01-16", 100.0)),
+        # An old invoice at the edge of the loaded context, with only one of
+        # its two candidates loaded.
+        ("2024-01-10", [("2024-01-07", 100.0), ("2024-01-12", 100.0)], ("2024-01-16", 55.0)),
+    ],
+)
+def test_incremental_sees_every_candidate_of_an_old_invoice(
+    import_csv, run, invoice_date, old_bank, new_bank
+):
+    import_csv("invoices", pd.DataFrame(
+        {"date": [invoice_date], "entity": ["A"], "amount": [100.0], "type": ["revenue"]}
+    ))
+    import_csv("bank_tx", _bank_frame(old_bank))
+    # R3 off: a batch of one would settle the invoice and hide the R1 case.
+    first = run(incremental=True, persist=True, max_batch_size=0)
+    assert first["summary"]["total_rule1"] == 0
+
+    _append_bank(_bank_frame([new_bank]))
+    incremental = run(incremental=True, max_batch_size=0)
+    full = run(max_batch_size=0)
+    assert incremental["incremental"]["new_rows"] == {"invoices": 0, "bank_tx": 1}
+    assert _pairs(incremental) == _pairs(full) == set()
+
+
+def _bank_frame(lines) -> pd.DataFrame:
+    dates, amounts = zip(*lines)
+    return pd.DataFrame(
+        {"date": dates, "entity": "A", "amount": amounts, "direction": "in"}
+    )
+
+
+def test_incremental_matches_new_rows_like_a_full_run(import_csv, run, frames):
+    inv, bank = frames
+    # Every fifth row arrives later, spread over the whole year.
+    new_inv, new_bank = inv.index % 5 == 0, bank.index % 5 == 0
+    import_csv("invoices", inv[~new_inv])
+    import_csv("bank_tx", bank[~new_bank])
+    run(incremental=True, persist=True)
+    since = data_layer.get_watermarks()
+
+    data_layer.append_invoices(inv[new_inv])
+    _append_bank(bank[new_bank])
+    incremental = _pairs(run(incremental=True))
+    full = _pairs(run())
+
+    assert incremental
+    assert incremental == _touching(incremental, since)
+    assert incremental == _touching(full, since)
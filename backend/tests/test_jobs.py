@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import time
+
+import pandas as pd
+import pytest
+
+from backend.services import data_layer, jobs
+
+@pytest.fixture
+def loaded(import_csv, frames):
+    inv, bank = frames
+    import_csv("invoices", inv)
+    import_csv("bank_tx", bank)
+
+
+@pytest.fixture
+def runner():
+    runner = jobs.JobRunner(max_running=2)
+    yield runner
+    runner.shutdown()
+
+
+def _wait(job: jobs.Job, timeout: float = 60.0) -> jobs.Job:
+    deadline = time.monotonic() + timeout
+    while job.status not in jobs.FINISHED:
+        assert time.monotonic() < deadline, f"job still {job.status} after {timeout}s"
+        time.sleep(0.05)
+    return job
+
+
+def test_a_spawned_job_reports_the_inline_result(loaded, runner, recon_params):
+    inline = jobs.run_reconcile(recon_params)["summary"]
+    job = _wait(runner.submit({**recon_params, "persist": True}))
+
+    assert job.status == "succeeded", job.error
+    job.process.join(5)
+    assert job.process.exitcode == 0
+    assert all(rule["status"] == "done" for rule in job.rules.values())
+    summary = job.result["summary"]
+    for key in ("total_rule1", "total_rule2", "total_rule3"):
+        assert summary[key] == inline[key]
+    # The worker persisted through its own connection; this process sees it.
+    inv, _ = data_layer.load_data()
+    matched = sum(len(m["inv_ids"].split(",")) if "inv_ids" in m else 1 for m in summary["recent"])
+    assert inv["match_id"].notna().sum() == matched > 0
+
+
+def test_cancel_stops_the_worker_and_frees_the_persist_slot(loaded, runner, recon_params):
+    job = runner.submit({**recon_params, "persist": True})
+    with pytest.raises(jobs.JobConflict):
+        runner.submit({**recon_params, "persist": True})
+
+    runner.cancel(job.id)
+    assert job.status == "cancelled"
+    assert not job.process.is_alive()
+    inv, _ = data_layer.load_data()
+    assert inv["match_id"].isna().all()
+    with runner.persist_slot():
+        pass
+
+
+def test_a_second_persisting_run_gets_409(loaded, client, recon_params):
+    from backend import api
+
+    accepted = client.post("/reconcile", json={**recon_params, "persist": True})
+    assert accepted.status_code == 202
+    job_id = accepted.json()["id"]
+    try:
+        for background in (True, False):
+            response = client.post(
+                "/reconcile", json={**recon_params, "persist": True, "background": background}
+            )
+            assert response.status_code == 409
+        # Runs that do not persist are not held up.
+        response = client.post("/reconcile", json={**recon_params, "background": False})
+        assert response.status_code == 200
+    finally:
+        client.post(f"/jobs/{job_id}/cancel")
+    assert api.job_runner.get(job_id).status in jobs.FINISHED
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import itertools
+
+import numpy as np
+import pytest
+
+from backend.services import matching
+
+
+def brute_force(left, right, cost) -> tuple[int, float]:
+    """(pairs, cost) of the best one-to-one matching: most pairs, then cheapest."""
+    by_left: dict[int, list[tuple[int, float]]] = {}
+    for l, r, c in zip(left.tolist(), right.tolist(), cost.tolist()):
+        by_left.setdefault(l, []).append((r, c))
+    nodes = sorted(by_left)
+
+    def best(k: int, used: frozenset) -> tuple[int, float]:
+        if k == len(nodes):
+            return 0, 0.0
+        count, total = best(k + 1, used)
+        options = [(count, total)]
+        for r, c in by_left[nodes[k]]:
+            if r not in used:
+                n, t = best(k + 1, used | {r})
+                options.append((n + 1, t + c))
+        return max(options, key=lambda o: (o[0], -o[1]))
+
+    return best(0, frozenset())
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_min_cost_assignment_is_optimal_on_small_graphs(seed):
+    rng = np.random.default_rng(seed)
+    n_left, n_right = rng.integers(1, 7, 2)
+    edges = {(l, r) for l, r in zip(rng.integers(0, n_left, 12), rng.integers(0, n_right, 12))}
+    left, right = (np.array(side, dtype=np.int64) for side in zip(*sorted(edges)))
+    cost = rng.integers(0, 500, len(left)).astype(float)
+
+    sel_l, sel_r = matching.min_cost_assignment(left, right, cost)
+
+    assert len(set(sel_l.tolist())) == len(sel_l) and len(set(sel_r.tolist())) == len(sel_r)
+    chosen = {(l, r) for l, r in zip(sel_l.tolist(), sel_r.tolist())}
+    assert chosen <= edges
+    pair_cost = dict(zip(zip(left.tolist(), right.tolist()), cost.tolist()))
+    assert (len(chosen), sum(pair_cost[p] for p in chosen)) == pytest.approx(
+        brute_force(left, right, cost)
+    )
+
+
+def subset_exists(amounts, lo: int, hi: int, max_size: int) -> bool:
+    """Whether some 1..``max_size`` of ``amounts`` sum into ``[lo, hi]``, by enumeration."""
+    return any(
+        lo <= sum(combo) <= hi
+        for size in range(1, min(max_size, len(amounts)) + 1)
+        for combo in itertools.combinations(amounts.tolist(), size)
+    )
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_batch_subset_finds_a_batch_whenever_one_exists(seed):
+    rng = np.random.default_rng(seed)
+    amounts = rng.integers(1, 200, rng.integers(1, 9))
+    lo = int(rng.integers(1, amounts.sum() + 50))
+    hi = lo + int(rng.integers(0, 10))
+    max_size = int(rng.integers(1, 6))
+
+    picked = matching.batch_subset(amounts, lo, hi, max_size, budget=10**6)
+
+    assert (picked is not None) == subset_exists(amounts, lo, hi, max_size)
+    if picked is not None:
+        assert len(set(picked.tolist())) == len(picked) <= max_size
+        assert lo <= amounts[picked].sum() <= hi
+        assert picked.tolist() == sorted(picked.tolist())
+
+
+def test_batch_subset_gives_up_at_the_budget():
+    # Only the five smallest reach the band; the search passes 50 larger ones first.
+    amounts = np.array([1_000] * 50 + [1, 2, 3, 4, 5])
+    assert matching.batch_subset(amounts, 15, 15, 5, budget=40) is None
+    picked = matching.batch_subset(amounts, 15, 15, 5, budget=10**6)
+    assert amounts[picked].tolist() == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_batch_window_returns_the_earliest_run_in_the_band(seed):
+    rng = np.random.default_rng(seed)
+    amounts = rng.integers(1, 100, rng.integers(1, 12))
+    lo = int(rng.integers(1, 300))
+    hi = lo + int(rng.integers(0, 30))
+    max_size = int(rng.integers(1, 6))
+    runs = [
+        (start, stop)
+        for start in range(len(amounts))
+        for stop in range(start + 1, min(start + max_size, len(amounts)) + 1)
+        if lo <= amounts[start:stop].sum() <= hi
+    ]
+    assert matching.batch_window(amounts, lo, hi, max_size) == (min(runs) if runs else None)
+
+
+def test_batch_targets_accept_tolerance_or_a_bounded_fee():
+    lo, hi = matching.batch_targets(np.array([9_700, 100_000]), 50, 500, 0.03)
+    # 9,700 net: 3% of a 10,000 gross; 100,000 net: the 500 absolute cap.
+    assert lo.tolist() == [9_650, 99_950]
+    assert hi.tolist() == [10_000, 100_500]
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_batch_matches_uses_each_invoice_once_within_size_window_and_band(seed):
+    rng = np.random.default_rng(seed)
+    day = 86_400 * 10**9
+    inv_cents = rng.integers(100, 5_000, 40)
+    inv_ns = rng.integers(0, 20, 40) * day
+    # Payouts built from random invoice groups, net of a small fee, plus noise.
+    bank_cents = np.array(
+        [
+            inv_cents[rng.choice(40, rng.integers(2, 6), replace=False)].sum() - rng.integers(0, 80)
+            for _ in range(12)
+        ]
+    )
+    bank_ns = rng.integers(0, 20, 12) * day
+    window, tol, fee_abs, pct, max_size = 3 * day, 50, 100, 0.04, 4
+
+    batches = matching.batch_matches(
+        inv_cents, inv_ns, bank_cents, bank_ns, window, tol, fee_abs, pct, max_size, 2_000
+    )
+
+    used = np.concatenate([inv for _, inv in batches]) if batches else np.empty(0, int)
+    assert len(set(used.tolist())) == len(used)
+    assert len({b for b, _ in batches}) == len(batches)
+    lo, hi = matching.batch_targets(bank_cents, tol, fee_abs, pct)
+    for b, inv in batches:
+        assert 1 <= len(inv) <= max_size
+        assert lo[b] <= inv_cents[inv].sum() <= hi[b]
+        assert np.all(np.abs(inv_ns[inv] - bank_ns[b]) <= window)
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+from google.cloud import documentai as docai
+
+from backend.services import ocr
+from backend.services.ocr_cache import OcrCache
+
+
+class FakeDocumentAI:
+    """Local stand-in for ``DocumentProcessorServiceClient``.
+
+    Every call sleeps ``latency`` seconds, then raises the next exception
+    queued for the file's content in ``errors`` or returns an invoice whose
+    number is the content.
+    """
+
+    def __init__(self, latency: float = 0.0, errors: dict[bytes, list[Exception]] | None = None):
+        self.latency = latency
+        self.errors = {content: list(excs) for content, excs in (errors or {}).items()}
+        self.calls: list[tuple[bytes, float]] = []
+        self.in_flight = self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def process_document(self, request):
+        content = request["raw_document"].content
+        with self._lock:
+            self.calls.append((content, time.monotonic()))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            with self._lock:
+                queued = self.errors.get(content)
+                error = queued.pop(0) if queued else None
+            if error is not None:
+                raise error
+            return SimpleNamespace(document=_invoice(content.decode()))
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def attempts(self, content: bytes) -> int:
+        return sum(1 for c, _ in self.calls if c == content)
+
+
+def _invoice(number: str) -> docai.Document:
+    entities = [("invoice_id", number), ("total_amount", "121.00"), ("invoice_date", "2024-03-01")]
+    return docai.Document(
+        entities=[docai.Document.Entity(type_=t, mention_text=v) for t, v in entities]
+    )
+
+
+@pytest.fixture
+def ocr_settings(db, settings):
+    return settings(ocr_backoff_base=0.001, ocr_backoff_max=0.01, ocr_max_retries=2)
+
+
+def _scan(files, client, **kwargs):
+    kwargs.setdefault("limiter", ocr.TokenBucket(1000, 1000))
+    return ocr.scan_files(files, client=client, cache=False, **kwargs)
+
+
+def test_token_bucket_holds_the_rate_after_a_burst():
+    bucket = ocr.TokenBucket(rate=50, capacity=3)
+    started = time.monotonic()
+    for _ in range(3):
+        bucket.acquire()
+    assert time.monotonic() - started < 0.02
+    for _ in range(10):
+        bucket.acquire()
+    assert time.monotonic() - started >= 10 / 50 * 0.95
+
+
+def test_every_attempt_takes_a_token(ocr_settings):
+    unavailable = api_exceptions.ServiceUnavailable("busy")
+    client = FakeDocumentAI(errors={b"INV-0": [unavailable, unavailable]})
+    files = [(f"{i}.pdf", f"INV-{i}".encode()) for i in range(6)]
+    _scan(files, client, workers=4, limiter=ocr.TokenBucket(rate=40, capacity=1))
+
+    times = sorted(t for _, t in client.calls)
+    assert len(times) == 8
+    # One token up front, then one per 1/40 s however many workers wait.
+    assert times[-1] - times[0] >= 7 / 40 * 0.9
+
+
+def test_transient_errors_are_retried_with_backoff(ocr_settings):
+    client = FakeDocumentAI(
+        errors={
+            b"INV-1": [api_exceptions.ServiceUnavailable("busy"), api_exceptions.DeadlineExceeded("slow")],
+            b"INV-2": [api_exceptions.TooManyRequests("quota")] * 3,
+            b"INV-3": [api_exceptions.InvalidArgument("not a PDF")],
+        }
+    )
+    files = [(f"{i}.pdf", f"INV-{i}".encode()) for i in range(1, 4)]
+    recovered, exhausted, permanent = _scan(files, client)
+
+    assert recovered.error is None and recovered.attempts == 3
+    assert recovered.rows[0]["invoice_no"] == "INV-1"
+    # ocr_max_retries=2: the first attempt plus two retries.
+    assert exhausted.attempts == client.attempts(b"INV-2") == 3
+    assert exhausted.error.startswith("TooManyRequests") and not exhausted.rows
+    assert permanent.attempts == client.attempts(b"INV-3") == 1
+    assert permanent.error.startswith("InvalidArgument")
+
+
+def test_one_failing_file_does_not_fail_the_batch(ocr_settings):
+    client = FakeDocumentAI(
+        latency=0.05, errors={b"INV-3": [api_exceptions.InvalidArgument("corrupt")]}
+    )
+    files = [(f"{i}.pdf", f"INV-{i}".encode()) for i in range(8)]
+    started = time.monotonic()
+    results = _scan(files, client, workers=4)
+
+    assert [r.filename for r in results] == [name for name, _ in files]
+    assert [r.error is not None for r in results] == [i == 3 for i in range(8)]
+    assert [r.rows[0]["invoice_no"] for r in results if r.rows] == [
+        f"INV-{i}" for i in range(8) if i != 3
+    ]
+    assert client.max_in_flight == 4
+    assert time.monotonic() - started < 8 * 0.05
+
+
+def test_a_misconfigured_processor_fails_files_not_the_scan(db, settings, tmp_path):
+    settings(docai_processor_id=None)
+    client = FakeDocumentAI()
+    results = ocr.scan_files(
+        [("a.pdf", b"INV-1"), ("b.pdf", b"INV-2")],
+        client=client,
+        cache=OcrCache(tmp_path / "ocr_cache.db", 1 << 20),
+    )
+    assert all(r.error.startswith("RuntimeError") for r in results)
+    assert not client.calls
+
+
+@pytest.fixture
+def scanner(client, tmp_path, monkeypatch):
+    """``/ocr/scan`` against a fake Document AI and a cache of its own."""
+    fake = FakeDocumentAI()
+    cache = OcrCache(tmp_path / "ocr_cache.db", 1 << 20)
+    monkeypatch.setattr(ocr, "get_docai_client", lambda: fake)
+    monkeypatch.setattr(ocr, "get_ocr_cache", lambda: cache)
+
+    def scan(*files: tuple[str, bytes]) -> dict:
+        response = client.post(
+            "/ocr/scan",
+            params={"skip_duplicates": True},
+            files=[("files", (name, content, "application/pdf")) for name, content in files],
+        )
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    return scan
+
+
+def test_duplicates_are_decided_by_the_invoices_table(client, scanner):
+    first = scanner(("a.pdf", b"INV-1"))
+    assert first["rows_appended"] == 1
+    assert first["files"][0]["duplicate"] is False
+
+    again = scanner(("a-copy.pdf", b"INV-1"), ("b.pdf", b"INV-2"))
+    assert again["rows_appended"] == 1
+    assert [(f["cached"], f["duplicate"]) for f in again["files"]] == [(True, True), (False, False)]
+
+    # The OCR cache outlives a reset; the invoices do not.
+    client.post("/data/reset")
+    after_reset = scanner(("a.pdf", b"INV-1"))
+    assert after_reset["rows_appended"] == 1
+    assert after_reset["files"][0] == {**after_reset["files"][0], "cached": True, "duplicate": False}
+
+
+def test_a_rescanned_invoice_number_is_a_duplicate(db, scanner):
+    scanner(("scan.pdf", b"INV-7"))
+    # Another scan of the same invoice: other bytes, same supplier and number.
+    other_bytes = ocr.scan_files(
+        [("photo.jpg", b"INV-7")], client=FakeDocumentAI(), cache=False
+    )
+    assert other_bytes[0].duplicate
+    assert not ocr.scan_files([("new.pdf", b"INV-8")], client=FakeDocumentAI(), cache=False)[0].duplicate
+
+
+def test_cache_hits_build_no_client(db, settings, tmp_path, monkeypatch):
+    cache = OcrCache(tmp_path / "ocr_cache.db", 1 << 20)
+    ocr.scan_files([("a.pdf", b"INV-1")], client=FakeDocumentAI(), cache=cache)
+
+    def no_client():
+        raise AssertionError("Document AI client built for a cached file")
+
+    monkeypatch.setattr(ocr, "get_docai_client", no_client)
+    (result,) = ocr.scan_files([("a.pdf", b"INV-1")], cache=cache)
+    assert result.cached and result.error is None
+
+
+def test_a_failed_cache_write_only_loses_the_cache_entry(db, settings, tmp_path, caplog):
+    class FullCache(OcrCache):
+        def put(self, *args, **kwargs):
+            raise sqlite3.OperationalError("database or disk is full")
+
+    client = FakeDocumentAI()
+    results = ocr.scan_files(
+        [("a.pdf", b"INV-1"), ("b.pdf", b"INV-2")],
+        client=client,
+        cache=FullCache(tmp_path / "ocr_cache.db", 1 << 20),
+    )
+    assert [r.error for r in results] == [None, None]
+    assert [r.rows[0]["invoice_no"] for r in results] == ["INV-1", "INV-2"]
+    assert "Could not cache the OCR result of a.pdf" in caplog.text
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+from dataclasses import replace
+
+import pandas as pd
+
+from backend.services import parallel, reconciliation
+from backend.services.reconciliation import ReconSettings
+
+
+def _cents(value) -> int:
+    return int(round(float(value) * 100))
+
+
+def _open_rows(inv: pd.DataFrame, bank: pd.DataFrame):
+    inv_u = inv[(inv["type"] == "revenue") & inv.get("match_id", pd.Series(index=inv.index)).isna()]
+    bank_u = bank[(bank["direction"] == "in") & bank.get("match_id", pd.Series(index=bank.index)).isna()]
+    return inv_u, bank_u
+
+
+def reference_rule1(inv: pd.DataFrame, bank: pd.DataFrame, settings: ReconSettings) -> dict:
+    """R1 as the original row-by-row loop had it, compared in cents."""
+    inv_u, bank_u = _open_rows(inv, bank)
+    tol = _cents(settings.amount_tolerance)
+    window = pd.Timedelta(days=settings.date_window_days)
+    bank_rows = list(bank_u[["entity", "amount", "date"]].itertuples())
+    out = {}
+    for i in inv_u.itertuples():
+        cands = [
+            b.Index
+            for b in bank_rows
+            if b.entity == i.entity
+            and abs(_cents(b.amount) - _cents(i.amount)) <= tol
+            and abs(b.date - i.date) <= window
+        ]
+        if len(cands) == 1:
+            out[i.Index] = cands[0]
+    return out
+
+
+PSP_PATTERN = r"stripe|adyen|mollie|paypal|checkout\.com|braintree"
+
+
+def reference_rule2(inv: pd.DataFrame, bank: pd.DataFrame, settings: ReconSettings) -> dict:
+    """R2 as the original loop had it, plus each payout going to one invoice."""
+    inv_u, bank_u = _open_rows(inv, bank)
+    if settings.only_psp_names:
+        bank_u = bank_u[bank_u["partner"].fillna("").str.contains(PSP_PATTERN, case=False)]
+    window = pd.Timedelta(days=settings.date_window_days)
+    fee_abs = _cents(settings.psp_fee_abs)
+    bank_rows = list(bank_u[["entity", "amount", "date"]].itertuples())
+    taken, out = set(), {}
+    for i in inv_u.itertuples():
+        gross = _cents(i.amount)
+        for b in bank_rows:
+            fee = gross - _cents(b.amount)
+            if (
+                b.Index not in taken
+                and b.entity == i.entity
+                and abs(b.date - i.date) <= window
+                and 0 < fee <= fee_abs
+                and fee / gross <= settings.psp_fee_pct
+            ):
+                taken.add(b.Index)
+                out[i.Index] = b.Index
+                break
+    return out
+
+
+def _pairs(result, rule: str) -> dict:
+    return {
+        m["inv_id"]: m["bank_id"] for m in result.summary.recent if m["rule"] == rule
+    }
+
+
+def test_rule1_matches_reference(frames):
+    inv, bank = frames
+    for settings in (ReconSettings(), ReconSettings(date_window_days=1, amount_tolerance=0.0)):
+        result = reconciliation.run_reconciliation(inv, bank, settings)
+        assert _pairs(result, "R1 exact") == reference_rule1(inv, bank, settings)
+
+
+def test_rule1_skips_ambiguous_invoices():
+    inv = pd.DataFrame(
+        {
+            "date": pd.to_datetime(["2024-01-10", "2024-01-10"]),
+            "entity": ["A", "A"],
+            "amount": [100.0, 200.0],
+            "type": ["revenue", "revenue"],
+        }
+    )
+    bank = pd.DataFrame(
+        {
+            "date": pd.to_datetime(["2024-01-09", "2024-01-11", "2024-01-11"]),
+            "entity": ["A", "A", "A"],
+            "amount": [100.0, 100.3, 200.0],
+            "direction": ["in", "in", "in"],
+        }
+    )
+    result = reconciliation.run_reconciliation(inv, bank, ReconSettings(only_psp_names=False))
+    assert _pairs(result, "R1 exact") == {1: 2}
+
+
+def test_rule2_matches_reference(frames):
+    inv, bank = frames
+    for settings in (ReconSettings(), ReconSettings(psp_fee_abs=5.0, psp_fee_pct=0.02)):
+        result = reconciliation.run_reconciliation(inv, bank, settings)
+        rule1 = _pairs(result, "R1 exact")
+        assert _pairs(result, "R2 fee") == reference_rule2(
+            _matched(inv, rule1.keys()), _matched(bank, rule1.values()), settings
+        )
+
+
+def _matched(frame: pd.DataFrame, labels) -> pd.DataFrame:
+    """``frame`` with the rows at ``labels`` marked as matched."""
+    return frame.assign(match_id=pd.Series("R1", index=frame.index).where(frame.index.isin(list(labels))))
+
+
+def _all_matches(result) -> set:
+    return {(m["rule"], m.get("inv_ids") or m["inv_id"], m["bank_id"]) for m in result.summary.recent}
+
+
+def test_parallel_run_matches_serial(frames):
+    inv, bank = frames
+    try:
+        for settings in (ReconSettings(), ReconSettings(assignment="optimal", date_window_days=5)):
+            serial = reconciliation.run_reconciliation(inv, bank, settings)
+            parallel_run = reconciliation.run_reconciliation(inv, bank, replace(settings, workers=2))
+            assert _all_matches(parallel_run) == _all_matches(serial)
+            for key in ("total_rule1", "total_rule2", "total_rule3"):
+                assert getattr(parallel_run.summary, key) == getattr(serial.summary, key)
+            pd.testing.assert_frame_equal(parallel_run.invoices, serial.invoices)
+            pd.testing.assert_frame_equal(parallel_run.bank, serial.bank)
+    finally:
+        parallel.shutdown_pool()
+
+
+def _frames(invoices, bank_lines, partner="Stripe payout"):
+    inv = pd.DataFrame(
+        {
+            "date": pd.to_datetime([d for d, _ in invoices]),
+            "entity": "A",
+            "amount": [a for _, a in invoices],
+            "type": "revenue",
+        }
+    )
+    bank = pd.DataFrame(
+        {
+            "date": pd.to_datetime([d for d, _ in bank_lines]),
+            "entity": "A",
+            "amount": [a for _, a in bank_lines],
+            "direction": "in",
+            "partner": partner,
+        }
+    )
+    return inv, bank
+
+
+def _greedy_and_optimal(inv, bank):
+    settings = ReconSettings(max_batch_size=0)
+    greedy = reconciliation.run_reconciliation(inv, bank, settings)
+    optimal = reconciliation.run_reconciliation(inv, bank, replace(settings, assignment="optimal"))
+    return greedy, optimal
+
+
+def _compared(inv, bank, rule: str):
+    """Greedy and optimal pairs of ``rule`` on a case where the rules before it match nothing."""
+    greedy, optimal = _greedy_and_optimal(inv, bank)
+    stats = optimal.summary.rules[rule]
+    assert stats["greedy_matches"] == len(_pairs(greedy, rule))
+    assert stats["extra_matches"] == len(_pairs(optimal, rule)) - len(_pairs(greedy, rule))
+    return _pairs(greedy, rule), _pairs(optimal, rule)
+
+
+def test_optimal_r1_settles_invoices_greedy_leaves_ambiguous():
+    # Two equal invoices, two equal transfers: each invoice has two candidates.
+    inv, bank = _frames(
+        [("2024-01-10", 100.0), ("2024-01-12", 100.0)],
+        [("2024-01-12", 100.0), ("2024-01-10", 100.0)],
+        partner="Customer",
+    )
+    greedy, optimal = _compared(inv, bank, "R1 exact")
+    assert greedy == {}
+    # Nearest dates pair up.
+    assert optimal == {0: 1, 1: 0}
+
+
+def test_optimal_r2_does_not_let_the_first_invoice_take_the_only_payout_of_another():
+    inv, bank = _frames(
+        [("2024-01-10", 100.0), ("2024-01-08", 100.0)],
+        # The second payout is out of the second invoice's window.
+        [("2024-01-11", 98.0), ("2024-01-12", 98.0)],
+    )
+    greedy, optimal = _compared(inv, bank, "R2 fee")
+    assert greedy == {0: 0}
+    assert optimal == {0: 1, 1: 0}
+
+
+def test_optimal_matches_at_least_what_greedy_settles_one_to_one(frames):
+    inv, bank = frames
+    greedy, optimal = _greedy_and_optimal(inv, bank)
+    for rule in ("R1 exact", "R2 fee"):
+        pairs = _pairs(optimal, rule)
+        assert len(set(pairs.values())) == len(pairs)
+    # Greedy R1 may give one bank line to several invoices; the lines it
+    # uses, once each, are a one-to-one matching on the same candidates.
+    assert len(_pairs(optimal, "R1 exact")) >= len(set(_pairs(greedy, "R1 exact").values()))
+    # R2 sees what R1 left, so its greedy count comes from the same run.
+    assert optimal.summary.rules["R2 fee"]["extra_matches"] >= 0
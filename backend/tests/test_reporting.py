@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+
+from backend.services import data_layer, jobs, reconciliation, reporting
+from backend.services.reconciliation import ReconSettings
+
+
+def test_overview_from_aggregates_matches_frames(client, import_csv, recon_params, frames):
+    inv, bank = frames
+    import_csv("invoices", inv)
+    import_csv("bank_tx", bank)
+    jobs.run_reconcile({**recon_params, "persist": True})
+
+    inv_df, bank_df = data_layer.load_data()
+    aggs = data_layer.load_monthly_aggregates()
+    for entity in ("ALL", "TUG_NL"):
+        from_frames = jsonable_encoder(reporting.build_overview(inv_df, bank_df, entity))
+        served = client.get("/reporting/overview", params={"entity": entity}).json()
+        assert served == jsonable_encoder(reporting.build_overview_from_aggregates(aggs, entity))
+        assert served == from_frames
+
+    months = {row["month"] for row in served["rev_vs_collected"]}
+    assert len(served["rev_vs_collected"]) == 2 * len(months) == 2 * 12
+    assert all(month == pd.Timestamp(month).isoformat() for month in months)
+    assert served["kpis"]["matched_amount"] > 0
+
+
+def reference_journal(inv: pd.DataFrame, bank: pd.DataFrame) -> pd.DataFrame:
+    """The journal as the original row-by-row loop built it."""
+    coa = reporting.COA
+    journal = []
+
+    def matched_bank_amount_and_fee(inv_row):
+        mid = inv_row.get("match_id")
+        if pd.isna(mid):
+            return None, 0.0
+        b = bank.loc[bank["match_id"] == mid]
+        if b.empty:
+            return None, 0.0
+        bank_amt = float(b.iloc[0]["amount"])
+        is_fee_context = "fee" in str(b.iloc[0]["status"]).lower() or "fee" in str(
+            inv_row.get("status", "")
+        ).lower()
+        fee = max(0.0, float(inv_row["amount"]) - bank_amt) if is_fee_context else 0.0
+        return bank_amt, fee
+
+    def line(r, account, debit, credit, ref):
+        return dict(
+            date=r["date"], entity=r.get("entity", ""), account=account,
+            debit=debit, credit=credit, ref=ref,
+        )
+
+    for _, r in inv.dropna(subset=["match_id"]).iterrows():
+        bank_amt, fee = matched_bank_amount_and_fee(r)
+        if bank_amt is None:
+            journal += [
+                line(r, coa["AR"], float(r["amount"]), 0.0, "UNRESOLVED"),
+                line(r, coa["Revenue"], 0.0, float(r["amount"]), "UNRESOLVED"),
+            ]
+            continue
+        journal += [
+            line(r, coa["Cash"], float(bank_amt), 0.0, r["match_id"]),
+            line(r, coa["Revenue"], 0.0, float(r["amount"]), r["match_id"]),
+        ]
+        if fee > 0.0001:
+            journal.append(line(r, coa["PSP Fees"], float(fee), 0.0, r["match_id"]))
+
+    for _, r in inv[(inv.get("type") == "revenue") & (inv["match_id"].isna())].iterrows():
+        journal += [
+            line(r, coa["AR"], float(r["amount"]), 0.0, "UNMATCHED"),
+            line(r, coa["Revenue"], 0.0, float(r["amount"]), "UNMATCHED"),
+        ]
+    return pd.DataFrame(journal)
+
+
+def test_journal_matches_the_row_by_row_reference(frames):
+    inv, bank = frames
+    result = reconciliation.run_reconciliation(inv, bank, ReconSettings(only_psp_names=False))
+    inv_r, bank_r = result.invoices, result.bank
+    assert (bank_r["status"] == "Matched (fee)").any()
+    # Matches whose bank line is gone book as UNRESOLVED.
+    bank_r = bank_r.drop(bank_r[bank_r["match_id"].notna()].index[::7])
+
+    expected = reference_journal(inv_r, bank_r)
+    journal = reporting.build_journal(inv_r, bank_r)
+    assert set(expected["ref"]) >= {"UNRESOLVED", "UNMATCHED"}
+    assert (expected["account"] == reporting.COA["PSP Fees"]).any()
+    pd.testing.assert_frame_equal(
+        journal.drop(columns=["debit", "credit"]), expected.drop(columns=["debit", "credit"])
+    )
+    # The loop subtracted floats; the journal works in cents.
+    for column in ("debit", "credit"):
+        assert (journal[column] - expected[column]).abs().max() < 0.005
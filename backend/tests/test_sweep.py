@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import pytest
+
+from backend.services import parallel, reconciliation, sweep
+
+
+def _full_run_tally(inv, bank, settings) -> dict:
+    """What ``run_sweep`` reports for one point, computed from a full run."""
+    result = reconciliation.run_reconciliation(inv, bank, settings)
+    inv_cents = (inv["amount"] * 100).round().astype("int64")
+    bank_cents = (bank["amount"] * 100).round().astype("int64")
+    out = {}
+    for rule in reconciliation.RULES:
+        matches = [m for m in result.summary.recent if m["rule"] == rule]
+        invoices = [
+            int(i)
+            for m in matches
+            for i in (m["inv_ids"].split(",") if "inv_ids" in m else [m["inv_id"]])
+        ]
+        out[rule] = {
+            "matches": len(matches),
+            "invoices": len(invoices),
+            "invoice_amount": int(inv_cents[invoices].sum()) / 100,
+            "bank_amount": int(bank_cents[[m["bank_id"] for m in matches]].sum()) / 100,
+        }
+    return out
+
+
+@pytest.mark.parametrize(
+    "assignment, max_batch_size", [("greedy", 50), ("greedy", 0), ("optimal", 50)]
+)
+def test_every_sweep_point_matches_a_full_run(frames, assignment, max_batch_size):
+    inv, bank = frames
+    points = sweep.grid(
+        [1, 3], [0.0, 0.5], [5.0, 50.0], [0.02, 0.04],
+        assignment=assignment, max_batch_size=max_batch_size,
+    )
+    result = sweep.run_sweep(inv, bank, points)
+
+    assert len(result["points"]) == len(points) == 16
+    for point, settings in zip(result["points"], points):
+        assert point["rules"] == _full_run_tally(inv, bank, settings), point["settings"]
+
+
+def test_parallel_sweep_matches_serial(frames):
+    inv, bank = frames
+    points = sweep.grid([1, 3], [0.5], [5.0, 50.0], [0.04])
+    try:
+        parallel_run = sweep.run_sweep(inv, bank, points, workers=2)
+    finally:
+        parallel.shutdown_pool()
+    assert parallel_run["points"] == sweep.run_sweep(inv, bank, points)["points"]
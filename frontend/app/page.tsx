@@ -6,7 +6,10 @@ import KpiCard from "../components/KpiCard";
 import { useKpi } from "../hooks/useKpi";
 import {
   BOARD_PACK_URL,
+  ReconJob,
+  cancelJob,
   fetchExceptions,
+  fetchJob,
   fetchJournal,
   fetchOverview,
   loadSampleData,
@@ -129,6 +132,7 @@ export default function Home() {
   const [entity, setEntity] = useState("ALL");
   const [reconSettings, setReconSettings] = useState<ReconSettingsState>(defaultRecon);
   const [reconSummary, setReconSummary] = useState<ReconSummary | null>(null);
+  const [reconJob, setReconJob] = useState<ReconJob | null>(null);
   const [journalRows, setJournalRows] = useState<JournalRow[]>([]);
   const [journalLoading, setJournalLoading] = useState(false);
 
@@ -216,14 +220,36 @@ export default function Home() {
 
   const handleRecon = async () => {
     try {
-      const result = (await runReconciliation(reconSettings)) as {
-        summary: ReconSummary;
-      };
-      setReconSummary(result.summary);
+      let job = await runReconciliation(reconSettings);
+      setReconJob(job);
+      while (job.status === "running") {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        job = await fetchJob(job.id);
+        setReconJob(job);
+      }
+      if (job.status === "cancelled") {
+        notify("error", "Reconciliatie geannuleerd");
+        return;
+      }
+      if (job.status === "failed" || !job.result) {
+        throw new Error(job.error || "Reconciliatie faalde");
+      }
+      setReconSummary(job.result.summary as ReconSummary);
       notify("success", "Reconciliatie uitgevoerd");
       await Promise.all([refetchKpi(), loadOverview(entity), loadExceptions()]);
     } catch (err) {
       notify("error", err instanceof Error ? err.message : "Reconciliatie faalde");
+    } finally {
+      setReconJob(null);
+    }
+  };
+
+  const handleCancelRecon = async () => {
+    if (!reconJob) return;
+    try {
+      await cancelJob(reconJob.id);
+    } catch (err) {
+      notify("error", err instanceof Error ? err.message : "Annuleren faalde");
     }
   };
 
@@ -451,13 +477,34 @@ export default function Home() {
         <section className="bg-white rounded shadow p-6 space-y-4">
           <div className="flex items-center justify-between">
             <h2 className="text-xl font-semibold">Reconciliation rules</h2>
-            <button
-              className="px-4 py-2 bg-blue-600 text-white rounded"
-              onClick={handleRecon}
-            >
-              Run reconciliation
-            </button>
+            {reconJob ? (
+              <button
+                className="px-4 py-2 bg-gray-200 rounded"
+                onClick={handleCancelRecon}
+              >
+                Annuleer
+              </button>
+            ) : (
+              <button
+                className="px-4 py-2 bg-blue-600 text-white rounded"
+                onClick={handleRecon}
+              >
+                Run reconciliation
+              </button>
+            )}
           </div>
+          {reconJob && (
+            <p className="text-sm text-gray-600">
+              Bezig: {reconJob.stage}
+              {Object.entries(reconJob.rules).map(([rule, info]) => (
+                <span key={rule}>
+                  {" "}
+                  · {rule}: {info.status}
+                  {info.matches !== undefined ? ` (${info.matches})` : ""}
+                </span>
+              ))}
+            </p>
+          )}
           <div className="grid md:grid-cols-3 gap-4">
             <label className="flex flex-col text-sm">
               Date window (± days)
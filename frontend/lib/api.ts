@@ -68,7 +68,20 @@ export const runReconciliation = (payload: {
   psp_fee_pct: number;
   only_psp_names: boolean;
   persist: boolean;
-}) => apiPost("/reconcile", payload);
+}) => apiPost<ReconJob>("/reconcile", payload);
+
+export type ReconJob = {
+  id: string;
+  status: "running" | "succeeded" | "failed" | "cancelled";
+  stage: string;
+  rules: Record<string, { status: string; matches?: number }>;
+  result: { summary: unknown } | null;
+  error: string | null;
+};
+
+export const fetchJob = (id: string) => apiGet<ReconJob>(`/jobs/${id}`);
+
+export const cancelJob = (id: string) => apiPost<ReconJob>(`/jobs/${id}/cancel`);
 
 export const fetchOverview = (entity = "ALL") =>
   apiGet(`/reporting/overview?entity=${encodeURIComponent(entity)}`);